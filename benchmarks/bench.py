@@ -0,0 +1,415 @@
+# !/usr/bin/python3
+# coding: utf_8
+
+# Copyright 2017 RaceUp ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Benchmarks of values updates and replies against a fake Google Sheets service.
+
+Usage: python3 benchmarks/bench.py [--rows 5000] [--latency 0.05] [--output results.json]
+Results are printed (or written to output file) as JSON, to be compared between commits.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SCRIPT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))  # path to directory of python script running
+ROOT_DIRECTORY = os.path.dirname(SCRIPT_DIRECTORY)
+sys.path.insert(0, ROOT_DIRECTORY)
+
+import bot  # noqa: E402
+from fakes import FakeSheetsService, FakeUpdate  # noqa: E402
+from yolobmsbot.batterypack import BatteryPack, BatteryPackSnapshot  # noqa: E402
+from yolobmsbot.datasource import GSheetsDataSource  # noqa: E402
+from yolobmsbot.google import gauthenticator, gsheets  # noqa: E402
+from yolobmsbot import logs  # noqa: E402
+from yolobmsbot.history import HistoryStore  # noqa: E402
+from yolobmsbot.interactions import InteractionStore  # noqa: E402
+from yolobmsbot.outbox import MessageOutbox  # noqa: E402
+from yolobmsbot.updater import BatteryPackUpdater  # noqa: E402
+from yolobmsbot.warmstart import WarmStartStore  # noqa: E402
+
+OUTBOX_CHATS = 20  # chats asking for the whole pack at the same time
+INTERACTIONS = 100000  # actions stored before querying usage stats
+INTERACTIONS_BATCH = 100  # actions written in each transaction
+STARTUP_RUNS = 5  # fresh interpreters started to measure cold start
+STARTUP_CODE = """
+import json, socket, sys, time
+connections = []
+connect = socket.socket.connect
+def counted_connect(self, address):
+    connections.append(str(address))
+    return connect(self, address)
+socket.socket.connect = counted_connect
+start = time.perf_counter()
+import bot
+import_time = time.perf_counter() - start
+google_modules = sorted([m for m in sys.modules if m.split(".")[0] in ("googleapiclient", "oauth2client", "httplib2")])
+build_time = None
+if "--build" in sys.argv:
+    from googleapiclient import discovery
+    from yolobmsbot.google import gauthenticator
+    start = time.perf_counter()
+    discovery.build_from_document(gauthenticator.get_discovery_document("sheets", "v4"))
+    build_time = time.perf_counter() - start
+print(json.dumps({
+    "import_s": import_time, "build_s": build_time, "google_modules": google_modules, "connections": connections
+}))
+"""  # run in a fresh interpreter: imports bot, then builds a Sheets driver from discovery document
+
+
+def get_commit():
+    """
+    :return: str
+        Hash of current git commit (None if not available)
+    """
+
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIRECTORY, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def measure(service, function, *args, **kwargs):
+    """
+    :param service: FakeSheetsService
+        Service whose requests are counted
+    :param function: callable
+        Function to measure
+    :return: {}
+        Number of Sheets requests and seconds taken by a call of function
+    """
+
+    service.reset_calls()
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    wall_time = time.perf_counter() - start
+    return {"calls": service.calls, "wall_time_s": round(wall_time, 6)}
+
+
+def bench_last_row(service):
+    """
+    :param service: FakeSheetsService
+        Fake Sheets service
+    :return: {}
+        Results of last row lookups without and with a known last row
+    """
+
+    spreadsheet = gsheets.SPREADSHEET_SEGMENT_ID[0]
+    gsheets.reset_last_row_hints()
+    results = {"get_last_row_of_column.cold": measure(service, gsheets.get_last_row_of_column, spreadsheet, "B")}
+    service.append_rows(spreadsheet, 10)
+    results["get_last_row_of_column.warm"] = measure(service, gsheets.get_last_row_of_column, spreadsheet, "B")
+    return results
+
+
+def bench_update(service, number_of_cells_per_segment):
+    """
+    :param service: FakeSheetsService
+        Fake Sheets service
+    :param number_of_cells_per_segment: []
+        Number of cells in each segment
+    :return: {}
+        Results of values updates (last values only and with history)
+    """
+
+    results = {}
+    gsheets.reset_last_row_hints()
+    updater = BatteryPackUpdater(BatteryPack(number_of_cells_per_segment), 0, source=GSheetsDataSource())
+    results["update_values.cold"] = measure(service, updater.update_values, force=True)
+    results["update_values.warm"] = measure(service, updater.update_values, force=True)
+
+    history_folder = tempfile.mkdtemp()
+    try:
+        updater = BatteryPackUpdater(
+            BatteryPack(number_of_cells_per_segment), 0, source=GSheetsDataSource(),
+            history=HistoryStore(history_folder)
+        )
+        results["update_values.history.first_sync"] = measure(service, updater.update_values, force=True)
+        for spreadsheet in gsheets.SPREADSHEET_SEGMENT_ID:
+            service.append_rows(spreadsheet, 10)
+        results["update_values.history.incremental"] = measure(service, updater.update_values, force=True)
+    finally:
+        shutil.rmtree(history_folder)
+
+    return results
+
+
+def bench_replies(service, number_of_cells_per_segment, telegram_latency):
+    """
+    :param service: FakeSheetsService
+        Fake Sheets service
+    :param number_of_cells_per_segment: []
+        Number of cells in each segment
+    :param telegram_latency: float
+        Seconds waited by each reply
+    :return: {}
+        End-to-end latency of commands (without and with cached replies), number of messages sent and stats of
+        cache of replies
+    """
+
+    bot.values_updater = BatteryPackUpdater(
+        BatteryPack(number_of_cells_per_segment), bot.UPDATE_INTERVAL_MINUTES, source=GSheetsDataSource()
+    )
+    bot.values_updater.update_values(force=True)
+
+    results = {}
+    commands = [
+        ("reply_cell_command.one", bot.YoloBmsBot.reply_cell_command, "/cell 3 2"),
+        ("reply_cell_command.all", bot.YoloBmsBot.reply_cell_command, "/cell"),
+        ("reply_segment_command.one", bot.YoloBmsBot.reply_segment_command, "/segment 2"),
+        ("reply_segment_command.all", bot.YoloBmsBot.reply_segment_command, "/segment")
+    ]
+    bot.response_cache.clear()
+    for suffix in ["", ".cached"]:  # second time replies come from cache
+        for name, handler, text in commands:
+            update = FakeUpdate(text, telegram_latency)
+            results[name + suffix] = measure(service, handler, None, update)
+            results[name + suffix]["messages"] = len(update.message.replies)
+    results["response_cache"] = bot.response_cache.get_stats()
+    return results
+
+
+def bench_outbox(telegram_latency, chats):
+    """
+    :param telegram_latency: float
+        Seconds waited by each reply
+    :param chats: int
+        Number of chats asking for all cells and all segments at the same time
+    :return: {}
+        Seconds taken by handlers (enqueue only) and until all replies have been sent through the outbox
+    """
+
+    updates = [FakeUpdate("/cell", telegram_latency, chat_id=c) for c in range(chats)] + \
+        [FakeUpdate("/segment", telegram_latency, chat_id=c) for c in range(chats)]
+    bot.outbox = MessageOutbox()
+    bot.outbox.start()
+    try:
+        start = time.perf_counter()
+        for update in updates:
+            handler = bot.YoloBmsBot.reply_cell_command if update.message.text == "/cell" \
+                else bot.YoloBmsBot.reply_segment_command
+            handler(None, update)
+        handlers_time = time.perf_counter() - start
+        bot.outbox.flush()
+        delivery_time = time.perf_counter() - start
+    finally:
+        bot.outbox.stop()
+        bot.outbox = None
+
+    return {
+        "outbox.burst": {
+            "chats": chats,
+            "handlers_wall_time_s": round(handlers_time, 6),
+            "delivery_wall_time_s": round(delivery_time, 6),
+            "messages": sum([len(u.message.replies) for u in updates])
+        }
+    }
+
+
+def bench_warm_start(number_of_cells_per_segment):
+    """
+    :param number_of_cells_per_segment: []
+        Number of cells in each segment
+    :return: {}
+        Seconds taken to save and load snapshot of battery pack, and size of file
+    """
+
+    folder = tempfile.mkdtemp()
+    try:
+        store = WarmStartStore(os.path.join(folder, "snapshot.bin"))
+        snapshot = BatteryPackSnapshot(BatteryPack(number_of_cells_per_segment), datetime.now(), 1)
+        start = time.perf_counter()
+        store.save(snapshot, [0] * len(number_of_cells_per_segment))
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        store.load(number_of_cells_per_segment)
+        load_time = time.perf_counter() - start
+        return {
+            "warm_start.save": {"wall_time_s": round(save_time, 6), "bytes": os.path.getsize(store.path)},
+            "warm_start.load": {"wall_time_s": round(load_time, 6)}
+        }
+    finally:
+        shutil.rmtree(folder)
+
+
+def run_startup(build):
+    """
+    :param build: bool
+        True to also build a Sheets driver
+    :return: {}
+        Seconds taken to import bot (and build driver) in a fresh interpreter, Google modules imported and network
+        connections opened
+    """
+
+    output = subprocess.check_output(
+        [sys.executable, "-c", STARTUP_CODE] + (["--build"] if build else []),
+        cwd=ROOT_DIRECTORY, stderr=subprocess.PIPE
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def bench_startup(runs):
+    """
+    :param runs: int
+        Number of fresh interpreters to start
+    :return: {}
+        Median seconds taken by cold start (import of bot) and by first Sheets driver build, Google modules imported
+        by bot and network connections opened
+    """
+
+    results = {}
+    for name, build in [("startup.import", False), ("startup.build_driver", True)]:
+        try:
+            samples = [run_startup(build) for _ in range(runs)]
+        except (subprocess.CalledProcessError, ValueError) as e:  # e.g Google client or Telegram not installed
+            stderr = getattr(e, "stderr", None)
+            error = stderr.decode().strip().splitlines()[-1] if stderr else str(e)
+            results[name] = {"error": error}
+            continue
+
+        key = "build_s" if build else "import_s"
+        times = sorted([sample[key] for sample in samples])
+        results[name] = {
+            "runs": runs,
+            "wall_time_s": round(times[len(times) // 2], 6),
+            "google_modules": len(samples[-1]["google_modules"]),
+            "connections": len(samples[-1]["connections"])
+        }
+    return results
+
+
+def bench_interactions(number_of_actions):
+    """
+    :param number_of_actions: int
+        Number of actions stored before querying
+    :return: {}
+        Seconds taken to store actions (in batches) and by usage stats queries of a week
+    """
+
+    folder = tempfile.mkdtemp()
+    try:
+        store = InteractionStore(os.path.join(folder, "interactions.sqlite3"))
+        now = time.time()
+        commands = ["/cell", "/segment", "/alerts", "/heatmap", "/history"]
+        start = time.perf_counter()
+        for first in range(0, number_of_actions, INTERACTIONS_BATCH):
+            actions = [
+                (now - (number_of_actions - i) * 60.0, i % 50, commands[i % len(commands)] + " 1 2")
+                for i in range(first, min(first + INTERACTIONS_BATCH, number_of_actions))
+            ]  # an action per minute
+            users = [(u, "User", str(u), "user" + str(u), actions[0][0]) for u in sorted(set([a[1] for a in actions]))]
+            store.write(users, actions)
+        results = {
+            "interactions.write": {"actions": number_of_actions, "wall_time_s": round(time.perf_counter() - start, 6)}
+        }
+
+        week_ago = now - 7 * 86400
+        queries = [
+            ("interactions.user_counts", store.get_user_counts, (week_ago,)),
+            ("interactions.command_counts", store.get_command_counts, (week_ago,)),
+            ("interactions.user_command_counts", store.get_user_command_counts, (7, week_ago)),
+            ("interactions.window_stats", store.get_window_stats, (week_ago,))
+        ]
+        for name, query, args in queries:
+            start = time.perf_counter()
+            query(*args)
+            results[name] = {"wall_time_s": round(time.perf_counter() - start, 6)}
+        store.close()
+        return results
+    finally:
+        shutil.rmtree(folder)
+
+
+def run(rows, latency, telegram_latency, segments):
+    """
+    :param rows: int
+        Number of rows in each fake spreadsheet
+    :param latency: float
+        Seconds waited by each Sheets request
+    :param telegram_latency: float
+        Seconds waited by each Telegram reply
+    :param segments: int
+        Number of segments in battery pack
+    :return: {}
+        All benchmarks results
+    """
+
+    service = FakeSheetsService(
+        gsheets.SPREADSHEET_SEGMENT_ID + [gsheets.SPREADSHEET_PACK_ID], rows, latency
+    )
+    gauthenticator.create_gdrive_driver = lambda: service  # every driver is the fake one
+    number_of_cells_per_segment = bot.NUMBER_OF_CELLS_PER_SEGMENT[:segments]
+
+    results = {}
+    results.update(bench_last_row(service))
+    results.update(bench_update(service, number_of_cells_per_segment))
+    results.update(bench_replies(service, number_of_cells_per_segment, telegram_latency))
+    results.update(bench_outbox(telegram_latency, OUTBOX_CHATS))
+    results.update(bench_interactions(INTERACTIONS))
+    results.update(bench_warm_start(number_of_cells_per_segment))
+    results.update(bench_startup(STARTUP_RUNS))
+
+    return {
+        "commit": get_commit(),
+        "time": time.time(),
+        "config": {
+            "rows": rows,
+            "sheets_latency_s": latency,
+            "telegram_latency_s": telegram_latency,
+            "segments": segments
+        },
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of values updates and replies")
+    parser.add_argument("--rows", type=int, default=5000, help="rows in each fake spreadsheet")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds waited by each Sheets request")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="seconds waited by each reply")
+    parser.add_argument("--segments", type=int, default=bot.NUMBER_OF_SEGMENTS, help="segments in battery pack")
+    parser.add_argument("--output", help="path to JSON file where to write results (default: stdout)")
+    args = parser.parse_args()
+
+    logs_folder = tempfile.mkdtemp()
+    logs.WRITER.path = os.path.join(logs_folder, "interactions.sqlite3")  # keep benchmark users out of real logs
+    try:
+        with contextlib.redirect_stdout(sys.stderr):  # keep bot output out of results
+            results = run(args.rows, args.latency, args.telegram_latency, args.segments)
+    finally:
+        logs.close_log_files()
+        shutil.rmtree(logs_folder)
+    out = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == '__main__':
+    main()
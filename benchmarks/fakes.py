@@ -0,0 +1,203 @@
+# !/usr/bin/python3
+# coding: utf_8
+
+# Copyright 2017 RaceUp ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+RANGE_REGEX = re.compile(r"^([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")  # e.g A2, A2:S, B1:B9999
+
+
+def column_to_index(column):
+    """
+    :param column: str
+        Column name (e.g "A", "S", "AB")
+    :return: int
+        Index of column (starts from 0)
+    """
+
+    index = 0
+    for letter in column:
+        index = index * 26 + (ord(letter) - ord("A") + 1)
+    return index - 1
+
+
+class FakeSheetsService(object):
+    """
+    In-memory stand-in of a Google Sheets API driver: counts requests and waits a fixed latency for each one
+    """
+
+    def __init__(self, spreadsheets, rows, latency=0.0, number_of_cells=18):
+        """
+        :param spreadsheets: []
+            IDs of spreadsheets to serve
+        :param rows: int
+            Number of rows of values in each spreadsheet (header excluded)
+        :param latency: float
+            Seconds waited by each request
+        :param number_of_cells: int
+            Number of values in each row (time excluded)
+        """
+
+        object.__init__(self)
+
+        self.latency = latency
+        self.number_of_cells = number_of_cells
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.sheets = {}
+        for i, spreadsheet in enumerate(spreadsheets):
+            self.sheets[spreadsheet] = [["time"] + ["cell " + str(c + 1) for c in range(number_of_cells)]]
+            self.append_rows(spreadsheet, rows, seed=i)
+
+    def append_rows(self, spreadsheet, rows, seed=0):
+        """
+        :param spreadsheet: str
+            ID of spreadsheet
+        :param rows: int
+            Number of rows of values to add
+        :param seed: int
+            Offset of generated values
+        :return: void
+            Appends new rows of values to spreadsheet
+        """
+
+        sheet = self.sheets[spreadsheet]
+        start = datetime(2017, 4, 1)
+        for r in range(len(sheet), len(sheet) + rows):
+            time_value = str(start + timedelta(minutes=r))
+            values = [str(3500 + (r * 7 + c * 13 + seed * 31) % 700) for c in range(self.number_of_cells)]
+            sheet.append([time_value] + values)
+
+    def reset_calls(self):
+        """
+        :return: void
+            Sets requests counter to 0
+        """
+
+        with self.lock:
+            self.calls = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        return FakeRequest(self, spreadsheetId, range)
+
+    def execute(self, spreadsheet, range_name):
+        """
+        :param spreadsheet: str
+            ID of spreadsheet
+        :param range_name: str
+            A1 notation of range (e.g A2:S)
+        :return: {}
+            Response like the one of Google Sheets API: trailing empty rows are not returned
+        """
+
+        with self.lock:
+            self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        first_column, first_row, last_column, last_row = RANGE_REGEX.match(range_name).groups()
+        last_column = last_column or first_column
+        if last_row is None:  # single cell
+            last_row = first_row
+        first_row = int(first_row) if first_row else 1
+        sheet = self.sheets[spreadsheet]
+        last_row = int(last_row) if last_row else len(sheet)
+        first_column, last_column = column_to_index(first_column), column_to_index(last_column)
+
+        values = [row[first_column:last_column + 1] for row in sheet[first_row - 1:last_row]]
+        while values and not values[-1]:
+            values.pop()
+        return {"values": values} if values else {}
+
+
+class FakeRequest(object):
+    """
+    Request of fake Sheets service
+    """
+
+    def __init__(self, service, spreadsheet, range_name):
+        object.__init__(self)
+
+        self.service = service
+        self.spreadsheet = spreadsheet
+        self.range_name = range_name
+
+    def execute(self):
+        return self.service.execute(self.spreadsheet, self.range_name)
+
+
+class FakeMessage(object):
+    """
+    Telegram message that only counts (and optionally delays) replies
+    """
+
+    def __init__(self, text, latency=0.0, chat_id=42):
+        """
+        :param text: str
+            Text sent by user
+        :param latency: float
+            Seconds waited by each reply
+        :param chat_id: int
+            Id of chat of message
+        """
+
+        object.__init__(self)
+
+        self.text = text
+        self.chat_id = chat_id
+        self.latency = latency
+        self.replies = []
+        self.from_user = FakeUser()
+
+    def reply_text(self, text, **kwargs):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        self.replies.append(text)
+
+
+class FakeUser(object):
+    """
+    Telegram user sending commands
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.id = 42
+        self.first_name = "Bench"
+        self.last_name = "Mark"
+        self.username = "benchmark"
+
+
+class FakeUpdate(object):
+    """
+    Telegram update with a message
+    """
+
+    def __init__(self, text, latency=0.0, chat_id=42):
+        object.__init__(self)
+
+        self.message = FakeMessage(text, latency, chat_id)
@@ -16,23 +16,46 @@
 # limitations under the License.
 
 
+import asyncio
 import logging
 import os
+import time
 from datetime import datetime
-from math import ceil
+from html import escape
+from io import BytesIO
+from math import ceil, isnan
 
 from telegram.ext import Updater, CommandHandler
 
-from yolobmsbot import logs
-from yolobmsbot.batterypack import BatteryPack, BatteryCellValue
-from yolobmsbot.google import gsheets
+from yolobmsbot import heatmap, logs, metrics, replies, tracing, utils
+from yolobmsbot.aio import AsyncRunner
+from yolobmsbot.alerts import AlertManager, SUBSCRIBE_USAGE, parse_rule
+from yolobmsbot.batterypack import BatteryPack, BatteryCellValue, CellThresholds
+from yolobmsbot.cache import ResponseCache
+from yolobmsbot.datasource import CsvDataSource, GSheetsDataSource
+from yolobmsbot.history import HistoryStore
+from yolobmsbot.outbox import MessageOutbox
+from yolobmsbot.rollups import RollupEngine
+from yolobmsbot.timeseries import CellTimeSeries
+from yolobmsbot.updater import BatteryPackUpdater
+from yolobmsbot.warmstart import WarmStartStore
 
 # bot settings
 SCRIPT_DIRECTORY = os.path.dirname(__file__)  # path to directory of python script running
 CLIENT_TOKEN_FILE = os.path.join(SCRIPT_DIRECTORY, "yolobmsbot", ".user_credentials", "telegram", "bot_token")  # path to token file
-BOT_TOKEN = open(CLIENT_TOKEN_FILE, "r").read().strip()
 UPDATE_INTERVAL_MINUTES = 30  # minutes between 2 consecutive values updates
-QUERY_WAIT_MESSAGE = "Please let me compute the query ... it may take a few moments"
+LOCAL_DATA_FOLDER = None  # folder with a csv file per segment (None to fetch values from Google Sheets)
+MAX_STALENESS_MINUTES = 2 * UPDATE_INTERVAL_MINUTES  # older values are replied with a warning
+EXECUTION_MODE = "threads"  # "threads" (handlers run on dispatcher thread) or "asyncio" (on an event loop)
+METRICS_HTTP_HOST = "127.0.0.1"  # address of metrics endpoint (local only)
+METRICS_HTTP_PORT = 9180  # port of metrics endpoint (None to not expose it)
+ADMIN_USER_IDS = []  # Telegram ids of users allowed to ask /stats
+TRACE_FILE = os.path.join(SCRIPT_DIRECTORY, "yolobmsbot", "logs", "traces.json")  # Chrome trace-event file
+TRACE_SAMPLE_RATE = 0.01  # share of commands and updates traced (0 to disable tracing)
+OUTBOX_STOP_TIMEOUT_SECONDS = 10  # max seconds to wait for pending replies when bot stops
+NO_VALUES_MESSAGE = "No values fetched yet ... please try again in a few moments"
+RESTORED_VALUES_MESSAGE = "Note: these are cached values saved before the bot restarted ({} old), " \
+    "fresh values are being fetched"
 
 # chat settings
 KEYBOARD_CELLS = [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10, 11, 12], [13, 14, 15], [16, 17, 18]]
@@ -40,6 +63,30 @@ KEYBOARD_CELLS = [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10, 11, 12], [13, 14, 15], [
 # bms settings
 NUMBER_OF_SEGMENTS = 8
 NUMBER_OF_CELLS_PER_SEGMENT = [17, 18, 18, 18, 18, 18, 18, 17]  # first and last segment have 1 less cell
+CELL_THRESHOLDS = CellThresholds(
+    min_voltage=3500, max_voltage=4200, max_temperature=60
+)  # limits of normal cells (may also be a list with the limits of each segment)
+MAX_ALERTS_PER_MESSAGE = 50  # abnormal cells listed in reply to /alerts
+
+outbox = None  # MessageOutbox used to send replies (None to send them from handler thread)
+response_cache = ResponseCache()  # replies already formatted for current snapshot
+async_runner = None  # AsyncRunner of handlers in asyncio mode (None to run them on dispatcher thread)
+alert_manager = None  # AlertManager of subscriptions to alerts (None if alerts are not available)
+
+HANDLER_LATENCY = metrics.REGISTRY.histogram(
+    "handler_seconds", "Seconds taken by command handlers (replies are sent later by outbox)", ("command",)
+)
+HANDLER_ERRORS = metrics.REGISTRY.counter("handler_errors_total", "Command handlers that raised", ("command",))
+
+
+def get_bot_token():
+    """
+    :return: str
+        Telegram bot token (read only when bot is created, so that module can be imported without it)
+    """
+
+    with open(CLIENT_TOKEN_FILE, "r") as token_file:
+        return token_file.read().strip()
 
 
 def get_keyboard(items, max_columns):
@@ -65,65 +112,13 @@ def get_keyboard(items, max_columns):
     return matrix
 
 
-class BatteryPackUpdater(object):
-    """ Fetches new values of battery pack and updates """
-
-    def __init__(self, b_pack, update_interval):
-        """
-        :param b_pack: BatteryPack
-            Battery to update
-        :param update_interval: int
-            Number of minutes between two consecutive values updates
-        """
-
-        object.__init__(self)
-
-        self.battery_pack = b_pack  # battery
-        self.update_interval = update_interval
-        self.last_update = datetime.fromtimestamp(0)  # first january 1970
-
-    def _is_update_needed(self):
-        """
-        :return: bool
-            True if need to update cells values because timer timeout
-        """
-
-        time_now = datetime.now()
-        minutes_since_last_update = time_now - self.last_update
-        minutes_since_last_update = minutes_since_last_update.total_seconds() / 60.0
-        return minutes_since_last_update >= self.update_interval
-
-    def update_values(self):
-        """
-        :return: void
-            Updates all values in battery pack
-        """
-
-        if self._is_update_needed():  # check timer timeout
-            print("Updating values")
-            self.last_update = datetime.now()  # update last time of update
-            last_row = None
-            for s in range(len(self.battery_pack.segments)):
-                last_values_of_cells_in_segment, last_update_time, last_row = gsheets.get_last_cells_values(
-                    s,
-                    row=last_row
-                )  # get last values
-
-                for c in range(len(self.battery_pack.segments[s].cells)):
-                    new_voltage_value = last_values_of_cells_in_segment[c]
-                    new_temp_value = 0.0
-                    self.battery_pack.segments[s].cells[c].update_values(new_temp_value, new_voltage_value)  # update
-                    print("Updated (cell, segment) (" + str(c) + ", " + str(s) + "): voltage", str(new_voltage_value))
-            print("Done updating values")
-
-
 class YoloBmsBot(object):
     """ Remote Bms Raceup bot """
 
     def __init__(self):
         object.__init__(self)
 
-        self.updater = Updater(BOT_TOKEN)  # telegram settings
+        self.updater = Updater(get_bot_token())  # telegram settings
         self.dp = self.updater.dispatcher  # get the dispatcher to register handlers
         self.dp.add_error_handler(self.error)  # log errors
         self.setup_commands()  # setup commands
@@ -143,9 +138,23 @@ class YoloBmsBot(object):
             Setup bot commmands
         """
 
-        self.dp.add_handler(CommandHandler("start", self.start))
-        self.dp.add_handler(CommandHandler("segment", self.reply_segment_command))
-        self.dp.add_handler(CommandHandler("cell", self.reply_cell_command))
+        commands = [
+            ("start", self.start),
+            ("segment", self.reply_segment_command),
+            ("cell", self.reply_cell_command),
+            ("refresh", self.reply_refresh_command if async_runner is None else self.reply_refresh_command_async),
+            ("alerts", self.reply_alerts_command),
+            ("history", self.reply_history_command),
+            ("heatmap", self.reply_heatmap_command),
+            ("subscribe", self.reply_subscribe_command),
+            ("unsubscribe", self.reply_unsubscribe_command),
+            ("stats", self.reply_stats_command)
+        ]
+        for command, handler in commands:
+            handler = YoloBmsBot.instrument("/" + command, handler)
+            if async_runner is not None:  # dispatcher thread only schedules handler on event loop
+                handler = async_runner.wrap(handler)
+            self.dp.add_handler(CommandHandler(command, handler))
 
     @staticmethod
     def start(bot, update):
@@ -158,16 +167,74 @@ class YoloBmsBot(object):
             Welcomes user
         """
 
-        logs.log_users(
-            update.message.from_user.id,
-            update.message.from_user.first_name,
-            update.message.from_user.last_name,
-            update.message.from_user.username
-        )  # log
+        YoloBmsBot.log_action(update)
 
         message = "Hello {}! I'm here to provide you with information about the RaceUp Bms" \
             .format(update.message.from_user.first_name)
-        update.message.reply_text(message)
+        YoloBmsBot.reply_text(update, message)
+
+    @staticmethod
+    def instrument(command, handler):
+        """
+        :param command: str
+            Command of handler
+        :param handler: callable
+            Handler (bot, update), blocking or coroutine function
+        :return: callable
+            Handler measuring its latency, counting its errors and tracing it (with what it calls)
+        """
+
+        latency, errors = HANDLER_LATENCY.labels(command), HANDLER_ERRORS.labels(command)
+        if asyncio.iscoroutinefunction(handler):
+            async def instrumented(bot, update):
+                try:
+                    with latency.time(), tracing.span("handler", command=command, chat=update.message.chat_id):
+                        return await handler(bot, update)
+                except Exception:
+                    errors.inc()
+                    raise
+        else:
+            def instrumented(bot, update):
+                try:
+                    with latency.time(), tracing.span("handler", command=command, chat=update.message.chat_id):
+                        return handler(bot, update)
+                except Exception:
+                    errors.inc()
+                    raise
+        return instrumented
+
+    @staticmethod
+    def trace_send(chat, send):
+        """
+        :param chat: int
+            Id of chat
+        :param send: callable
+            Sends message to chat (no arguments)
+        :return: callable
+            Same as send, traced as part of the span running now (even when called by outbox threads)
+        """
+
+        def traced():
+            with tracing.span("telegram.send", chat=chat):
+                return send()
+
+        return tracing.wrap(traced)
+
+    def send_message(self, chat, text):
+        """
+        :param chat: int
+            Id of chat
+        :param text: str
+            Message to send
+        :return: void
+            Sends message to chat (through outbox if any), even if it is not a reply
+        """
+
+        send = YoloBmsBot.trace_send(chat, lambda: self.updater.bot.send_message(chat_id=chat, text=text))
+        if outbox is None:
+            send()
+        else:
+            outbox.put(chat, send)
 
     @staticmethod
     def error(bot, update, error):
@@ -184,6 +251,444 @@ class YoloBmsBot(object):
 
         logging.error('Update "%s" caused error "%s"' % (update, error))
 
+    @staticmethod
+    def log_action(update):
+        """
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Logs user (by id, with current names) and the message user sent (without waiting for disk)
+        """
+
+        user = update.message.from_user
+        logs.log_users(user.id, user.first_name, user.last_name, user.username)
+        logs.log_user_action(user.id, str(update.message.text))
+
+    @staticmethod
+    def check_values(update):
+        """
+        :param update: updater
+            Updater of bot chat
+        :return: bool
+            True iff there are values to reply with (user is warned if they are stale or saved before restart)
+        """
+
+        if not values_updater.has_values():
+            values_updater.force_update()
+            YoloBmsBot.reply_text(update, NO_VALUES_MESSAGE)
+            return False
+
+        snapshot = values_updater.get_snapshot()
+        if snapshot.restored:  # first update after restart is running
+            YoloBmsBot.reply_text(update, RESTORED_VALUES_MESSAGE.format(YoloBmsBot.get_age_msg(snapshot)))
+        elif values_updater.is_stale():
+            values_updater.force_update()
+            YoloBmsBot.reply_text(
+                update,
+                "Warning: values are " + YoloBmsBot.get_age_msg(values_updater.get_snapshot()) +
+                " old, an update has been requested"
+            )
+        return True
+
+    @staticmethod
+    def get_age_msg(snapshot):
+        """
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
+        :return: str
+            How old values are (e.g "12 minutes")
+        """
+
+        minutes = int((datetime.now() - snapshot.time).total_seconds() / 60.0)
+        if minutes < 1:
+            return "less than a minute"
+        elif minutes < 120:
+            return str(minutes) + " minutes"
+        return str(minutes // 60) + " hours"
+
+    @staticmethod
+    def get_time_msg(snapshot):
+        """
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
+        :return: str
+            When values have been read (e.g " as of 2017-04-29 at 10:30:00 (12 minutes ago)")
+        """
+
+        return " as of " + str(snapshot.time.date()) + " at " + str(snapshot.time.time()) + \
+            " (" + YoloBmsBot.get_age_msg(snapshot) + " ago)"
+
+    @staticmethod
+    def get_reply(key, snapshot, compute):
+        """
+        :param key: tuple
+            Command and its arguments
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
+        :param compute: callable
+            Builds reply (no arguments, without time of values: it is added to cached reply)
+        :return: obj
+            Reply from cache of replies (built only once until a segment the pack is made of is updated)
+        """
+
+        return response_cache.get(key, tuple(snapshot.segment_versions), compute)
+
+    @staticmethod
+    def send(update, send, on_sent=None):
+        """
+        :param update: updater
+            Updater of bot chat
+        :param send: callable
+            Sends message to chat (no arguments), may be called again if it fails
+        :param on_sent: callable
+            Called with result of send once message has been sent (None to ignore it)
+        :return: void
+            Enqueues message in outbox (sends it straight away if there is no outbox)
+        """
+
+        send = YoloBmsBot.trace_send(update.message.chat_id, send)
+        if outbox is None:
+            result = send()
+            if on_sent is not None:
+                on_sent(result)
+        else:
+            outbox.put(update.message.chat_id, send, on_sent)
+
+    @staticmethod
+    def reply_text(update, text, parse_mode=None):
+        """
+        :param update: updater
+            Updater of bot chat
+        :param text: str
+            Message to send
+        :param parse_mode: str
+            How Telegram has to parse message (None for plain text)
+        :return: void
+            Replies with message (without waiting for it to be sent)
+        """
+
+        if parse_mode is None:
+            YoloBmsBot.send(update, lambda: update.message.reply_text(text))
+        else:
+            YoloBmsBot.send(update, lambda: update.message.reply_text(text, parse_mode=parse_mode))
+
+    @staticmethod
+    def reply_messages(update, messages, parse_mode=None):
+        """
+        :param update: updater
+            Updater of bot chat
+        :param messages: [] of str
+            Messages to send (in order)
+        :param parse_mode: str
+            How Telegram has to parse messages (None for plain text)
+        :return: void
+            Sends messages to chat
+        """
+
+        for message in messages:
+            YoloBmsBot.reply_text(update, message, parse_mode)
+
+    @staticmethod
+    def reply_refresh_command(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Asks background updater to update values now
+        """
+
+        YoloBmsBot.log_action(update)
+        values_updater.force_update()
+        YoloBmsBot.reply_text(update, "Values are going to be updated in a few moments")
+
+    @staticmethod
+    async def reply_refresh_command_async(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Updates values now (without blocking event loop) and replies when done
+        """
+
+        YoloBmsBot.log_action(update)
+        YoloBmsBot.reply_text(update, "Values are going to be updated in a few moments")
+        snapshot = await values_updater.update_values_async(async_runner, force=True)
+        msg = "Values updated as of " + str(snapshot.time.date()) + " at " + str(snapshot.time.time())
+        if snapshot.errors:
+            msg += " (" + str(len(snapshot.errors)) + " segments could not be updated)"
+        YoloBmsBot.reply_text(update, msg)
+
+    @staticmethod
+    def reply_alerts_command(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Replies with list of abnormal cells
+        """
+
+        YoloBmsBot.log_action(update)
+        if not YoloBmsBot.check_values(update):
+            return
+        snapshot = values_updater.get_snapshot()
+        lines = YoloBmsBot.get_reply(("alerts",), snapshot, lambda: YoloBmsBot.get_alerts_msg(snapshot))
+        YoloBmsBot.reply_text(update, "\n".join([lines[0] + YoloBmsBot.get_time_msg(snapshot)] + lines[1:]))
+
+    @staticmethod
+    def get_alerts_msg(snapshot):
+        """
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
+        :return: [] of str
+            Lines of message with abnormal cells (time of values is to be added to first one)
+        """
+
+        abnormal_cells = snapshot.get_abnormal_cells(CELL_THRESHOLDS)
+        if not abnormal_cells:
+            return ["All cells are fine"]
+
+        lines = [str(len(abnormal_cells)) + " abnormal cells"]
+        for abnormal_cell in abnormal_cells[:MAX_ALERTS_PER_MESSAGE]:
+            reasons = ", ".join([reason.name.replace("_", " ") for reason in abnormal_cell["reasons"]])
+            temperature = "" if isnan(abnormal_cell["temperature"]) else \
+                ", " + "{0:.1f}".format(abnormal_cell["temperature"]) + " C"  # not read by every source
+            lines.append(
+                "cell " + str(abnormal_cell["cell"] + 1) + " in segment " + str(abnormal_cell["segment"] + 1) + ": " +
+                "{0:.2f}".format(abnormal_cell["voltage"]) + " mV" + temperature + " (" + reasons + ")"
+            )
+        if len(abnormal_cells) > MAX_ALERTS_PER_MESSAGE:
+            lines.append("... and " + str(len(abnormal_cells) - MAX_ALERTS_PER_MESSAGE) + " more")
+        return lines
+
+    @staticmethod
+    def reply_subscribe_command(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Subscribes chat to an alert rule (or lists rules of chat if there are no arguments)
+        """
+
+        YoloBmsBot.log_action(update)
+        if alert_manager is None:
+            YoloBmsBot.reply_text(update, "Alerts are not available")
+            return
+
+        chat = update.message.chat_id
+        args = str(update.message.text).split()[1:]
+        if not args:
+            rules = alert_manager.get_rules(chat)
+            lines = ["You are subscribed to:"] + ["- " + r.describe() for r in rules] if rules else \
+                ["You are not subscribed to any alert"]
+            YoloBmsBot.reply_text(update, "\n".join(lines + [SUBSCRIBE_USAGE]))
+            return
+
+        try:
+            rule = parse_rule(args, CELL_THRESHOLDS)
+        except ValueError as e:
+            YoloBmsBot.reply_text(update, str(e))
+            return
+
+        is_new, triggered = alert_manager.subscribe(chat, rule)
+        if not is_new:
+            msg = "You are already subscribed to alerts on " + rule.describe()
+        else:
+            msg = "You will be alerted when " + rule.describe() + " (and when it is back to normal)"
+        if triggered:
+            msg += "\nThis alert is active right now"
+        YoloBmsBot.reply_text(update, msg)
+
+    @staticmethod
+    def reply_unsubscribe_command(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Unsubscribes chat from an alert rule (or from all of them if there are no arguments)
+        """
+
+        YoloBmsBot.log_action(update)
+        if alert_manager is None:
+            YoloBmsBot.reply_text(update, "Alerts are not available")
+            return
+
+        args = str(update.message.text).split()[1:]
+        rule = None
+        if args:
+            try:
+                rule = parse_rule(args, CELL_THRESHOLDS)
+            except ValueError as e:
+                YoloBmsBot.reply_text(update, str(e).replace("/subscribe", "/unsubscribe"))
+                return
+
+        removed = alert_manager.unsubscribe(update.message.chat_id, rule)
+        YoloBmsBot.reply_text(update, "Unsubscribed from " + str(removed) + " alerts")
+
+    @staticmethod
+    def reply_stats_command(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Replies with metrics of bot (admins only)
+        """
+
+        YoloBmsBot.log_action(update)
+        if update.message.from_user.id not in ADMIN_USER_IDS:
+            YoloBmsBot.reply_text(update, "Sorry, only admins can ask for stats")
+            return
+
+        lines = [escape(line) for line in metrics.REGISTRY.get_summary()]
+        messages = replies.split_blocks([[line] for line in lines], "Stats of bot")
+        YoloBmsBot.reply_messages(update, messages, replies.PARSE_MODE)
+
+    @staticmethod
+    def reply_heatmap_command(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Replies with an image of voltages of all cells (rendered and uploaded once per values update)
+        """
+
+        YoloBmsBot.log_action(update)
+        if not YoloBmsBot.check_values(update):
+            return
+
+        snapshot = values_updater.get_snapshot()
+        caption = YoloBmsBot.get_heatmap_caption(snapshot)
+        file_id = snapshot.cache.get(("heatmap_file_id",))
+        if file_id is not None:  # already uploaded: no need to upload it again
+            YoloBmsBot.send(update, lambda: update.message.reply_photo(photo=file_id, caption=caption))
+            return
+
+        image = snapshot.get_cached(
+            ("heatmap",),
+            lambda: heatmap.render_pack(snapshot.pack, CELL_THRESHOLDS, snapshot.get_abnormal_cells(CELL_THRESHOLDS))
+        )
+
+        def on_sent(message):
+            try:
+                snapshot.set_cached(("heatmap_file_id",), message.photo[-1].file_id)
+            except (AttributeError, IndexError, TypeError):
+                pass  # image will be uploaded again
+
+        YoloBmsBot.send(
+            update, lambda: update.message.reply_photo(photo=BytesIO(image), caption=caption), on_sent
+        )  # new file object at each attempt
+
+    @staticmethod
+    def get_heatmap_caption(snapshot):
+        """
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
+        :return: str
+            Caption of image of voltages of all cells
+        """
+
+        thresholds = snapshot.pack.get_thresholds_per_segment(CELL_THRESHOLDS)
+        min_voltage = min([t.min_voltage for t in thresholds])
+        max_voltage = max([t.max_voltage for t in thresholds])
+        return "Voltages" + YoloBmsBot.get_time_msg(snapshot) + ": a row for each segment, blue is " + \
+            "{0:.0f}".format(min_voltage) + " mV, red is " + "{0:.0f}".format(max_voltage) + " mV, " + \
+            str(len(snapshot.get_abnormal_cells(CELL_THRESHOLDS))) + " abnormal cells are outlined"
+
+    @staticmethod
+    def reply_history_command(bot, update):
+        """
+        :param bot: bot
+            Bot to use
+        :param update: updater
+            Updater of bot chat
+        :return: void
+            Replies with values of a cell in a time window (/history <cell> <segment> <window>, e.g "1h", "30m", "2d").
+            Cell may be "avg" to get values of the average of segment
+        """
+
+        YoloBmsBot.log_action(update)
+        args = str(update.message.text).split(" ")
+        try:
+            c = None if args[1].lower() == "avg" else int(args[1]) - 1  # parse cell
+            s = int(args[2]) - 1  # parse segment
+            window = utils.parse_window(args[3]) if len(args) > 3 else 3600
+        except (IndexError, ValueError):
+            YoloBmsBot.reply_text(update, "Usage: /history <cell|avg> <segment> <window> (e.g /history 4 2 1h)")
+            return
+
+        YoloBmsBot.reply_text(update, YoloBmsBot.get_history_msg(c, s, window))
+
+    @staticmethod
+    def get_history_msg(cell, segment, window):
+        """
+        :param cell: int
+            Cell to get values of (None for the average of segment)
+        :param segment: int
+            Segment of cell
+        :param window: float
+            Seconds before now to get values of
+        :return: str
+            Message with summary of values of cell in window
+        """
+
+        if not values_updater.battery_pack.is_cell_in_bounds(0 if cell is None else cell, segment):
+            if cell is None:
+                return "Invalid segment " + str(segment + 1)
+            return "Invalid cell " + str(cell + 1) + " in segment " + str(segment + 1)
+
+        name = "average of segment " + str(segment + 1) if cell is None else \
+            "cell " + str(cell + 1) + " in segment " + str(segment + 1)
+        time_now = time.time()
+        rollups, timeseries = values_updater.rollups, values_updater.timeseries
+        first_time = timeseries.get_first_time(segment) if timeseries is not None else None
+        is_raw = timeseries is not None and cell is not None and (
+            rollups is None or rollups.is_loading() or (first_time is not None and first_time <= time_now - window)
+        )  # raw samples when ring buffer has the whole window
+        if is_raw:
+            times, voltages, _ = timeseries.get_range(cell, segment, time_now - window)
+            samples = [(t, v) for t, v in zip(times, voltages) if not isnan(v)]  # skip invalid readings
+            times, voltages = [t for t, _ in samples], [v for _, v in samples]
+            summary = {
+                "resolution": 0,
+                "count": len(times),
+                "min": min(voltages),
+                "max": max(voltages),
+                "mean": sum(voltages) / len(voltages),
+                "last": voltages[-1],
+                "last_time": times[-1]
+            } if times else None
+        elif rollups is not None and rollups.is_loading():
+            return "History is still being loaded, please try again in a few moments"
+        elif rollups is not None:  # precomputed
+            summary = rollups.get_summary(cell, segment, time_now - window, time_now)
+        else:
+            return "History of cells is not available"
+
+        if summary is None:
+            return "No values of " + name + " in the last " + utils.format_window(window)
+
+        msg = "Values of " + name + " in the last " + utils.format_window(window) + ": " + \
+            str(summary["count"]) + " samples, min " + "{0:.2f}".format(summary["min"]) + \
+            " mV, max " + "{0:.2f}".format(summary["max"]) + \
+            " mV, mean " + "{0:.2f}".format(summary["mean"]) + " mV\n" + \
+            "last " + "{0:.2f}".format(summary["last"]) + " mV at " + str(datetime.fromtimestamp(summary["last_time"]))
+        if summary["resolution"] > 0:
+            msg += " (" + utils.format_window(summary["resolution"]) + " resolution)"
+        return msg
+
     @staticmethod
     def reply_segment_command(bot, update):
         """
@@ -196,64 +701,61 @@ class YoloBmsBot(object):
         """
 
         user_name = update.message.from_user.first_name + update.message.from_user.last_name + " (" + update.message.from_user.username + ")"
-        logs.log_user_action(update.message.from_user.id, str(update.message.text))  # log
+        YoloBmsBot.log_action(update)
         message_text = str(update.message.text)  # get text of user message
         print(user_name, "has asked", message_text)
-        update.message.reply_text(QUERY_WAIT_MESSAGE)
-        values_updater.update_values()  # update values
+        if not YoloBmsBot.check_values(update):
+            return
+        snapshot = values_updater.get_snapshot()  # reply all values from the same update
 
         args = message_text.split(" ")
         if len(args) < 2:  # reply all segments
             print("Answering all segments")
-            update.message.reply_text("Going to fetch values of all segments .. be ready for spam")
-            msg_counter = 0
-            for s in range(len(battery_pack.segments)):
-                try:
-                    msg = YoloBmsBot.get_segment_value_msg(s)
-                    update.message.reply_text(msg)
-                    msg_counter += 1
-                except Exception as e:
-                    print("Cannot get value of segment " + str(s))
-                    print(str(e))
-                    update.message.reply_text("Ooops cannot get value of segment " + str(s))
-            update.message.reply_text("Done replying " + str(msg_counter) + " values")
+            messages = YoloBmsBot.get_reply(("segment",), snapshot, lambda: replies.get_segments_table(snapshot))
+            messages = replies.add_time(messages, replies.SEGMENTS_TITLE, YoloBmsBot.get_time_msg(snapshot))
+            YoloBmsBot.reply_messages(update, messages, replies.PARSE_MODE)
         else:
             s = int(args[-1]) - 1  # parse segment
             print("Answering segment", s)
-            msg = YoloBmsBot.get_segment_value_msg(s)
-            update.message.reply_text(msg)
+            msg = YoloBmsBot.get_reply(
+                ("segment", s), snapshot, lambda: YoloBmsBot.get_segment_value_msg(s, snapshot)
+            )
+            if snapshot.pack.is_cell_in_bounds(0, s):
+                msg += YoloBmsBot.get_time_msg(snapshot)
+            YoloBmsBot.reply_text(update, msg)
 
     @staticmethod
-    def get_segment_value(segment):
+    def get_segment_value(segment, snapshot):
         """
         :param segment: int
             Segment to get average of
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
         :return: float
             Average of segment
         """
 
-        if battery_pack.is_cell_in_bounds(0, segment):
-            value = battery_pack.segments[segment].get_average(BatteryCellValue.voltage)
+        if snapshot.pack.is_cell_in_bounds(0, segment):
+            value = snapshot.pack.segments[segment].get_average(BatteryCellValue.voltage)
             return value
         else:
             raise ValueError("Invalid segment " + str(segment))
 
     @staticmethod
-    def get_segment_value_msg(segment):
+    def get_segment_value_msg(segment, snapshot):
         """
         :param segment: int
             Segment of cell
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
         :return: str
-            Message with cell value
+            Message with cell value (time of values is to be added)
         """
 
         try:
-            value = YoloBmsBot.get_segment_value(segment)
-            time_update = values_updater.last_update
-            time_date, time_hours = str(time_update.date()), str(time_update.time())
-
-            return "Latest average value of segment " + str(int(segment) + 1) + " is " + "{0:.2f}".format(
-                float(value)) + " mV as of " + str(time_date) + " at " + str(time_hours)
+            value = YoloBmsBot.get_segment_value(segment, snapshot)
+            value_msg = "not valid" if isnan(value) else "{0:.2f}".format(float(value)) + " mV"  # no valid readings
+            return "Latest average value of segment " + str(int(segment) + 1) + " is " + value_msg
         except Exception as e:
             print("Cannot answer segment", segment)
             print(str(e))
@@ -273,81 +775,131 @@ class YoloBmsBot(object):
         """
 
         user_name = update.message.from_user.first_name + update.message.from_user.last_name + " (" + update.message.from_user.username + ")"
-        logs.log_user_action(str(user_name), str(update.message.text))  # log
+        YoloBmsBot.log_action(update)
         message_text = str(update.message.text)  # get text of user message
         print(user_name, "has asked", message_text)
-        update.message.reply_text(QUERY_WAIT_MESSAGE)
-        values_updater.update_values()  # update values
+        if not YoloBmsBot.check_values(update):
+            return
+        snapshot = values_updater.get_snapshot()  # reply all values from the same update
 
         args = message_text.split(" ")
         if len(args) < 3:  # reply all cells
             print("Answering all cells")
-            update.message.reply_text("Going to fetch values of all cells .. be ready for spam")
-            msg_counter = 0
-            for s in range(len(battery_pack.segments)):
-                for c in range(len(battery_pack.segments[s].cells)):
-                    try:
-                        msg = YoloBmsBot.get_cell_value_msg(c, s)
-                        update.message.reply_text(msg)
-                        msg_counter += 1
-                    except Exception as e:
-                        print("Cannot get value of cell " + str(c) + " in segment " + str(s))
-                        print(str(e))
-                        update.message.reply_text("Ooops cannot get value of cell " + str(c) + " in segment " + str(s))
-            update.message.reply_text("Done replying " + str(msg_counter) + " values")
+            messages = YoloBmsBot.get_reply(("cell",), snapshot, lambda: replies.get_cells_table(snapshot))
+            messages = replies.add_time(messages, replies.CELLS_TITLE, YoloBmsBot.get_time_msg(snapshot))
+            YoloBmsBot.reply_messages(update, messages, replies.PARSE_MODE)
         else:
             c = int(args[-2]) - 1  # read cell
             s = int(args[-1]) - 1  # parse segment
             print("Answering cell", c, "in segment", s)
-            msg = YoloBmsBot.get_cell_value_msg(c, s)
-            update.message.reply_text(msg)
+            msg = YoloBmsBot.get_reply(
+                ("cell", c, s), snapshot, lambda: YoloBmsBot.get_cell_value_msg(c, s, snapshot)
+            )
+            if snapshot.pack.is_cell_in_bounds(c, s):
+                msg += YoloBmsBot.get_time_msg(snapshot)
+            YoloBmsBot.reply_text(update, msg)
 
     @staticmethod
-    def get_cell_value(cell, segment):
+    def get_cell_value(cell, segment, snapshot):
         """
         :param cell: int
             Cell to get value of
         :param segment: int
             Segment of cell
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
         :return: float
             Cell voltage
         """
 
-        if battery_pack.is_cell_in_bounds(cell, segment):
-            value = battery_pack.segments[segment].cells[cell].get(BatteryCellValue.voltage)
+        if snapshot.pack.is_cell_in_bounds(cell, segment):
+            value = snapshot.pack.segments[segment].cells[cell].get(BatteryCellValue.voltage)
             return value
         else:
             raise ValueError("Invalid cell " + str(cell) + " in segment " + str(segment))
 
     @staticmethod
-    def get_cell_value_msg(cell, segment):
+    def get_cell_value_msg(cell, segment, snapshot):
         """
         :param cell: int
             Cell to get value of
         :param segment: int
             Segment of cell
+        :param snapshot: BatteryPackSnapshot
+            Values to reply with
         :return: str
-            Message with cell value
+            Message with cell value (time of values is to be added)
         """
 
         try:
-            value = YoloBmsBot.get_cell_value(cell, segment)
-            time_update = values_updater.last_update
-            time_date, time_hours = str(time_update.date()), str(time_update.time())
-
-            return "Latest value of cell " + str(cell + 1) + " in segment " + str(
-                segment + 1) + " is " + "{0:.2f}".format(
-                float(value)) + " mV as of " + time_date + " at " + time_hours
+            value = YoloBmsBot.get_cell_value(cell, segment, snapshot)
+            value_msg = "not valid" if isnan(value) else "{0:.2f}".format(float(value)) + " mV"  # invalid reading
+            return "Latest value of cell " + str(cell + 1) + " in segment " + str(segment + 1) + " is " + value_msg
         except Exception as e:
             print("Cannot answer cell", cell, "in segment", segment)
             print(str(e))
             return "Invalid cell " + str(cell + 1) + " in segment " + str(segment + 1)
 
+
+def register_gauges():
+    """
+    :return: void
+        Registers gauges of values updater, caches and outbox (computed only when metrics are read)
+    """
+
+    metrics.REGISTRY.gauge(
+        "snapshot_age_seconds", "Seconds since values have been updated",
+        lambda: (datetime.now() - values_updater.get_snapshot().time).total_seconds()
+    )
+    metrics.REGISTRY.gauge(
+        "snapshot_version", "Number of values updates", lambda: values_updater.get_snapshot().version
+    )
+    metrics.REGISTRY.gauge(
+        "response_cache_hit_rate", "Share of replies found in cache", lambda: response_cache.get_stats()["hit_rate"]
+    )
+    metrics.REGISTRY.gauge(
+        "outbox_pending_messages", "Messages waiting to be sent", lambda: outbox.pending if outbox is not None else 0
+    )
+    metrics.REGISTRY.gauge("log_records_written", "Log records written to database", lambda: logs.WRITER.written)
+
+
 if __name__ == '__main__':
     logs.setup_log_files()
+    tracing.configure(TRACE_FILE, TRACE_SAMPLE_RATE)
     battery_pack = BatteryPack([18, 18, 18, 18, 18, 18])
-    values_updater = BatteryPackUpdater(battery_pack, UPDATE_INTERVAL_MINUTES)  # module to update cells values
-    values_updater.update_values()
+    data_source = CsvDataSource(LOCAL_DATA_FOLDER) if LOCAL_DATA_FOLDER else GSheetsDataSource()
+    history_store = HistoryStore()
+    rollups_engine = RollupEngine(battery_pack.number_of_cells_per_segment)
+    rollups_engine.start_loading(history_store)  # rollups of rows fetched in previous runs, in background
+    values_updater = BatteryPackUpdater(
+        battery_pack, UPDATE_INTERVAL_MINUTES, max_staleness=MAX_STALENESS_MINUTES, history=history_store,
+        source=data_source, timeseries=CellTimeSeries(len(battery_pack.segments), battery_pack.max_cells),
+        rollups=rollups_engine, warm_start=WarmStartStore()
+    )  # module to update cells values
+    values_updater.restore()  # reply with values saved before restart while new ones are fetched
+
+    outbox = MessageOutbox()  # replies are sent in background within Telegram rate limits
+    outbox.start()
+    if EXECUTION_MODE == "asyncio":
+        async_runner = AsyncRunner()
+        async_runner.start()
+
+    register_gauges()
+    metrics_server = None
+    if METRICS_HTTP_PORT is not None:
+        metrics_server = metrics.start_http_server(METRICS_HTTP_PORT, METRICS_HTTP_HOST)  # GET /metrics
 
     bot = YoloBmsBot()
+    alert_manager = AlertManager(send=bot.send_message)
+    values_updater.add_listener(alert_manager.on_snapshot)  # alerts are evaluated once new values are fetched
+    values_updater.start()  # keep values updated in background
+    values_updater.force_update()  # fetch new values now, without waiting for them
     bot.run()
+    values_updater.stop()
+    if async_runner is not None:
+        async_runner.stop()
+    outbox.stop(OUTBOX_STOP_TIMEOUT_SECONDS)
+    logs.close_log_files()  # write records still waiting
+    tracing.TRACER.close()  # write spans still waiting
+    if metrics_server is not None:
+        metrics_server.shutdown()
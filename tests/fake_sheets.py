@@ -0,0 +1,116 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import re
+
+RANGE_PATTERN = re.compile(r"^([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+
+def get_column_index(column):
+    """
+    :param column: str
+        Column letters (e.g "A", "S")
+    :return: int
+        Position of column (starts from 0)
+    """
+
+    index = 0
+    for letter in column:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+class FakeRequest(object):
+    """
+    Request of values of a range, answered as Google Sheets does
+    """
+
+    def __init__(self, service, spreadsheet, range_name):
+        object.__init__(self)
+
+        self.service = service
+        self.spreadsheet = spreadsheet
+        self.range_name = range_name
+
+    def execute(self, *args, **kwargs):
+        self.service.requests.append((self.spreadsheet, self.range_name))
+        match = RANGE_PATTERN.match(self.range_name)
+        if match is None or match.group(2) == "0" or match.group(4) == "0":
+            raise ValueError("Unable to parse range: " + self.range_name)
+
+        first_column, first_row, last_column, last_row = match.groups()
+        last_column = last_column if last_column is not None else first_column
+        first_row = int(first_row) if first_row else 1
+        if last_row:
+            last_row = int(last_row)
+        elif match.group(3) is not None:
+            last_row = None  # up to the last row (e.g "B2:B")
+        else:
+            last_row = first_row
+
+        rows = self.service.sheets.get(self.spreadsheet, [])
+        rows = rows[first_row - 1:last_row]
+        values = [row[get_column_index(first_column):get_column_index(last_column) + 1] for row in rows]
+        values = [[v for v in row] for row in values]
+        for row in values:  # trailing empty cells are not returned
+            while row and row[-1] == "":
+                row.pop()
+        while values and not values[-1]:  # trailing empty rows are not returned
+            values.pop()
+        return {"values": values} if values else {}
+
+
+class FakeValues(object):
+    def __init__(self, service):
+        object.__init__(self)
+
+        self.service = service
+
+    def get(self, spreadsheetId, range):
+        return FakeRequest(self.service, spreadsheetId, range)
+
+
+class FakeSpreadsheets(object):
+    def __init__(self, service):
+        object.__init__(self)
+
+        self.service = service
+
+    def values(self):
+        return FakeValues(self.service)
+
+
+class FakeSheetsService(object):
+    """
+    In-memory Google Sheets service: each spreadsheet is a list of rows (first one is row 1), each row a list of
+    cells starting from column A
+    """
+
+    def __init__(self, sheets=None):
+        """
+        :param sheets: {}
+            Spreadsheet id -> rows
+        """
+
+        object.__init__(self)
+
+        self.sheets = sheets if sheets is not None else {}
+        self.requests = []  # (spreadsheet, range) of each request executed
+
+    def spreadsheets(self):
+        return FakeSpreadsheets(self)
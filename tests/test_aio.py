@@ -0,0 +1,65 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+import unittest
+
+from yolobmsbot.aio import AsyncRunner
+
+
+class TestAsyncRunner(unittest.TestCase):
+    def setUp(self):
+        self.runner = AsyncRunner(max_workers=2)
+        self.runner.start()
+
+    def tearDown(self):
+        self.runner.stop()
+
+    def test_map_blocking(self):
+        def square(x):
+            if x < 0:
+                raise ValueError("negative")
+            return x * x
+
+        results = self.runner.submit(self.runner.map_blocking(square, [1, -2, 3])).result(5)
+        self.assertEqual(results[0], (1, None))
+        self.assertIsInstance(results[1][1], ValueError)  # other calls go on
+        self.assertEqual(results[2], (9, None))
+
+    def test_wrap(self):
+        handled = []
+        done = threading.Event()
+
+        async def coroutine_handler(bot, update):
+            handled.append(("coroutine", update))
+
+        def blocking_handler(bot, update):
+            handled.append(("blocking", threading.current_thread() is not self.runner.thread))
+            done.set()
+
+        self.runner.wrap(coroutine_handler)(None, 1)
+        self.runner.wrap(blocking_handler)(None, 2)
+        self.assertTrue(done.wait(5))
+        self.runner.stop()  # waits for running handlers
+
+        self.assertIn(("coroutine", 1), handled)
+        self.assertIn(("blocking", True), handled)  # blocking handlers do not run on event loop
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from yolobmsbot.alerts import AlertManager, AlertQuantity, AlertRule, get_quantities, parse_rule
+from yolobmsbot.batterypack import BatteryPack, BatteryPackSnapshot, CellThresholds
+
+
+def get_snapshot(voltages, version):
+    """
+    :param voltages: [] of []
+        Voltages of cells of each segment
+    :param version: int
+        Version of snapshot (and of its segments)
+    :return: BatteryPackSnapshot
+        Snapshot with given values
+    """
+
+    pack = BatteryPack([len(v) for v in voltages])
+    for s, segment_voltages in enumerate(voltages):
+        pack.segments[s].update_values(None, segment_voltages)
+    return BatteryPackSnapshot(pack, datetime(2017, 4, 29, 10, 30), version, segment_versions=[version] * len(voltages))
+
+
+class TestAlertRules(unittest.TestCase):
+    def test_parse_rule(self):
+        thresholds = CellThresholds(min_voltage=3500, max_voltage=4200)
+
+        self.assertEqual(parse_rule(["under"], thresholds).get_key(), (0, 3500, None))
+        self.assertEqual(parse_rule(["over", "4100"], thresholds).get_key(), (0, None, 4100))
+        self.assertEqual(parse_rule(["segment", "3600", "4000"], thresholds).get_key(), (1, 3600, 4000))
+        self.assertEqual(parse_rule(["imbalance", "50"], thresholds).get_key(), (2, None, 50))
+        for args in [[], ["segment", "4000", "3600"], ["imbalance"], ["under", "abc"], ["sideways"]]:
+            self.assertRaises(ValueError, parse_rule, args, thresholds)
+
+    def test_quantities(self):
+        pack = get_snapshot([[3700, 3600], [3800, 3900, 3700]], 1).pack
+        values = get_quantities(pack, set(AlertQuantity))
+
+        self.assertEqual(len(values[AlertQuantity.cell_voltage]), 5)  # padding slot is not a cell
+        self.assertEqual(values[AlertQuantity.segment_average], [(0, 3650), (1, 3800)])
+        self.assertEqual(values[AlertQuantity.pack_imbalance], (300, (0, 1, 3600), (1, 1, 3900)))
+
+    def test_quantities_skip_invalid_readings(self):
+        pack = get_snapshot([[3700, ""], [3800, 3900, 3700]], 1).pack
+        values = get_quantities(pack, set(AlertQuantity))
+
+        self.assertEqual(len(values[AlertQuantity.cell_voltage]), 4)
+        self.assertEqual(values[AlertQuantity.segment_average][0], (0, 3700))  # not halved by blank reading
+        self.assertEqual(values[AlertQuantity.pack_imbalance][0], 200)
+
+    def test_rule_to_dict(self):
+        rule = AlertRule(AlertQuantity.segment_average, 3600, 4000)
+        self.assertEqual(AlertRule.from_dict(rule.to_dict()).get_key(), rule.get_key())
+
+
+class TestAlertManager(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "subscriptions.json")
+        self.sent = []
+        self.manager = AlertManager(self.path, send=lambda chat, text: self.sent.append((chat, text)))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_alert_sent_once(self):
+        self.manager.subscribe(1, AlertRule(AlertQuantity.cell_voltage, low=3500))
+        self.manager.subscribe(2, AlertRule(AlertQuantity.cell_voltage, low=3500))
+
+        self.manager.on_snapshot(get_snapshot([[3700, 3400]], 1))
+        self.assertEqual(sorted([chat for chat, _ in self.sent]), [1, 2])
+        self.assertIn("cell 2 in segment 1: 3400.00 mV", self.sent[0][1])
+
+        self.manager.on_snapshot(get_snapshot([[3700, 3450]], 2))  # same cells trigger rule
+        self.manager.on_snapshot(get_snapshot([[3700, 3450]], 2))  # already evaluated
+        self.assertEqual(len(self.sent), 2)
+
+        self.manager.on_snapshot(get_snapshot([[3700, 3600]], 3))
+        self.assertEqual(len(self.sent), 4)
+        self.assertTrue(self.sent[-1][1].startswith("Back to normal"))
+
+    def test_same_values(self):
+        self.manager.subscribe(1, AlertRule(AlertQuantity.cell_voltage, low=3500))
+        self.manager.on_snapshot(get_snapshot([[3700, 3400]], 1))
+        rule = AlertRule(AlertQuantity.cell_voltage, high=3600)
+        self.manager.subscribe(2, rule)
+
+        snapshot = get_snapshot([[3700, 3600]], 2)
+        snapshot.segment_versions = [1]  # no segment changed: only new rule is evaluated
+        self.manager.on_snapshot(snapshot)
+        self.assertEqual(self.sent[-1], (2, "Alert: cell voltage over 3600 mV\ncell 1 in segment 1: 3700.00 mV"))
+        self.assertEqual(len(self.sent), 2)
+
+    def test_one_message_per_chat(self):
+        self.manager.subscribe(1, AlertRule(AlertQuantity.cell_voltage, low=3500))
+        self.manager.subscribe(1, AlertRule(AlertQuantity.pack_imbalance, high=100))
+
+        self.manager.on_snapshot(get_snapshot([[3700, 3400]], 1))
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0][1].count("Alert: "), 2)
+
+    def test_unsubscribe(self):
+        rule = AlertRule(AlertQuantity.cell_voltage, high=4000)
+        self.assertEqual(self.manager.subscribe(1, rule), (True, None))
+        self.assertEqual(self.manager.subscribe(1, rule), (False, None))  # already subscribed
+        self.manager.subscribe(1, AlertRule(AlertQuantity.cell_voltage, low=3000))
+
+        self.assertEqual(self.manager.unsubscribe(1, rule), 1)
+        self.assertEqual(len(self.manager.get_rules(1)), 1)
+        self.assertEqual(self.manager.unsubscribe(1), 1)
+        self.assertEqual(self.manager.rules, {})  # nobody is subscribed to rules anymore
+        self.assertEqual(self.manager.index, {})
+
+    def test_subscriptions_saved(self):
+        self.manager.subscribe(1, AlertRule(AlertQuantity.segment_average, 3600, 4000))
+        self.manager.subscribe(2, AlertRule(AlertQuantity.cell_voltage, low=3500))
+
+        manager = AlertManager(self.path)
+        self.assertEqual([r.get_key() for r in manager.get_rules(1)], [(1, 3600, 4000)])
+        self.assertEqual([r.get_key() for r in manager.get_rules(2)], [(0, 3500, None)])
+
+    def test_no_values_yet(self):
+        self.manager.subscribe(1, AlertRule(AlertQuantity.cell_voltage, low=3500))
+        snapshot = get_snapshot([[3700, 3400]], 1)
+        snapshot.time = datetime.fromtimestamp(0)  # every fetch has failed so far
+
+        self.manager.on_snapshot(snapshot)
+        self.assertEqual(self.sent, [])
+
+    def test_segments_not_fetched(self):
+        self.manager.subscribe(1, AlertRule(AlertQuantity.pack_imbalance, high=100))
+        snapshot = get_snapshot([[3700, 3650], [3400, 3400]], 1)
+        snapshot.segment_versions = [1, 0]  # second segment has never been fetched
+
+        self.manager.on_snapshot(snapshot)
+        self.assertEqual(self.sent, [])
+
+    def test_states_saved(self):
+        rule = AlertRule(AlertQuantity.cell_voltage, low=3500)
+        self.manager.subscribe(1, rule)
+        self.manager.on_snapshot(get_snapshot([[3700, 3400]], 1))
+
+        manager = AlertManager(self.path, send=lambda chat, text: self.sent.append((chat, text)))  # restart
+        self.assertEqual(manager.subscribe(1, rule), (False, frozenset([(0, 1)])))
+        manager.on_snapshot(get_snapshot([[3700, 3400]], 1))
+        self.assertEqual(len(self.sent), 1)  # alert is not sent again
+
+
+if __name__ == "__main__":
+    unittest.main()
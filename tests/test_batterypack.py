@@ -0,0 +1,145 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import unittest
+
+from datetime import datetime
+
+from yolobmsbot.batterypack import AbnormalReason, BatteryCellValue, BatteryPack, BatteryPackSnapshot, CellThresholds
+
+
+class TestBatteryPack(unittest.TestCase):
+    def setUp(self):
+        self.pack = BatteryPack([3, 2])
+        self.pack.segments[0].update_values(None, ["3700", "3710", "3720"])
+        self.pack.segments[1].update_values([30, 40], ["3800", "3810"])
+
+    def test_layout(self):
+        self.assertEqual(self.pack.max_cells, 3)
+        self.assertEqual(self.pack.mask.tolist(), [1, 1, 1, 1, 1, 0])  # segment 1 has a padding slot
+        self.assertEqual(self.pack.voltages.tolist()[:5], [3700, 3710, 3720, 3800, 3810])
+        self.assertTrue(math.isnan(self.pack.voltages[5]))
+
+    def test_not_read_yet(self):
+        pack = BatteryPack([3, 2])
+
+        self.assertTrue(all([math.isnan(v) for v in pack.voltages]))  # not 0 mV
+        self.assertTrue(math.isnan(pack.segments[0].get_average(BatteryCellValue.voltage)))
+        self.assertEqual(pack.get_total(BatteryCellValue.voltage), 0)
+        self.assertEqual(pack.get_list_of_abnormal_cells(), [])
+
+    def test_views(self):
+        cell = self.pack.segments[1].cells[1]
+        self.assertEqual((cell.temperature, cell.voltage), (40, 3810))
+
+        cell.update_values(45, "3815")
+        self.assertEqual(self.pack.segments[1].get(BatteryCellValue.voltage), [3800, 3815])
+        self.assertEqual(self.pack.voltages[4], 3815)
+
+    def test_totals(self):
+        self.assertEqual(self.pack.segments[0].get_total(BatteryCellValue.voltage), 11130)
+        self.assertEqual(self.pack.segments[1].get_average(BatteryCellValue.voltage), 3805)
+        self.assertEqual(self.pack.get_total(BatteryCellValue.voltage), 18740)
+        self.assertEqual(self.pack.get_averages(BatteryCellValue.voltage), [3710, 3805])
+        self.assertEqual(self.pack.get_total(BatteryCellValue.temperature), 70)
+
+    def test_unreadable_values(self):
+        self.pack.segments[0].update_values(None, ["3700", "", "inf"])
+
+        voltages = self.pack.segments[0].get(BatteryCellValue.voltage)
+        self.assertEqual(voltages[0], 3700)
+        self.assertTrue(math.isnan(voltages[1]) and math.isnan(voltages[2]))  # not 0 mV
+        self.assertEqual(self.pack.segments[0].get_total(BatteryCellValue.voltage), 3700)  # skipped
+        self.assertEqual(self.pack.segments[0].get_average(BatteryCellValue.voltage), 3700)
+
+    def test_cell_in_bounds(self):
+        self.assertTrue(self.pack.is_cell_in_bounds(2, 0))
+        self.assertFalse(self.pack.is_cell_in_bounds(2, 1))  # padding slot
+        self.assertFalse(self.pack.is_cell_in_bounds(0, 2))  # no such segment
+        self.assertFalse(self.pack.is_cell_in_bounds(0, -1))
+
+    def test_copy(self):
+        other = self.pack.copy()
+        other.segments[0].cells[0].update_values(0, 3600)
+
+        self.assertEqual(self.pack.segments[0].cells[0].voltage, 3700)  # copies do not share values
+        self.assertEqual(other.get_current_voltages(), [[3600, 3710, 3720], [3800, 3810]])
+
+
+class TestAbnormalCells(unittest.TestCase):
+    def setUp(self):
+        self.pack = BatteryPack([3, 3, 3, 3, 3, 3, 2])
+        for segment in self.pack.segments:
+            segment.update_values([25] * 3, [3700] * 3)
+
+    def test_all_segments(self):
+        self.pack.segments[6].cells[1].update_values(25, 3400)
+        self.pack.segments[0].cells[2].update_values(70, 4300)
+
+        abnormal_cells = self.pack.get_list_of_abnormal_cells()
+        self.assertEqual([(c["segment"], c["cell"]) for c in abnormal_cells], [(0, 2), (6, 1)])  # segments > 5 too
+        self.assertEqual(abnormal_cells[0]["reasons"], [AbnormalReason.over_voltage, AbnormalReason.over_temperature])
+        self.assertEqual(abnormal_cells[1]["reasons"], [AbnormalReason.under_voltage])
+        self.assertEqual(abnormal_cells[1]["voltage"], 3400)
+
+    def test_padding_slots(self):
+        self.assertEqual(self.pack.get_list_of_abnormal_cells(), [])  # empty slot of last segment is not a cell
+
+    def test_thresholds(self):
+        strict = CellThresholds(min_voltage=3750)
+        self.assertEqual(len(self.pack.get_list_of_abnormal_cells(strict)), 20)
+
+        per_segment = [CellThresholds()] * 6 + [strict]
+        self.assertEqual([c["segment"] for c in self.pack.get_list_of_abnormal_cells(per_segment)], [6, 6])
+        self.assertRaises(ValueError, self.pack.get_list_of_abnormal_cells, [strict])
+
+    def test_snapshot_cache(self):
+        snapshot = BatteryPackSnapshot(self.pack, datetime.now(), 1)
+        self.pack.segments[0].cells[0].update_values(25, 3400)
+
+        first = snapshot.get_abnormal_cells()
+        self.assertIs(snapshot.get_abnormal_cells(CellThresholds()), first)  # equal thresholds share results
+        self.assertEqual(len(snapshot.get_abnormal_cells(CellThresholds(min_voltage=3300))), 0)
+
+    def test_changed_cells(self):
+        other = self.pack.copy()
+        other.segments[0].cells[1].update_values(0, 3600)
+        other.segments[1].cells[1].update_values(50, 3810)
+
+        self.assertEqual(other.get_changed_cells(self.pack), [(0, 1), (1, 1)])  # voltage or temperature changed
+        self.assertEqual(other.get_changed_cells(self.pack, [1]), [(1, 1)])
+        self.assertEqual(self.pack.copy().get_changed_cells(self.pack), [])
+
+    def test_snapshot_cached_values(self):
+        snapshot = BatteryPackSnapshot(self.pack, datetime.now(), 1)
+        computed = []
+
+        self.assertEqual(snapshot.get_cached(("key",), lambda: computed.append(1) or "value"), "value")
+        self.assertEqual(snapshot.get_cached(("key",), lambda: computed.append(1) or "other"), "value")
+        self.assertEqual(len(computed), 1)  # computed once per snapshot
+        snapshot.set_cached(("key",), "new value")
+        self.assertEqual(snapshot.get_cached(("key",), lambda: None), "new value")
+
+        same_values = BatteryPackSnapshot(self.pack, datetime.now(), 2)
+        same_values.inherit_cache(snapshot)
+        self.assertEqual(same_values.get_cached(("key",), lambda: None), "new value")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from yolobmsbot.cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_size=2)
+        self.computed = []
+
+    def compute(self, reply):
+        def build():
+            self.computed.append(reply)
+            return reply
+        return build
+
+    def test_hits(self):
+        self.assertEqual(self.cache.get(("cell", 1, 2), 1, self.compute("a")), "a")
+        self.assertEqual(self.cache.get(("cell", 1, 2), 1, self.compute("b")), "a")  # built once
+        self.assertEqual(self.computed, ["a"])
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+        self.assertEqual(self.cache.get_stats()["misses"], 1)
+
+    def test_newer_snapshot(self):
+        self.cache.get(("alerts",), 1, self.compute("old"))
+
+        self.assertEqual(self.cache.get(("alerts",), 2, self.compute("new")), "new")  # old replies are dropped
+        self.assertEqual(self.cache.get(("alerts",), 1, self.compute("late")), "late")  # older snapshot
+        self.assertEqual(self.cache.get(("alerts",), 2, self.compute("newer")), "new")  # late reply is not kept
+
+    def test_segment_versions(self):
+        self.cache.get(("cell",), (1, 1), self.compute("old"))
+
+        self.assertEqual(self.cache.get(("cell",), (1, 1), self.compute("same")), "old")  # no segment updated
+        self.assertEqual(self.cache.get(("cell",), (1, 2), self.compute("new")), "new")  # a segment updated
+        self.assertEqual(self.cache.get(("cell",), (1, 1), self.compute("late")), "late")  # older values
+
+    def test_lru(self):
+        self.cache.get(("a",), 1, self.compute("a"))
+        self.cache.get(("b",), 1, self.compute("b"))
+        self.cache.get(("a",), 1, self.compute("a"))  # "b" is now least recently used
+        self.cache.get(("c",), 1, self.compute("c"))
+
+        self.assertEqual(self.cache.get_stats()["size"], 2)
+        self.cache.get(("a",), 1, self.compute("a"))
+        self.cache.get(("b",), 1, self.compute("b"))
+        self.assertEqual(self.computed, ["a", "b", "c", "b"])
+
+    def test_clear(self):
+        self.cache.get(("a",), 1, self.compute("a"))
+        self.cache.clear()
+
+        self.assertEqual(self.cache.get_stats()["hits"] + self.cache.get_stats()["misses"], 0)
+        self.assertEqual(self.cache.get(("a",), 0, self.compute("a")), "a")  # any version after clear
+
+
+if __name__ == "__main__":
+    unittest.main()
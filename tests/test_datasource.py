@@ -0,0 +1,93 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from yolobmsbot import datasource
+from yolobmsbot.datasource import CsvDataSource
+
+HEADER = "time,cell 1,cell 2,cell 3\n"
+
+
+class TestCsvDataSource(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.paths = [os.path.join(self.folder, "segment" + str(i) + ".csv") for i in range(2)]
+        for path in self.paths:
+            self.write(path, HEADER)
+        self.source = CsvDataSource(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    @staticmethod
+    def write(path, text):
+        with open(path, "a") as f:
+            f.write(text)
+
+    def test_paths(self):
+        self.assertEqual(self.source.paths, self.paths)  # one file per segment, sorted by name
+
+    def test_last_values(self):
+        self.write(self.paths[0], "100,3700,3710,3720\n160,3701,3711,3721\n170,3702")  # last row is being written
+
+        self.assertEqual(self.source.get_last_values(0), (["3701", "3711", "3721"], "160"))
+        self.assertRaises(ValueError, self.source.get_last_values, 1)  # only header
+
+    def test_last_values_long_file(self):
+        self.write(self.paths[0], "".join([str(t) + ",3700,3710,3720\n" for t in range(1000)]))
+        self.write(self.paths[0], "1000," + "1" * (2 * datasource.TAIL_BLOCK_SIZE) + ",3710,3720\n")
+
+        values, time = self.source.get_last_values(0)
+        self.assertEqual(time, "1000")  # last row is longer than a tail block
+        self.assertEqual(values[1:], ["3710", "3720"])
+
+    def test_rows_since(self):
+        self.write(self.paths[0], "100,3700,3710,3720\n160,3701,3711,3721\n")
+
+        self.assertEqual(self.source.get_rows_since(0, 0), [
+            (2, "100", ["3700", "3710", "3720"]), (3, "160", ["3701", "3711", "3721"])
+        ])  # header is skipped
+        self.write(self.paths[0], "220,3702,3712,3722\n280,37")
+        self.assertEqual(self.source.get_rows_since(0, 3), [(4, "220", ["3702", "3712", "3722"])])
+        self.assertEqual(self.source.offsets[0][0], 4)  # incomplete row is read next time
+        self.assertEqual([row for row, _, _ in self.source.get_rows_since(0, 2)], [3, 4])  # cursor before offset
+
+    def test_blank_cells(self):
+        self.write(self.paths[0], "100,,3710,3720\n160,3701,,\n")
+
+        self.assertEqual(self.source.get_rows_since(0, 0), [
+            (2, "100", ["", "3710", "3720"]), (3, "160", ["3701", "", ""])
+        ])  # not mistaken for headers
+        self.assertEqual(self.source.get_last_values(0), (["3701", "", ""], "160"))
+
+    def test_header(self):
+        self.write(self.paths[1], "2017-01-01 10:00:00,3700,3710,3720\nnot a time,3700,3710,3720\n")
+        with open(self.paths[0], "w") as f:
+            f.write("100,3700,3710,3720\n")  # first line is the header, even if it looks like values
+
+        self.assertEqual(self.source.get_rows_since(0, 0), [])
+        self.assertEqual(self.source.get_rows_since(1, 0), [(2, "2017-01-01 10:00:00", ["3700", "3710", "3720"])])
+        self.assertEqual(self.source.get_last_values(1)[1], "2017-01-01 10:00:00")  # rows without time are skipped
+
+
+if __name__ == "__main__":
+    unittest.main()
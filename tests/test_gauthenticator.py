@@ -0,0 +1,167 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from yolobmsbot.google import gauthenticator
+
+try:
+    from googleapiclient import discovery
+except ImportError:  # Google client libraries are not installed
+    discovery = None
+
+DOCUMENT = "{\"name\": \"sheets\", \"version\": \"v4\"}"
+
+
+class FakeDriver(object):
+    def __init__(self, document, http=None, requestBuilder=None, **kwargs):
+        object.__init__(self)
+
+        self.document = document
+        self.http = http
+        self.request_builder = requestBuilder
+
+
+@unittest.skipIf(discovery is None, "Google client libraries are not installed")
+class TestDrivers(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.credentials_path = os.path.join(self.folder, "credentials.json")
+        with open(self.credentials_path, "w") as out:
+            out.write("{}")
+        self.oauth = gauthenticator.GoogleApiOAuth("scope", "secrets.json", self.credentials_path)
+        self.builds = []
+
+        def build(*args, **kwargs):
+            driver = FakeDriver(*args, **kwargs)
+            self.builds.append(driver)
+            return driver
+
+        self.patches = [
+            mock.patch.object(discovery, "build_from_document", build, create=True),
+            mock.patch.object(gauthenticator, "get_discovery_document", lambda name, version: DOCUMENT),
+            mock.patch.object(gauthenticator.GoogleApiOAuth, "get_user_credentials", lambda oauth: "credentials"),
+            mock.patch.object(gauthenticator.GoogleApiOAuth, "authenticate", staticmethod(lambda c: object()))
+        ]
+        for patch in self.patches:
+            patch.start()
+        gauthenticator.DRIVERS.clear()
+        gauthenticator.THREAD_HTTP.__dict__.clear()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        gauthenticator.DRIVERS.clear()
+        gauthenticator.THREAD_HTTP.__dict__.clear()
+        shutil.rmtree(self.folder)
+
+    def test_driver_cached(self):
+        driver = self.oauth.get_driver("sheets", "v4")
+
+        self.assertIs(self.oauth.get_driver("sheets", "v4"), driver)
+        self.assertIsNot(self.oauth.get_driver("gmail", "v1"), driver)  # one driver per API
+        self.assertEqual(len(self.builds), 2)
+
+    def test_driver_built_again_when_credentials_change(self):
+        driver = self.oauth.get_driver("sheets", "v4")
+        stat = os.stat(self.credentials_path)
+        os.utime(self.credentials_path, (stat.st_atime, stat.st_mtime + 10))  # credentials refreshed
+
+        self.assertIsNot(self.oauth.get_driver("sheets", "v4"), driver)
+        self.assertEqual(len(self.builds), 2)
+
+    def test_http_per_thread(self):
+        key = ("scope", 1.0)
+        http = gauthenticator.GoogleApiOAuth.get_thread_http(key, "credentials")
+        others = []
+        thread = threading.Thread(
+            target=lambda: others.append(gauthenticator.GoogleApiOAuth.get_thread_http(key, "credentials"))
+        )
+        thread.start()
+        thread.join()
+
+        self.assertIs(gauthenticator.GoogleApiOAuth.get_thread_http(key, "credentials"), http)  # kept alive
+        self.assertIsNot(others[0], http)  # threads do not share connections
+
+    def test_http_of_old_credentials_dropped(self):
+        gauthenticator.GoogleApiOAuth.get_thread_http(("scope", 1.0), "credentials")
+        gauthenticator.GoogleApiOAuth.get_thread_http(("other scope", 1.0), "credentials")
+        gauthenticator.GoogleApiOAuth.get_thread_http(("scope", 2.0), "new credentials")
+
+        self.assertEqual(
+            sorted(gauthenticator.THREAD_HTTP.connections.keys()), [("other scope", 1.0), ("scope", 2.0)]
+        )
+
+
+class TestDiscoveryDocuments(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.downloads = []
+
+        def download(name, version):
+            self.downloads.append((name, version))
+            return DOCUMENT
+
+        self.patches = [
+            mock.patch.object(gauthenticator, "DISCOVERY_FOLDER", os.path.join(self.folder, "discovery")),
+            mock.patch.object(gauthenticator, "download_discovery_document", download),
+            mock.patch.object(gauthenticator, "get_static_discovery_document", lambda name, version: None)
+        ]
+        for patch in self.patches:
+            patch.start()
+        gauthenticator.DISCOVERY_DOCUMENTS.clear()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        gauthenticator.DISCOVERY_DOCUMENTS.clear()
+        shutil.rmtree(self.folder)
+
+    def test_downloaded_once(self):
+        self.assertEqual(gauthenticator.get_discovery_document("sheets", "v4"), DOCUMENT)
+        self.assertEqual(gauthenticator.get_discovery_document("sheets", "v4"), DOCUMENT)  # from memory
+        gauthenticator.DISCOVERY_DOCUMENTS.clear()  # bot restarted
+        self.assertEqual(gauthenticator.get_discovery_document("sheets", "v4"), DOCUMENT)  # from disk
+
+        self.assertEqual(self.downloads, [("sheets", "v4")])
+        self.assertTrue(os.path.exists(gauthenticator.get_discovery_path("sheets", "v4")))
+
+    def test_corrupted_file(self):
+        os.makedirs(gauthenticator.DISCOVERY_FOLDER)
+        with open(gauthenticator.get_discovery_path("sheets", "v4"), "w") as out:
+            out.write("{\"name\": ")  # partial download of an older version
+
+        self.assertEqual(gauthenticator.get_discovery_document("sheets", "v4"), DOCUMENT)
+        self.assertEqual(self.downloads, [("sheets", "v4")])
+        with open(gauthenticator.get_discovery_path("sheets", "v4"), "r") as inp:
+            self.assertEqual(inp.read(), DOCUMENT)  # replaced
+
+    def test_static_document(self):
+        with mock.patch.object(gauthenticator, "get_static_discovery_document", lambda name, version: DOCUMENT):
+            self.assertEqual(gauthenticator.get_discovery_document("gmail", "v1"), DOCUMENT)
+
+        self.assertEqual(self.downloads, [])  # bundled with client
+
+
+if __name__ == "__main__":
+    unittest.main()
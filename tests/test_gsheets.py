@@ -0,0 +1,154 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from tests.fake_sheets import FakeSheetsService
+
+try:
+    from yolobmsbot.google import gauthenticator, gsheets
+except ImportError:  # Google client libraries are not installed
+    gsheets = None
+
+SPREADSHEET = "segment"
+
+
+def get_rows(number_of_rows):
+    """
+    :param number_of_rows: int
+        Rows of values (without header)
+    :return: [] of []
+        Header and rows of a segment spreadsheet
+    """
+
+    return [["time"] + ["cell " + str(c + 1) for c in range(18)]] + [
+        ["2017-01-01 10:00:" + "{0:02d}".format(r)] + [str(3700 + r)] * 18 for r in range(number_of_rows)
+    ]
+
+
+@unittest.skipIf(gsheets is None, "Google client libraries are not installed")
+class TestLastRow(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeSheetsService({SPREADSHEET: get_rows(3)})
+        self.create_gdrive_driver = gauthenticator.create_gdrive_driver
+        gauthenticator.create_gdrive_driver = lambda: self.service
+        gsheets.reset_last_row_hints()
+
+    def tearDown(self):
+        gauthenticator.create_gdrive_driver = self.create_gdrive_driver
+        gsheets.reset_last_row_hints()
+
+    def test_single_request(self):
+        self.assertEqual(gsheets.get_last_row_of_column(SPREADSHEET, "B"), 4)
+        self.assertEqual(self.service.requests, [(SPREADSHEET, "B1:B")])
+
+    def test_hint(self):
+        gsheets.get_last_row_of_column(SPREADSHEET, "B")
+        self.service.sheets[SPREADSHEET] += get_rows(5)[4:]  # 2 new rows
+
+        self.assertEqual(gsheets.get_last_row_of_column(SPREADSHEET, "B"), 6)
+        self.assertEqual(self.service.requests[-1], (SPREADSHEET, "B4:B"))  # only rows from last known one
+
+    def test_stale_hint(self):
+        gsheets.get_last_row_of_column(SPREADSHEET, "B")
+        self.service.sheets[SPREADSHEET] = get_rows(1)  # rows have been deleted
+
+        self.assertEqual(gsheets.get_last_row_of_column(SPREADSHEET, "B"), 2)
+        self.assertEqual(self.service.requests[-2:], [(SPREADSHEET, "B4:B"), (SPREADSHEET, "B1:B")])
+
+    def test_empty_column(self):
+        self.service.sheets[SPREADSHEET] = []
+
+        self.assertEqual(gsheets.get_last_row_of_column(SPREADSHEET, "B"), 0)
+        self.assertEqual(gsheets.get_last_row_of_column(SPREADSHEET, "B"), 0)
+        self.assertEqual(self.service.requests, [(SPREADSHEET, "B1:B")] * 2)  # row 0 is never used as hint
+
+    def test_invalid_hint(self):
+        gsheets.LAST_ROW_HINTS[(SPREADSHEET, "B")] = 0
+
+        self.assertEqual(gsheets.get_last_row_of_column(SPREADSHEET, "B"), 4)
+        self.assertEqual(self.service.requests, [(SPREADSHEET, "B1:B")])
+
+
+@unittest.skipIf(gsheets is None, "Google client libraries are not installed")
+class TestRowsSince(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeSheetsService({gsheets.SPREADSHEET_SEGMENT_ID[0]: get_rows(3)})
+        self.create_gdrive_driver = gauthenticator.create_gdrive_driver
+        gauthenticator.create_gdrive_driver = lambda: self.service
+
+    def tearDown(self):
+        gauthenticator.create_gdrive_driver = self.create_gdrive_driver
+
+    def test_all_rows(self):
+        rows = gsheets.get_cells_values_since(0, 0)
+
+        self.assertEqual([(row, time) for row, time, _ in rows], [
+            (2, "2017-01-01 10:00:00"), (3, "2017-01-01 10:00:01"), (4, "2017-01-01 10:00:02")
+        ])  # header is skipped
+        self.assertEqual(rows[0][2], ["3700"] * 18)
+        self.assertEqual(self.service.requests, [(gsheets.SPREADSHEET_SEGMENT_ID[0], "A2:S")])
+
+    def test_new_rows(self):
+        self.assertEqual([row for row, _, _ in gsheets.get_cells_values_since(0, 3)], [4])
+        self.assertEqual(gsheets.get_cells_values_since(0, 4), [])
+        self.assertEqual(self.service.requests[0], (gsheets.SPREADSHEET_SEGMENT_ID[0], "A4:S"))
+
+    def test_partial_row(self):
+        sheet = self.service.sheets[gsheets.SPREADSHEET_SEGMENT_ID[0]]
+        sheet.append(["2017-01-01 10:00:03"] + ["3703"] * 10)  # row 5 is being written
+        self.assertEqual([row for row, _, _ in gsheets.get_cells_values_since(0, 3)], [4])
+
+        sheet[-1] += ["3703"] * 8
+        rows = gsheets.get_cells_values_since(0, 4)  # cursor has not moved past row 5
+        self.assertEqual([(row, len(values)) for row, _, values in rows], [(5, 18)])
+
+
+@unittest.skipIf(gsheets is None, "Google client libraries are not installed")
+class TestLastValues(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeSheetsService({
+            gsheets.SPREADSHEET_PACK_ID: [
+                ["time"] + ["segment " + str(s + 1) for s in range(8)], ["100"] + ["3700"] * 8
+            ],
+            gsheets.SPREADSHEET_SEGMENT_ID[0]: get_rows(2)
+        })
+        self.create_gdrive_driver = gauthenticator.create_gdrive_driver
+        gauthenticator.create_gdrive_driver = lambda: self.service
+        gsheets.reset_last_row_hints()
+
+    def tearDown(self):
+        gauthenticator.create_gdrive_driver = self.create_gdrive_driver
+        gsheets.reset_last_row_hints()
+
+    def test_last_segments_values(self):
+        calls = gsheets.LAST_SEGMENTS_LATENCY.labels().get()[1]
+        requests = gsheets.SHEETS_REQUESTS.labels().get()
+
+        self.assertEqual(gsheets.get_last_segments_values(), (["3700"] * 8, "100"))
+        self.assertEqual(gsheets.LAST_SEGMENTS_LATENCY.labels().get()[1], calls + 1)
+        self.assertEqual(gsheets.SHEETS_REQUESTS.labels().get(), requests + 3)  # last row, values and time
+
+    def test_last_cells_values(self):
+        values, time, row = gsheets.get_last_cells_values(0)
+
+        self.assertEqual((values, time, row), (["3701"] * 18, "2017-01-01 10:00:01", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
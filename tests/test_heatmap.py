@@ -0,0 +1,91 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import struct
+import unittest
+import zlib
+
+from yolobmsbot import heatmap
+from yolobmsbot.batterypack import BatteryPack
+
+
+def read_png(data):
+    """
+    :param data: bytes
+        PNG image (8 bit RGB, no filters)
+    :return: tuple int, int, []
+        Width, height and rows of pixels of image
+    """
+
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks, position = {}, 8
+    while position < len(data):
+        length, tag = struct.unpack(">I4s", data[position:position + 8])
+        chunks[tag] = data[position + 8:position + 8 + length]
+        position += 12 + length
+    width, height = struct.unpack(">II", chunks[b"IHDR"][:8])
+    raw = zlib.decompress(chunks[b"IDAT"])
+    stride = 1 + 3 * width
+    rows = [
+        [tuple(raw[y * stride + 1 + 3 * x:y * stride + 4 + 3 * x]) for x in range(width)] for y in range(height)
+    ]
+    return width, height, rows
+
+
+class TestHeatmap(unittest.TestCase):
+    def setUp(self):
+        self.pack = BatteryPack([3, 2])
+        self.pack.segments[0].update_values(None, [3500, 3850, 4200])
+        self.pack.segments[1].update_values(None, [3400, 3850])
+
+    def get_cell_origin(self, cell, segment):
+        step = heatmap.CELL_SIZE + heatmap.CELL_GAP
+        left = heatmap.MARGIN + 4 * heatmap.FONT_SCALE + heatmap.CELL_GAP  # labels have one digit
+        top = heatmap.MARGIN + 5 * heatmap.FONT_SCALE + heatmap.CELL_GAP
+        return left + cell * step, top + segment * step
+
+    def test_image(self):
+        width, height, rows = read_png(heatmap.render_pack(self.pack))
+
+        x, y = self.get_cell_origin(3, 2)  # past last cell and last segment
+        self.assertEqual(width, x + heatmap.MARGIN)
+        self.assertEqual(height, y + heatmap.LEGEND_HEIGHT + heatmap.MARGIN)
+
+        x, y = self.get_cell_origin(0, 0)
+        self.assertEqual(rows[y + heatmap.CELL_SIZE // 2][x + heatmap.CELL_SIZE // 2], heatmap.COLOR_SCALE[0])
+        x, y = self.get_cell_origin(2, 1)
+        self.assertEqual(rows[y][x], heatmap.MISSING_COLOR)  # segment has less cells
+        x, y = self.get_cell_origin(0, 1)
+        self.assertEqual(rows[y][x], heatmap.OUTLINE_COLOR)  # abnormal cell
+        self.assertEqual(rows[y + heatmap.CELL_SIZE // 2][x + heatmap.CELL_SIZE // 2], heatmap.COLOR_SCALE[0])
+
+    def test_invalid_reading(self):
+        self.pack.segments[0].update_values(None, [3500, "", 4200])
+        _, _, rows = read_png(heatmap.render_pack(self.pack))
+
+        x, y = self.get_cell_origin(1, 0)
+        self.assertEqual(rows[y + heatmap.CELL_SIZE // 2][x + heatmap.CELL_SIZE // 2], heatmap.INVALID_COLOR)
+
+    def test_colors(self):
+        self.assertEqual(heatmap.get_color(3000, 3500, 4200), heatmap.COLOR_SCALE[0])
+        self.assertEqual(heatmap.get_color(4200, 3500, 4200), heatmap.COLOR_SCALE[-1])
+        self.assertEqual(heatmap.get_color(1, 1, 1), heatmap.COLOR_SCALE[len(heatmap.COLOR_SCALE) // 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import shutil
+import tempfile
+import unittest
+
+from yolobmsbot.history import HistoryStore
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = HistoryStore(self.folder, number_of_columns=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_append_and_read(self):
+        self.assertEqual(self.store.get_cursor(0), 0)
+        self.assertIsNone(self.store.get_last(0))
+        self.assertEqual(self.store.append(0, [(2, "100", ["3700", "3710", "3720"]), (3, "160", ["3701", "", "x"])]), 2)
+
+        records = list(self.store.read(0))
+        self.assertEqual([(row, t) for row, t, _ in records], [(2, 100.0), (3, 160.0)])
+        self.assertEqual(records[0][2], [3700.0, 3710.0, 3720.0])
+        self.assertTrue(math.isnan(records[1][2][1]))  # blank and unreadable values are nan
+        self.assertTrue(math.isnan(records[1][2][2]))
+        self.assertEqual(self.store.get_cursor(0), 3)
+        self.assertEqual(self.store.get_cursor(1), 0)
+
+    def test_missing_values(self):
+        self.store.append(0, [(2, "2017-01-01 10:00:00", ["3700"])])
+
+        row, time, values = self.store.get_last(0)
+        self.assertEqual(row, 2)
+        self.assertFalse(math.isnan(time))
+        self.assertEqual(values[0], 3700.0)
+        self.assertTrue(math.isnan(values[1]) and math.isnan(values[2]))
+
+    def test_rows_after_cursor(self):
+        self.store.append(0, [(2, "100", ["3700"]), (3, "160", ["3701"])])
+
+        self.assertEqual(self.store.append(0, [(3, "160", ["3701"]), (4, "220", ["3702"])]), 1)  # row 3 is stored
+        self.assertEqual([row for row, _, _ in self.store.read(0, since_row=2)], [3, 4])
+        self.assertEqual(self.store.get_last(0)[0], 4)
+
+    def test_reopen(self):
+        self.store.append(0, [(2, "100", ["3700"]), (3, "160", ["3701"])])
+
+        store = HistoryStore(self.folder, number_of_columns=3)
+        self.assertEqual(store.get_cursor(0), 3)
+        self.assertEqual(store.get_last(0)[2][0], 3701.0)
+
+    def test_partial_record(self):
+        self.store.append(0, [(2, "100", ["3700"]), (3, "160", ["3701"])])
+        with open(self.store.get_path(0), "ab") as f:
+            f.write(b"\x00" * 5)  # crash while appending
+
+        store = HistoryStore(self.folder, number_of_columns=3)
+        self.assertEqual(store.get_cursor(0), 3)
+        self.assertEqual(store.append(0, [(4, "220", ["3702"])]), 1)
+        self.assertEqual([row for row, _, _ in store.read(0)], [2, 3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
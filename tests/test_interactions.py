@@ -0,0 +1,66 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from yolobmsbot.interactions import InteractionStore, get_command
+
+
+class TestInteractionStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = InteractionStore(os.path.join(self.folder, "interactions.sqlite3"))
+        self.store.write(
+            [(1, "John", "Doe", "jd", 100), (2, "Jane", None, None, 150), (1, "Johnny", "Doe", "jd", 300)],
+            [(100, 1, "/cell 3 2"), (150, 2, "/segment"), (200, 1, "/cell@yolobmsbot"), (300, 1, "/alerts")]
+        )
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.folder)
+
+    def test_get_command(self):
+        self.assertEqual(get_command("/Cell@yolobmsbot 3 2"), "/cell")
+        self.assertEqual(get_command("hello"), "")
+        self.assertEqual(get_command(""), "")
+
+    def test_users(self):
+        self.assertEqual(self.store.get_user_counts(0, 400), [
+            (1, "Johnny", "Doe", "jd", 3), (2, "Jane", None, None, 1)
+        ])  # names are updated
+        self.assertEqual(self.store.get_user_counts(0, 400, limit=1)[0][0], 1)
+
+    def test_commands(self):
+        self.assertEqual(self.store.get_command_counts(0, 400), [
+            ("/cell", 2, 1), ("/alerts", 1, 1), ("/segment", 1, 1)
+        ])
+        self.assertEqual(self.store.get_command_counts(120, 250), [("/cell", 1, 1), ("/segment", 1, 1)])
+        self.assertEqual(self.store.get_user_command_counts(1, 0, 250), [("/cell", 2)])
+
+    def test_window_stats(self):
+        self.assertEqual(self.store.get_window_stats(120, 400), {
+            "actions": 3, "users": 2, "new_users": 1, "first": 150, "last": 300
+        })  # user 1 has been first seen before window
+        self.assertEqual(self.store.get_window_stats(400, 500)["actions"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from yolobmsbot.logs import ACTION_RECORD, USER_RECORD, LogWriter
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "interactions.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def count_actions(self, writer):
+        return writer.get_store().get_window_stats(0)["actions"]
+
+    def test_batches(self):
+        writer = LogWriter(self.path, flush_records=3, flush_seconds=60)
+        writer.put(ACTION_RECORD, (time.time(), 1, "/cell"))
+        writer.put(ACTION_RECORD, (time.time(), 1, "/segment"))
+        time.sleep(0.1)
+        self.assertEqual(writer.written, 0)  # waiting for more records
+
+        writer.put(USER_RECORD, (1, "John", "Doe", "jd", time.time()))
+        for _ in range(50):
+            if writer.written == 3:
+                break
+            time.sleep(0.1)
+        writer.close()
+        self.assertEqual(self.count_actions(writer), 2)
+        self.assertEqual(writer.get_store().get_user_counts(0)[0][:4], (1, "John", "Doe", "jd"))
+        writer.get_store().close()
+
+    def test_flush_and_close(self):
+        writer = LogWriter(self.path, flush_records=100, flush_seconds=60)
+        writer.put(ACTION_RECORD, (time.time(), 1, "/cell"))
+        writer.flush()
+        self.assertEqual(self.count_actions(writer), 1)
+
+        writer.put(ACTION_RECORD, (time.time(), 1, "/segment"))
+        writer.close()  # waiting records are written
+        self.assertEqual(self.count_actions(writer), 2)
+        self.assertIsNone(writer.thread)
+        writer.get_store().close()
+
+    def test_oldest_record_waits_at_most_flush_seconds(self):
+        writer = LogWriter(self.path, flush_records=100, flush_seconds=0.1)
+        writer.put(ACTION_RECORD, (time.time(), 1, "/cell"))
+        for _ in range(50):
+            if writer.written == 1:
+                break
+            time.sleep(0.1)
+        writer.close()
+
+        self.assertEqual(writer.written, 1)
+        writer.get_store().close()
+
+
+if __name__ == "__main__":
+    unittest.main()
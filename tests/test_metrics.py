@@ -0,0 +1,86 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from yolobmsbot import metrics
+from yolobmsbot.metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter("commands_total", "Commands handled", ("command",))
+        counter.labels("/cell").inc()
+        counter.labels("/cell").inc(2)
+        counter.labels('/a"b').inc()
+
+        self.assertIs(self.registry.counter("commands_total", "Commands handled", ("command",)), counter)
+        text = self.registry.render()
+        self.assertIn("# TYPE commands_total counter\n", text)
+        self.assertIn('commands_total{command="/cell"} 3.0\n', text)
+        self.assertIn('commands_total{command="/a\\"b"} 1.0\n', text)  # quotes are escaped
+
+    def test_histogram(self):
+        histogram = self.registry.histogram("request_seconds", "Seconds taken by a request", buckets=(0.1, 1.0))
+        for value in [0.05, 0.5, 0.5, 5.0]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.labels().get(), ([1, 3, 4], 4, 6.05))
+        self.assertEqual(histogram.labels().get_quantile(0.5), 1.0)
+        self.assertEqual(histogram.labels().get_quantile(1), math.inf)
+        text = self.registry.render()
+        self.assertIn('request_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('request_seconds_bucket{le="+Inf"} 4\n', text)
+        self.assertIn("request_seconds_count 4\n", text)
+
+    def test_timer(self):
+        histogram = self.registry.histogram("update_seconds", "Seconds taken by an update")
+        with self.assertRaises(ValueError):
+            with histogram.time():
+                raise ValueError("update failed")
+
+        self.assertEqual(histogram.labels().get()[1], 1)  # failed calls are measured too
+
+    def test_gauge_and_summary(self):
+        self.registry.gauge("snapshot_version", "Version of snapshot", lambda: 7)
+        self.registry.histogram("empty_seconds", "Never observed")
+
+        self.assertIn("snapshot_version 7.0\n", self.registry.render())
+        self.assertEqual(self.registry.get_summary(), ["snapshot_version: 7"])  # empty histograms are skipped
+
+    def test_http_server(self):
+        self.registry.counter("requests_total", "Requests").inc()
+        server = metrics.start_http_server(0, registry=self.registry)
+        try:
+            url = "http://127.0.0.1:" + str(server.server_address[1])
+            self.assertIn("requests_total 1.0", urlopen(url + metrics.METRICS_PATH, timeout=5).read().decode("utf-8"))
+            with self.assertRaises(HTTPError):
+                urlopen(url + "/other", timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
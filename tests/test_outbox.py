@@ -0,0 +1,94 @@
+# !/usr/bin/python3
+# coding: utf_8
+
+# Copyright 2017 RaceUp ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+import unittest
+
+from yolobmsbot.outbox import MessageOutbox, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(1.0, 3)
+        now = bucket.last_time
+
+        self.assertEqual([bucket.take(now) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.take(now), 1.0)  # bucket is empty: wait for next token
+
+    def test_refill(self):
+        bucket = TokenBucket(2.0, 2)
+        now = bucket.last_time
+        bucket.take(now)
+        bucket.take(now)
+
+        self.assertAlmostEqual(bucket.take(now + 0.25), 0.25)  # half a token added meanwhile
+        self.assertEqual(bucket.take(now + 0.5), 0.0)
+        self.assertGreater(bucket.take(now + 0.5), 0.0)
+
+    def test_capacity(self):
+        bucket = TokenBucket(10.0, 2)
+        now = bucket.last_time + 60  # long idle period
+
+        self.assertEqual([bucket.take(now) for _ in range(2)], [0.0, 0.0])
+        self.assertGreater(bucket.take(now), 0.0)  # tokens never exceed capacity
+
+
+class TestMessageOutbox(unittest.TestCase):
+    def test_messages_of_chat_in_order(self):
+        outbox = MessageOutbox(chat_interval=0.0, global_rate=1000, global_burst=1000, threads=3)
+        sent = []
+        lock = threading.Lock()
+
+        def send(chat, i):
+            def deliver():
+                with lock:
+                    sent.append((chat, i))
+            return deliver
+
+        outbox.start()
+        for i in range(5):
+            for chat in range(3):
+                outbox.put(chat, send(chat, i))
+        self.assertTrue(outbox.flush(5))
+        outbox.stop()
+
+        self.assertEqual(outbox.sent, 15)
+        for chat in range(3):
+            self.assertEqual([i for c, i in sent if c == chat], list(range(5)))
+
+    def test_failed_message_is_dropped(self):
+        outbox = MessageOutbox(chat_interval=0.0, global_rate=1000, global_burst=1000, max_attempts=2, threads=1)
+        attempts = []
+
+        def fail():
+            attempts.append(1)
+            error = IOError("flood control exceeded")
+            error.retry_after = 0.01  # as asked by Telegram
+            raise error
+
+        outbox.start()
+        outbox.put(1, fail)
+        self.assertTrue(outbox.flush(10))
+        outbox.stop()
+
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(outbox.dropped, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+from datetime import datetime
+
+from yolobmsbot import replies
+from yolobmsbot.batterypack import BatteryPack, BatteryPackSnapshot
+
+
+class TestSplitBlocks(unittest.TestCase):
+    def test_blocks_kept_together(self):
+        blocks = [["a" * 9] * 3 for _ in range(3)]  # 30 characters each
+        max_length = len(replies.TABLE_START) + len(replies.TABLE_END) + 65
+
+        messages = replies.split_blocks(blocks, max_length=max_length)
+        self.assertEqual(len(messages), 2)  # 2 blocks fit in a message, third one goes in next one
+        self.assertEqual(messages[1], replies.TABLE_START + "\n".join(["a" * 9] * 3) + replies.TABLE_END)
+        self.assertTrue(all([len(message) <= max_length for message in messages]))
+
+    def test_long_block(self):
+        max_length = len(replies.TABLE_START) + len(replies.TABLE_END) + 25
+        messages = replies.split_blocks([["b" * 9] * 5], title="Title", max_length=max_length)
+
+        self.assertTrue(messages[0].startswith("Title\n" + replies.TABLE_START))
+        self.assertTrue(all([len(message) <= max_length for message in messages]))
+        self.assertEqual("".join(messages).count("b" * 9), 5)  # block is split only as it does not fit
+
+    def test_no_blocks(self):
+        self.assertEqual(replies.split_blocks([]), [replies.TABLE_START + replies.TABLE_END])
+
+
+class TestTables(unittest.TestCase):
+    def setUp(self):
+        pack = BatteryPack([17] + [18] * 6 + [17])
+        for segment in pack.segments:
+            segment.update_values(None, [3700 + c for c in range(18)])
+        self.snapshot = BatteryPackSnapshot(pack, datetime(2017, 4, 29, 10, 30), 1)
+
+    def test_cells_table(self):
+        messages = replies.get_cells_table(self.snapshot)
+
+        self.assertEqual(len(messages), 1)  # whole pack fits in a message
+        self.assertTrue(messages[0].startswith(replies.CELLS_TITLE + "\n" + replies.TABLE_START))
+        self.assertIn("Segment 8 (avg 3708.00)", messages[0])
+        self.assertIn("18  3717.0", messages[0])
+
+    def test_segments_table(self):
+        messages = replies.get_segments_table(self.snapshot)
+
+        self.assertEqual(len(messages), 1)
+        self.assertIn("  2  3708.50   3700.0   3717.0", messages[0])
+
+    def test_add_time(self):
+        messages = replies.get_cells_table(self.snapshot)
+        timed = replies.add_time(messages, replies.CELLS_TITLE, " as of 2017-04-29 at 10:30:00 (5 minutes ago)")
+
+        self.assertTrue(timed[0].startswith("Voltages of cells (mV) as of 2017-04-29 at 10:30:00 (5 minutes ago)\n"))
+        self.assertTrue(timed[0].endswith(messages[0][len(replies.CELLS_TITLE):]))
+        self.assertEqual(messages[0][:len(replies.CELLS_TITLE) + 1], replies.CELLS_TITLE + "\n")  # cached one is kept
+
+
+if __name__ == "__main__":
+    unittest.main()
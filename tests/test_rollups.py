@@ -0,0 +1,108 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import shutil
+import tempfile
+import unittest
+
+from yolobmsbot.history import HistoryStore
+from yolobmsbot.rollups import RollupEngine, RollupRing
+
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.engine = RollupEngine([2, 3], resolutions=[(60, 10), (600, 10)])
+
+    def test_summary(self):
+        for t, values in [(0, [3700, 3800]), (30, [3710, ""]), (70, [3690, 3790]), (130, [3720, 3810])]:
+            self.engine.add(0, t, values)
+
+        summary = self.engine.get_summary(0, 0, 0, 179)
+        self.assertEqual(summary["resolution"], 60)
+        self.assertEqual(summary["count"], 4)
+        self.assertEqual((summary["min"], summary["max"], summary["last"]), (3690, 3720, 3720))
+        self.assertAlmostEqual(summary["mean"], 3705)
+        self.assertEqual(summary["last_time"], 130)
+
+        average = self.engine.get_summary(None, 0, 0, 179)  # average of segment skips invalid readings
+        self.assertEqual(average["count"], 4)
+        self.assertEqual(average["min"], 3710)  # not halved by blank reading
+        self.assertIsNone(self.engine.get_summary(0, 1, 0, 179))
+
+    def test_coarser_resolution(self):
+        for t in range(0, 3600, 60):
+            self.engine.add(1, t, [3700 + t / 60, 3800, 3900])
+
+        resolution, buckets = self.engine.get_buckets(0, 1, 0, 3599)
+        self.assertEqual(resolution, 600)  # finer one does not keep the whole window
+        self.assertEqual(len(buckets), 6)
+        self.assertEqual(sum([b[1] for b in buckets]), 60)
+
+    def test_old_samples_skipped(self):
+        self.engine.add(0, 100, [3700, 3800])
+        self.engine.add(0, 50, [3000, 3000])
+
+        self.assertEqual(self.engine.get_summary(0, 0, 0, 200)["min"], 3700)
+
+    def test_buckets_bounded(self):
+        ring = RollupRing(60, 10, 1)
+        ring.add(3000, [3700])
+        slots = []
+        get_slot = ring.get_slot
+
+        def count_slot(start):
+            slots.append(start)
+            return get_slot(start)
+
+        ring.get_slot = count_slot
+        buckets = ring.get_buckets(0, -1e12, 3000)  # window far longer than ring
+
+        self.assertEqual([b[0] for b in buckets], [3000])
+        self.assertLessEqual(len(slots), 11)  # at most capacity buckets are read
+
+    def test_load_history(self):
+        folder = tempfile.mkdtemp()
+        try:
+            history = HistoryStore(folder, number_of_columns=3)
+            history.append(0, [(2, "0", ["3700", "3800"]), (3, "60", ["3710", "3810"])])
+            self.engine.load_history(history)
+        finally:
+            shutil.rmtree(folder)
+        self.engine.add_rows(0, [(4, "120", ["3720", "3820"])])
+
+        summary = self.engine.get_summary(1, 0, 0, 179)
+        self.assertEqual((summary["count"], summary["last"]), (3, 3820))
+
+    def test_load_history_in_background(self):
+        folder = tempfile.mkdtemp()
+        try:
+            history = HistoryStore(folder, number_of_columns=3)
+            history.append(0, [(2, "0", ["3700", "3800"]), (3, "60", ["3710", "3810"])])
+            self.engine.start_loading(history)
+            self.engine.add_rows(0, [(4, "120", ["3720", "3820"])])  # fetched while history is being loaded
+            self.engine.thread.join(5)
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertFalse(self.engine.is_loading())
+        summary = self.engine.get_summary(1, 0, 0, 179)
+        self.assertEqual((summary["count"], summary["last"]), (3, 3820))  # newer sample did not drop history
+
+
+if __name__ == "__main__":
+    unittest.main()
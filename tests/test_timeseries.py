@@ -0,0 +1,81 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+from yolobmsbot.timeseries import CellTimeSeries
+
+
+class TestCellTimeSeries(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "cells.ring")
+        self.timeseries = CellTimeSeries(2, 3, self.path, capacity=4)
+
+    def tearDown(self):
+        self.timeseries.close()
+        shutil.rmtree(self.folder)
+
+    def test_range(self):
+        for t in range(1, 7):  # oldest samples are overwritten
+            self.assertTrue(self.timeseries.append(0, 100 * t, [3700 + t, 3800, ""], [20, 21, 22]))
+        self.assertFalse(self.timeseries.append(0, 600, [3700, 3800, 3900]))  # not newer than last one
+
+        times, voltages, temperatures = self.timeseries.get_range(0, 0, 250)
+        self.assertEqual(times, [300.0, 400.0, 500.0, 600.0])
+        self.assertEqual(voltages, [3703.0, 3704.0, 3705.0, 3706.0])
+        self.assertEqual(temperatures, [20.0] * 4)
+        self.assertEqual(self.timeseries.get_range(0, 0, 350, 500)[0], [400.0, 500.0])
+        self.assertEqual(self.timeseries.get_number_of_samples(0), 4)
+        self.assertEqual(self.timeseries.get_number_of_samples(1), 0)
+
+    def test_invalid_readings(self):
+        self.timeseries.append(0, 100, [3700, "", float("inf")])
+
+        self.assertEqual(self.timeseries.get_range(0, 0, 0)[1], [3700.0])
+        self.assertTrue(math.isnan(self.timeseries.get_range(1, 0, 0)[1][0]))  # not 0 mV
+        self.assertTrue(math.isnan(self.timeseries.get_range(2, 0, 0)[1][0]))
+
+    def test_first_time(self):
+        self.assertIsNone(self.timeseries.get_first_time(0))
+        for t in range(1, 7):
+            self.timeseries.append(0, 100 * t, [3700, 3800, 3900])
+
+        self.assertEqual(self.timeseries.get_first_time(0), 300.0)  # oldest sample still in ring
+        self.assertIsNone(self.timeseries.get_first_time(1))
+
+    def test_append_rows(self):
+        rows = [(2, "100", ["3700", "3710"]), (3, "not a time", ["3701"]), (4, "160", ["3702", "3712"])]
+
+        self.assertEqual(self.timeseries.append_rows(1, rows), 2)  # rows without a valid time are skipped
+        self.assertEqual(self.timeseries.get_range(1, 1, 0)[1], [3710.0, 3712.0])
+
+    def test_reopen(self):
+        self.timeseries.append(1, 100, [3700, 3710, 3720], [25, 26, 27])
+        self.timeseries.close()
+
+        self.timeseries = CellTimeSeries(2, 3, self.path, capacity=4)  # samples survive restarts
+        self.assertEqual(self.timeseries.get_range(2, 1, 0), ([100.0], [3720.0], [27.0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from yolobmsbot import tracing
+from yolobmsbot.tracing import Tracer
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "traces.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read_events(self):
+        with open(self.path, "r") as f:
+            return json.loads(f.read().rstrip().rstrip(",") + "]")  # closing bracket is optional
+
+    def test_trace(self):
+        tracer = Tracer(self.path, sample_rate=1)
+        with tracer.span("command", chat=1) as root:
+            with tracer.span("sheets.request", segment=2) as child:
+                child.set("row", 5)
+            self.assertEqual(tracer.written, 0)  # written when trace ends
+        tracer.close()
+
+        events = self.read_events()
+        self.assertEqual([e["name"] for e in events], ["sheets.request", "command"])
+        self.assertEqual(events[0]["args"]["parent_id"], root.span_id)
+        self.assertEqual(events[0]["args"]["trace_id"], events[1]["args"]["trace_id"])
+        self.assertEqual((events[0]["args"]["segment"], events[0]["args"]["row"]), (2, 5))
+        self.assertEqual(events[0]["cat"], "sheets")
+        self.assertEqual(events[1]["ph"], "X")
+
+    def test_error(self):
+        tracer = Tracer(self.path, sample_rate=1)
+        with self.assertRaises(ValueError):
+            with tracer.span("update"):
+                raise ValueError("no values")
+        tracer.close()
+
+        self.assertEqual(self.read_events()[0]["args"]["error"], "ValueError: no values")
+
+    def test_not_sampled(self):
+        tracer = Tracer(self.path, sample_rate=0)
+        with tracer.span("command"):
+            with tracer.span("sheets.request") as child:
+                self.assertFalse(child.sampled)  # whole trace is not sampled
+        tracer.close()
+
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_wrap(self):
+        tracer = tracing.TRACER
+        path, sample_rate = tracer.path, tracer.sample_rate
+
+        def fetch():
+            with tracing.span("fetch"):
+                pass
+
+        tracing.configure(self.path, 1)
+        try:
+            with tracing.span("refresh") as root:
+                thread = threading.Thread(target=tracing.wrap(fetch))
+                thread.start()
+                thread.join(5)
+            tracer.flush()
+            events = self.read_events()
+        finally:
+            tracing.configure(path, sample_rate)
+
+        self.assertEqual(events[0]["name"], "fetch")
+        self.assertEqual(events[0]["args"]["parent_id"], root.span_id)  # thread inherits span running when wrapped
+        self.assertIsNone(tracing.get_current_span())
+
+
+if __name__ == "__main__":
+    unittest.main()
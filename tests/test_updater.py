@@ -0,0 +1,318 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+
+from yolobmsbot.aio import AsyncRunner
+from yolobmsbot.batterypack import BatteryPack
+from yolobmsbot.history import HistoryStore
+from yolobmsbot.updater import NO_VALUES_RETRY_SECONDS, BatteryPackUpdater
+from yolobmsbot.warmstart import WarmStartStore
+
+
+def get_voltages(pack):
+    """
+    :param pack: BatteryPack
+        Battery pack
+    :return: [] of []
+        Voltages of cells of each segment as floats
+    """
+
+    return [[float(v) for v in voltages] for voltages in pack.get_current_voltages()]
+
+
+VALUES = {0: ["3700", "3710", "3720"], 1: ["3800", "3810", "3820"], 2: ["3900", "3910", "3920"]}
+
+
+class TestBatteryPackUpdater(unittest.TestCase):
+    def setUp(self):
+        self.fetched = []
+        self.fetched_lock = threading.Lock()
+        self.failing = set()
+        self.barrier = None
+        self.started = threading.Event()
+        self.release = None
+        self.rows = {}  # segment -> rows returned by get_rows_since
+        self.cursors = {}  # segment -> last row read
+        self.updaters = []
+
+    def tearDown(self):
+        for updater in self.updaters:
+            updater.stop()
+
+    def create_updater(self, number_of_cells_per_segment, **kwargs):
+        updater = BatteryPackUpdater(BatteryPack(number_of_cells_per_segment), 30, source=self, **kwargs)
+        self.updaters.append(updater)
+        return updater
+
+    def get_last_values(self, segment):
+        with self.fetched_lock:
+            self.fetched.append(segment)
+        if self.barrier is not None:
+            self.barrier.wait(5)  # all segments are fetched at the same time
+        if self.release is not None:
+            self.started.set()
+            self.release.wait(5)  # update stays in flight until test releases it
+        if segment in self.failing:
+            raise IOError("Cannot read segment " + str(segment))
+        return VALUES[segment], "2017-01-01 10:00:00"
+
+    def get_rows_since(self, segment, row):
+        with self.fetched_lock:
+            self.fetched.append(segment)
+        return [r for r in self.rows[segment] if r[0] > row]
+
+    def get_cursor(self, segment):
+        return self.cursors.get(segment, 0)
+
+    def set_cursor(self, segment, row):
+        self.cursors[segment] = row
+
+    def test_concurrent_fetches(self):
+        updater = self.create_updater([3, 3, 3], max_workers=3)
+        self.barrier = threading.Barrier(3)
+        updater.update_values(force=True)
+
+        self.assertEqual(sorted(self.fetched), [0, 1, 2])
+        self.assertEqual(updater.last_errors, {})
+        self.assertEqual(get_voltages(updater.battery_pack), [
+            [3700, 3710, 3720], [3800, 3810, 3820], [3900, 3910, 3920]
+        ])
+
+    def test_executor_reused(self):
+        updater = self.create_updater([3, 3])
+        updater.update_values(force=True)
+        executor = updater.executor
+        updater.update_values(force=True)
+
+        self.assertIs(updater.executor, executor)  # no threads started by each update
+        updater.stop()
+        self.assertIsNone(updater.executor)
+        updater.update_values(force=True)  # a new one is created if needed
+        self.assertIsNot(updater.executor, executor)
+
+    def test_partial_failure(self):
+        updater = self.create_updater([3, 3, 3], max_workers=2)
+        self.failing.add(1)
+        updater.update_values()
+
+        self.assertEqual(list(updater.last_errors.keys()), [1])  # other segments go on
+        self.assertEqual(get_voltages(updater.battery_pack)[0], [3700, 3710, 3720])
+        self.assertTrue(all([math.isnan(v) for v in get_voltages(updater.battery_pack)[1]]))  # never fetched
+        self.assertEqual(get_voltages(updater.battery_pack)[2], [3900, 3910, 3920])
+
+    def test_missing_values(self):
+        updater = self.create_updater([3, 4, 3])
+        updater.update_values()
+
+        self.assertEqual(list(updater.last_errors.keys()), [1])  # segment has more cells than values
+
+    def test_all_segments_failed(self):
+        updater = self.create_updater([3, 3], jitter=0)
+        self.failing.update([0, 1])
+        updater.update_values(force=True)
+
+        self.assertEqual(sorted(updater.last_errors.keys()), [0, 1])
+        self.assertEqual(updater.last_update, datetime.fromtimestamp(0))  # time of values does not move on
+        self.assertFalse(updater.has_values())
+        self.assertTrue(updater.is_stale())
+        self.assertEqual(updater.get_seconds_to_next_update(), NO_VALUES_RETRY_SECONDS)  # try again soon
+
+    def test_stale_values(self):
+        updater = self.create_updater([3, 3], jitter=0, max_staleness=60)
+        self.failing.add(1)
+        updater.update_values(force=True)
+
+        self.assertTrue(updater.has_values())  # time moves on when at least a segment is fetched
+        self.assertFalse(updater.is_stale())
+        self.assertEqual(updater.get_seconds_to_next_update(), 30 * 60)
+        updater.max_staleness = -1  # values are older than that
+        self.assertTrue(updater.is_stale())
+
+    def test_update_needed(self):
+        updater = self.create_updater([3, 3])
+        updater.update_values()
+        updater.update_values()  # timer has not timed out
+        self.assertEqual(len(self.fetched), 2)
+
+        updater.update_values(force=True)
+        self.assertEqual(len(self.fetched), 4)
+
+    def test_single_flight(self):
+        updater = self.create_updater([3, 3])
+        self.release = threading.Event()
+        results = []
+
+        def update(force):
+            results.append(updater.update_values(force=force))
+
+        leader = threading.Thread(target=update, args=(True,))
+        leader.start()
+        self.assertTrue(self.started.wait(5))
+        followers = [threading.Thread(target=update, args=(False,)) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        time.sleep(0.1)  # followers wait for update in flight (or find it done)
+        self.release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(self.fetched), 2)  # each segment fetched once
+        self.assertEqual(updater.get_snapshot().version, 1)
+        self.assertTrue(all([snapshot is results[0] for snapshot in results]))
+
+    def test_single_flight_async(self):
+        updater = self.create_updater([3, 3])
+        self.release = threading.Event()
+        runner = AsyncRunner(max_workers=2)  # followers must not hold executor threads needed by leader
+        runner.start()
+        try:
+            leader = runner.submit(updater.update_values_async(runner, force=True))
+            self.assertTrue(self.started.wait(5))
+            followers = [runner.submit(updater.update_values_async(runner)) for _ in range(3)]
+            time.sleep(0.1)
+            self.release.set()
+            results = [future.result(5) for future in [leader] + followers]
+        finally:
+            runner.stop()
+
+        self.assertEqual(len(self.fetched), 2)
+        self.assertEqual(updater.get_snapshot().version, 1)
+        self.assertTrue(all([snapshot is results[0] for snapshot in results]))
+
+    def test_snapshot_not_modified(self):
+        updater = self.create_updater([3, 3])
+        first = updater.update_values(force=True)
+        VALUES[0], values = ["3600", "3610", "3620"], VALUES[0]
+        try:
+            second = updater.update_values(force=True)
+        finally:
+            VALUES[0] = values
+
+        self.assertEqual(get_voltages(first.pack)[0], [3700, 3710, 3720])  # published values never change
+        self.assertEqual(get_voltages(second.pack)[0], [3600, 3610, 3620])
+        self.assertEqual((first.version, second.version), (1, 2))
+
+    def test_changed_cells(self):
+        updater = self.create_updater([3, 3])
+        first = updater.update_values(force=True)
+        VALUES[1], values = ["3800", "3815", "3820"], VALUES[1]
+        try:
+            second = updater.update_values(force=True)
+        finally:
+            VALUES[1] = values
+        third = updater.update_values(force=True)
+        fourth = updater.update_values(force=True)
+
+        self.assertEqual((first.changed_segments, first.segment_versions), ([0, 1], [1, 1]))
+        self.assertEqual((second.changed_cells, second.segment_versions), ([(1, 1)], [1, 2]))
+        self.assertEqual((third.changed_cells, third.segment_versions), ([(1, 1)], [1, 3]))
+        self.assertEqual((fourth.changed_cells, fourth.segment_versions), ([], [1, 3]))
+        self.assertIs(fourth.pack, third.pack)  # same values share pack
+
+    def test_listeners(self):
+        updater = self.create_updater([3, 3])
+        snapshots = []
+
+        def fail(snapshot):
+            raise ValueError("Cannot handle snapshot")
+
+        updater.add_listener(fail)
+        updater.add_listener(snapshots.append)
+        snapshot = updater.update_values(force=True)
+
+        self.assertEqual(snapshots, [snapshot])  # other listeners go on
+
+    def test_history(self):
+        self.rows = {0: [(2, "100", VALUES[0]), (3, "160", ["3701", "3711", "3721"])], 1: [(2, "100", VALUES[1])]}
+        cursors = []
+        get_rows_since = self.get_rows_since
+
+        def get_rows_since_cursor(segment, row):
+            cursors.append((segment, row))
+            return get_rows_since(segment, row)
+
+        folder = tempfile.mkdtemp()
+        try:
+            updater = self.create_updater([3, 3], history=HistoryStore(folder, number_of_columns=3))
+            self.get_rows_since = get_rows_since_cursor
+            updater.update_values(force=True)
+            self.rows[1].append((3, "160", ["3801", "3811", "3821"]))
+            snapshot = updater.update_values(force=True)
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertEqual(sorted(cursors), [(0, 0), (0, 3), (1, 0), (1, 2)])  # only rows after last stored one
+        self.assertEqual(get_voltages(snapshot.pack), [[3701, 3711, 3721], [3801, 3811, 3821]])
+
+    def test_warm_start(self):
+        folder = tempfile.mkdtemp()
+        try:
+            warm_start = WarmStartStore(os.path.join(folder, "snapshot.bin"))
+            updater = self.create_updater([3, 3], warm_start=warm_start)
+            self.assertFalse(updater.restore())  # nothing saved yet
+            self.cursors = {0: 40, 1: 41}
+            saved = updater.update_values(force=True)
+
+            self.cursors = {}
+            updater = self.create_updater([3, 3], warm_start=warm_start)
+            self.assertTrue(updater.restore())
+            restored = updater.get_snapshot()
+            fetched = updater.update_values(force=True)
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertEqual(self.cursors, {0: 40, 1: 41})  # reading rows resumes from where it stopped
+        self.assertTrue(restored.restored)
+        self.assertEqual((restored.version, restored.time), (saved.version, saved.time))
+        self.assertEqual(get_voltages(restored.pack), get_voltages(saved.pack))
+        self.assertFalse(fetched.restored)
+
+    def test_background_updates(self):
+        updater = self.create_updater([3, 3])
+        updater.start()
+        try:
+            for _ in range(50):  # first update runs right away
+                if updater.has_values():
+                    break
+                time.sleep(0.1)
+            self.assertTrue(updater.has_values())
+
+            fetched = len(self.fetched)
+            updater.force_update()
+            for _ in range(50):
+                if len(self.fetched) > fetched:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(self.fetched), fetched + 2)
+        finally:
+            updater.stop()
+            updater.thread.join(5)
+        self.assertFalse(updater.thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import unittest
+from datetime import datetime
+
+from yolobmsbot import utils
+
+
+class TestParse(unittest.TestCase):
+    def test_parse_float(self):
+        self.assertEqual(utils.parse_float("3700.5"), 3700.5)
+        self.assertEqual(utils.parse_float(12), 12.0)
+        for value in ["", "n/a", None, "inf", "-inf", "nan", float("inf")]:  # not valid readings
+            self.assertTrue(math.isnan(utils.parse_float(value)))
+
+    def test_parse_timestamp(self):
+        expected = datetime(2017, 4, 29, 10, 30, 15).timestamp()
+
+        self.assertEqual(utils.parse_timestamp("1493461815.5"), 1493461815.5)
+        for value in ["2017-04-29 10:30:15", "2017-04-29T10:30:15", "29/04/2017 10:30:15", "29/04/2017 10.30.15"]:
+            self.assertEqual(utils.parse_timestamp(value), expected)
+        self.assertTrue(math.isnan(utils.parse_timestamp("yesterday")))
+        self.assertTrue(math.isnan(utils.parse_timestamp(None)))
+
+
+class TestWindow(unittest.TestCase):
+    def test_parse_window(self):
+        self.assertEqual(utils.parse_window("90s"), 90)
+        self.assertEqual(utils.parse_window("2h"), 7200)
+        self.assertEqual(utils.parse_window(" 1D "), 86400)
+        self.assertEqual(utils.parse_window("30"), 1800)  # minutes
+
+    def test_parse_invalid_window(self):
+        for value in ["", "h", "0", "-2h", "infd", "nanm", "1e400s"]:
+            self.assertRaises(ValueError, utils.parse_window, value)
+
+    def test_format_window(self):
+        self.assertEqual(utils.format_window(7200), "2h")
+        self.assertEqual(utils.format_window(90), "90s")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from yolobmsbot.batterypack import BatteryCellValue, BatteryPack, BatteryPackSnapshot
+from yolobmsbot.warmstart import WarmStartStore
+
+
+def get_snapshot(cells):
+    pack = BatteryPack(cells)
+    for s, n in enumerate(cells):
+        pack.segments[s].update_values([25 + s] * n, [3600 + 10 * s + i for i in range(n)])
+    return BatteryPackSnapshot(pack, datetime(2017, 1, 1, 10, 0, 0), 7, segment_versions=[3, 5][:len(cells)])
+
+
+class TestWarmStartStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "history", "snapshot.bin")
+        self.store = WarmStartStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_save_and_load(self):
+        snapshot = get_snapshot([3, 2])
+        self.store.save(snapshot, [120, 95])
+        restored, cursors = WarmStartStore(self.path).load([3, 2])
+
+        self.assertEqual(cursors, [120, 95])
+        self.assertTrue(restored.restored)
+        self.assertEqual(restored.time, snapshot.time)
+        self.assertEqual(restored.version, 7)
+        self.assertEqual(restored.segment_versions, [3, 5])
+        self.assertEqual(restored.pack.voltages.tobytes(), snapshot.pack.voltages.tobytes())  # nan padding too
+        self.assertEqual(restored.pack.temperatures.tobytes(), snapshot.pack.temperatures.tobytes())
+        self.assertEqual(restored.pack.segments[1].get(BatteryCellValue.voltage), [3610, 3611])  # views of arrays
+
+    def test_no_snapshot(self):
+        self.assertIsNone(self.store.load([3, 2]))
+
+    def test_other_battery_pack(self):
+        self.store.save(get_snapshot([3, 2]), [0, 0])
+
+        self.assertIsNone(self.store.load([3, 3]))
+        self.assertIsNone(self.store.load([3]))
+
+    def test_truncated_file(self):
+        self.store.save(get_snapshot([3, 2]), [0, 0])
+        with open(self.path, "rb") as inp:
+            data = inp.read()
+        with open(self.path, "wb") as out:
+            out.write(data[:-8])
+
+        self.assertIsNone(self.store.load([3, 2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
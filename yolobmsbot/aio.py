@@ -0,0 +1,174 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import functools
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from yolobmsbot import tracing
+
+ASYNC_WORKERS = 8  # max blocking calls (Sheets requests, disk I/O) running at the same time
+STOP_TIMEOUT_SECONDS = 10  # max seconds to wait for running handlers when runner stops
+
+
+class AsyncRunner(object):
+    """
+    Event loop running in its own thread: handlers are coroutines scheduled on it, blocking calls run on a bounded
+    executor, so that many chats are served at the same time without a thread per request
+    """
+
+    def __init__(self, max_workers=ASYNC_WORKERS):
+        """
+        :param max_workers: int
+            Max blocking calls running at the same time
+        """
+
+        object.__init__(self)
+
+        self.max_workers = max(1, int(max_workers))
+        self.loop = None
+        self.executor = None
+        self.thread = None
+        self.tasks = set()  # handlers running (concurrent futures)
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        :return: void
+            Starts event loop in a new thread
+        """
+
+        if self.thread is not None:
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.loop.set_default_executor(self.executor)
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(ready.set)
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="async-runner", daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def stop(self, timeout=STOP_TIMEOUT_SECONDS):
+        """
+        :param timeout: float
+            Max seconds to wait for running handlers
+        :return: void
+            Waits for running handlers, then stops event loop and executor
+        """
+
+        if self.thread is None:
+            return
+
+        with self.lock:
+            tasks = list(self.tasks)
+        wait(tasks, timeout)
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown(wait=True)
+        self.thread = None
+
+    def submit(self, coroutine):
+        """
+        :param coroutine: coroutine
+            Coroutine to run on event loop
+        :return: concurrent.futures.Future
+            Result of coroutine (can be waited from any thread)
+        """
+
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        with self.lock:
+            self.tasks.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        """
+        :param future: concurrent.futures.Future
+            Coroutine done
+        :return: void
+            Forgets coroutine and prints its error (if any)
+        """
+
+        with self.lock:
+            self.tasks.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            e = future.exception()
+            print("Async task failed: " + str(e))
+            traceback.print_exception(type(e), e, e.__traceback__)
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """
+        :param function: callable
+            Blocking function
+        :return: obj
+            Result of function, run on executor (event loop is not blocked) as part of the span running now
+        """
+
+        return await self.loop.run_in_executor(
+            self.executor, functools.partial(tracing.wrap(function), *args, **kwargs)
+        )
+
+    async def map_blocking(self, function, items, limit=None):
+        """
+        :param function: callable
+            Blocking function with one argument
+        :param items: []
+            Arguments to call function with
+        :param limit: int
+            Max calls running at the same time (None for max_workers)
+        :return: [] of tuple obj, Exception
+            Result (None if failed) and error (None if succeeded) of each call, in order of items. Calls run
+            concurrently on executor
+        """
+
+        semaphore = asyncio.Semaphore(limit if limit is not None else self.max_workers)
+
+        async def call(item):
+            async with semaphore:
+                return await self.run_blocking(function, item)
+
+        results = await asyncio.gather(*[call(item) for item in items], return_exceptions=True)
+        return [(None, r) if isinstance(r, Exception) else (r, None) for r in results]
+
+    def wrap(self, handler):
+        """
+        :param handler: callable
+            Telegram handler (bot, update): coroutine function or blocking function
+        :return: callable
+            Handler that schedules the original one on event loop and returns straight away
+        """
+
+        if asyncio.iscoroutinefunction(handler):
+            def schedule(bot, update):
+                self.submit(handler(bot, update))
+        else:
+            def schedule(bot, update):
+                self.submit(self.run_blocking(handler, bot, update))
+
+        return schedule
@@ -0,0 +1,516 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import math
+import os
+import threading
+from datetime import datetime
+from enum import Enum
+
+from yolobmsbot.history import HISTORY_FOLDER
+
+SUBSCRIPTIONS_FILE = os.path.join(HISTORY_FOLDER, "subscriptions.json")  # default file of subscriptions
+STATES_FILE_NAME = "alert_states.json"  # what triggers each rule, kept in the same folder of subscriptions
+MAX_ITEMS_PER_ALERT = 20  # cells or segments listed in an alert message
+SUBSCRIBE_USAGE = "Usage: /subscribe under [mV] | over [mV] | segment <min mV> <max mV> | imbalance <mV>"
+
+
+class AlertQuantity(Enum):
+    """
+    Quantities rules can watch
+    """
+
+    cell_voltage = 0  # voltage of each cell
+    segment_average = 1  # average voltage of each segment
+    pack_imbalance = 2  # difference between highest and lowest cell voltage in pack
+
+
+def get_quantities(pack, quantities, segments=None):
+    """
+    :param pack: BatteryPack
+        Battery pack to check
+    :param quantities: set of AlertQuantity
+        Quantities to compute
+    :param segments: [] of int
+        Segments to check (None for all of them)
+    :return: {}
+        AlertQuantity -> values: [] of (segment, cell, voltage) for cells, [] of (segment, average) for segments,
+        tuple (difference, lowest cell, highest cell) for pack imbalance
+    """
+
+    values = {}
+    if not quantities:
+        return values
+
+    checked = set(range(len(pack.segments)) if segments is None else segments)
+    cells = [
+        divmod(i, pack.max_cells) + (v,) for i, (valid, v) in enumerate(zip(pack.mask, pack.voltages))
+        if valid and not math.isnan(v) and i // pack.max_cells in checked
+    ]  # one pass through all cells of pack (invalid readings are skipped)
+    if AlertQuantity.cell_voltage in quantities:
+        values[AlertQuantity.cell_voltage] = cells
+    if AlertQuantity.segment_average in quantities:
+        totals, counts = [0.0] * len(pack.segments), [0] * len(pack.segments)
+        for s, _, v in cells:
+            totals[s] += v
+            counts[s] += 1
+        values[AlertQuantity.segment_average] = [
+            (s, totals[s] / n) for s, n in enumerate(counts) if n > 0
+        ]
+    if AlertQuantity.pack_imbalance in quantities and cells:
+        lowest = min(cells, key=lambda c: c[2])
+        highest = max(cells, key=lambda c: c[2])
+        values[AlertQuantity.pack_imbalance] = (highest[2] - lowest[2], lowest, highest)
+    return values
+
+
+class AlertRule(object):
+    """
+    Condition on a quantity of battery pack: values lower than low or higher than high trigger alert
+    """
+
+    def __init__(self, quantity, low=None, high=None):
+        """
+        :param quantity: AlertQuantity
+            Quantity watched
+        :param low: float
+            Lower values trigger alert (None for no lower limit)
+        :param high: float
+            Higher values trigger alert (None for no upper limit)
+        """
+
+        object.__init__(self)
+
+        self.quantity = quantity
+        self.low = None if low is None else float(low)
+        self.high = None if high is None else float(high)
+
+    def get_key(self):
+        """
+        :return: tuple
+            Key of rule (same rules of different users have the same key)
+        """
+
+        return self.quantity.value, self.low, self.high
+
+    def to_dict(self):
+        """
+        :return: {}
+            Rule as JSON object
+        """
+
+        return {"quantity": self.quantity.name, "low": self.low, "high": self.high}
+
+    @staticmethod
+    def from_dict(data):
+        """
+        :param data: {}
+            Rule as JSON object
+        :return: AlertRule
+            Rule
+        """
+
+        return AlertRule(AlertQuantity[data["quantity"]], data.get("low"), data.get("high"))
+
+    def is_out(self, value):
+        """
+        :param value: float
+            Value of quantity
+        :return: bool
+            True iff value triggers alert
+        """
+
+        return (self.low is not None and value < self.low) or (self.high is not None and value > self.high)
+
+    def describe(self):
+        """
+        :return: str
+            Rule in words
+        """
+
+        names = {
+            AlertQuantity.cell_voltage: "cell voltage",
+            AlertQuantity.segment_average: "segment average voltage",
+            AlertQuantity.pack_imbalance: "pack imbalance"
+        }
+        if self.low is not None and self.high is not None:
+            limits = "out of " + "{0:.0f}".format(self.low) + "-" + "{0:.0f}".format(self.high) + " mV"
+        elif self.low is not None:
+            limits = "under " + "{0:.0f}".format(self.low) + " mV"
+        else:
+            limits = "over " + "{0:.0f}".format(self.high) + " mV"
+        return names[self.quantity] + " " + limits
+
+    def evaluate(self, values):
+        """
+        :param values: {}
+            Quantities of battery pack (see get_quantities)
+        :return: frozenset
+            Cells (segment, cell), segments or pack that trigger alert (empty if none)
+        """
+
+        if self.quantity not in values:
+            return frozenset()
+
+        if self.quantity == AlertQuantity.cell_voltage:
+            return frozenset([(s, c) for s, c, v in values[self.quantity] if self.is_out(v)])
+        elif self.quantity == AlertQuantity.segment_average:
+            return frozenset([s for s, v in values[self.quantity] if self.is_out(v)])
+        return frozenset(["pack"]) if self.is_out(values[self.quantity][0]) else frozenset()
+
+    def get_message(self, triggered, values):
+        """
+        :param triggered: frozenset
+            What triggers alert (see evaluate)
+        :param values: {}
+            Quantities of battery pack (see get_quantities)
+        :return: str
+            Alert message (or back to normal message if nothing triggers alert)
+        """
+
+        if not triggered:
+            return "Back to normal: " + self.describe()
+
+        lines = ["Alert: " + self.describe()]
+        if self.quantity == AlertQuantity.cell_voltage:
+            items = [
+                "cell " + str(c + 1) + " in segment " + str(s + 1) + ": " + "{0:.2f}".format(v) + " mV"
+                for s, c, v in values[self.quantity] if (s, c) in triggered
+            ]
+        elif self.quantity == AlertQuantity.segment_average:
+            items = [
+                "segment " + str(s + 1) + ": " + "{0:.2f}".format(v) + " mV"
+                for s, v in values[self.quantity] if s in triggered
+            ]
+        else:
+            difference, lowest, highest = values[self.quantity]
+            items = [
+                "{0:.2f}".format(difference) + " mV between cell " + str(highest[1] + 1) + " in segment " +
+                str(highest[0] + 1) + " and cell " + str(lowest[1] + 1) + " in segment " + str(lowest[0] + 1)
+            ]
+        lines += items[:MAX_ITEMS_PER_ALERT]
+        if len(items) > MAX_ITEMS_PER_ALERT:
+            lines.append("... and " + str(len(items) - MAX_ITEMS_PER_ALERT) + " more")
+        return "\n".join(lines)
+
+
+def parse_rule(args, thresholds):
+    """
+    :param args: [] of str
+        Arguments of /subscribe command (e.g ["under", "3400"])
+    :param thresholds: CellThresholds or [] of CellThresholds
+        Default limits of cells, for the whole pack or one for each segment
+    :return: AlertRule
+        Rule asked by user (raises ValueError if arguments are not valid)
+    """
+
+    if not args:
+        raise ValueError(SUBSCRIBE_USAGE)
+
+    if not isinstance(thresholds, (list, tuple)):
+        thresholds = [thresholds]
+    min_voltage = min([t.min_voltage for t in thresholds])
+    max_voltage = max([t.max_voltage for t in thresholds])
+
+    kind, numbers = args[0].lower(), []
+    try:
+        numbers = [float(a) for a in args[1:]]
+    except ValueError:
+        raise ValueError(SUBSCRIBE_USAGE)
+
+    if kind in ("under", "undervoltage") and len(numbers) <= 1:
+        return AlertRule(AlertQuantity.cell_voltage, low=numbers[0] if numbers else min_voltage)
+    elif kind in ("over", "overvoltage") and len(numbers) <= 1:
+        return AlertRule(AlertQuantity.cell_voltage, high=numbers[0] if numbers else max_voltage)
+    elif kind == "segment" and len(numbers) == 2 and numbers[0] <= numbers[1]:
+        return AlertRule(AlertQuantity.segment_average, low=numbers[0], high=numbers[1])
+    elif kind == "imbalance" and len(numbers) == 1:
+        return AlertRule(AlertQuantity.pack_imbalance, high=numbers[0])
+    raise ValueError(SUBSCRIBE_USAGE)
+
+
+class AlertManager(object):
+    """
+    Alert rules of all users, indexed by quantity they watch: each distinct rule is evaluated once per snapshot and
+    its subscribers are sent a message only when what triggers it changes
+    """
+
+    def __init__(self, path=SUBSCRIPTIONS_FILE, send=None):
+        """
+        :param path: str
+            Path to JSON file where to keep subscriptions (None to not keep them), states of rules are kept in
+            STATES_FILE_NAME in the same folder so that alerts already sent are not sent again after a restart
+        :param send: callable
+            Sends a message to a chat (chat id, text), None to not send alerts
+        """
+
+        object.__init__(self)
+
+        self.path = path
+        self.states_path = None if path is None else os.path.join(os.path.dirname(path), STATES_FILE_NAME)
+        self.send = send
+        self.rules = {}  # key -> rule
+        self.subscribers = {}  # rule key -> set of chats
+        self.chats = {}  # chat -> set of rule keys
+        self.index = {}  # quantity -> set of rule keys
+        self.states = {}  # rule key -> what triggered it at last evaluation
+        self.last_version = None  # version of last snapshot evaluated
+        self.last_segment_versions = None  # versions of segments of last snapshot evaluated
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """
+        :return: void
+            Loads subscriptions from file (if any)
+        """
+
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "r") as f:
+                subscriptions = json.load(f)
+            for s in subscriptions:
+                self._add(s["chat"], AlertRule.from_dict(s["rule"]))
+        except (ValueError, KeyError, TypeError) as e:
+            print("Cannot load subscriptions from " + self.path + ": " + str(e))
+        self.load_states()
+
+    def load_states(self):
+        """
+        :return: void
+            Loads what triggered each rule at last evaluation before a restart (if any)
+        """
+
+        if self.states_path is None or not os.path.exists(self.states_path):
+            return
+
+        try:
+            with open(self.states_path, "r") as f:
+                states = json.load(f)
+            for s in states:
+                key = AlertRule.from_dict(s["rule"]).get_key()
+                if key in self.rules:  # nobody is subscribed to other rules anymore
+                    self.states[key] = frozenset([tuple(t) if isinstance(t, list) else t for t in s["triggered"]])
+        except (ValueError, KeyError, TypeError) as e:
+            print("Cannot load states of alerts from " + self.states_path + ": " + str(e))
+
+    @staticmethod
+    def write(path, data):
+        """
+        :param path: str
+            Path to JSON file
+        :param data: obj
+            JSON object to write
+        :return: void
+            Writes object to file
+        """
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)  # never leave a half written file
+
+    def save(self):
+        """
+        :return: void
+            Writes subscriptions to file (to be called with lock held)
+        """
+
+        if self.path is None:
+            return
+
+        subscriptions = [
+            {"chat": chat, "rule": self.rules[key].to_dict()}
+            for chat, keys in self.chats.items() for key in sorted(keys, key=str)
+        ]
+        AlertManager.write(self.path, subscriptions)
+
+    def save_states(self):
+        """
+        :return: void
+            Writes what triggers each rule to file (to be called with lock held)
+        """
+
+        if self.states_path is None:
+            return
+
+        states = [
+            {"rule": self.rules[key].to_dict(), "triggered": sorted(triggered, key=str)}
+            for key, triggered in self.states.items()
+        ]
+        try:
+            AlertManager.write(self.states_path, states)
+        except (OSError, TypeError) as e:  # alerts are sent anyway
+            print("Cannot save states of alerts to " + self.states_path + ": " + str(e))
+
+    def _add(self, chat, rule):
+        """
+        :param chat: int
+            Id of chat
+        :param rule: AlertRule
+            Rule to subscribe to
+        :return: bool
+            True iff chat was not already subscribed to rule
+        """
+
+        key = rule.get_key()
+        if key not in self.rules:
+            self.rules[key] = rule
+            self.subscribers[key] = set()
+            self.index.setdefault(rule.quantity, set()).add(key)
+        if chat in self.subscribers[key]:
+            return False
+
+        self.subscribers[key].add(chat)
+        self.chats.setdefault(chat, set()).add(key)
+        return True
+
+    def _remove(self, chat, key):
+        """
+        :param chat: int
+            Id of chat
+        :param key: tuple
+            Key of rule to unsubscribe from
+        :return: void
+            Removes subscription, and rule if nobody is subscribed to it
+        """
+
+        self.subscribers[key].discard(chat)
+        self.chats[chat].discard(key)
+        if not self.chats[chat]:
+            del self.chats[chat]
+        if not self.subscribers[key]:
+            rule = self.rules.pop(key)
+            del self.subscribers[key]
+            self.states.pop(key, None)
+            self.index[rule.quantity].discard(key)
+            if not self.index[rule.quantity]:
+                del self.index[rule.quantity]
+
+    def subscribe(self, chat, rule):
+        """
+        :param chat: int
+            Id of chat
+        :param rule: AlertRule
+            Rule to subscribe to
+        :return: tuple bool, frozenset
+            True iff chat was not already subscribed to rule, and what triggers rule now (None if not evaluated yet)
+        """
+
+        with self.lock:
+            is_new = self._add(chat, rule)
+            if is_new:
+                self.save()
+            return is_new, self.states.get(rule.get_key())
+
+    def unsubscribe(self, chat, rule=None):
+        """
+        :param chat: int
+            Id of chat
+        :param rule: AlertRule
+            Rule to unsubscribe from (None for all rules of chat)
+        :return: int
+            Number of rules chat has been unsubscribed from
+        """
+
+        with self.lock:
+            keys = list(self.chats.get(chat, set())) if rule is None else [rule.get_key()]
+            keys = [k for k in keys if chat in self.subscribers.get(k, set())]
+            for key in keys:
+                self._remove(chat, key)
+            if keys:
+                self.save()
+            return len(keys)
+
+    def get_rules(self, chat):
+        """
+        :param chat: int
+            Id of chat
+        :return: [] of AlertRule
+            Rules chat is subscribed to
+        """
+
+        with self.lock:
+            return [self.rules[key] for key in sorted(self.chats.get(chat, set()), key=str)]
+
+    def evaluate(self, snapshot):
+        """
+        :param snapshot: BatteryPackSnapshot
+            New values of battery pack
+        :return: {}
+            Chat -> message with all alerts of chat whose state changed (one message per chat). Segments never
+            fetched (version 0) are not checked
+        """
+
+        with self.lock:
+            if self.last_version is not None and snapshot.version <= self.last_version:
+                return {}  # already evaluated
+            self.last_version = snapshot.version
+            is_changed = snapshot.segment_versions != self.last_segment_versions
+            self.last_segment_versions = list(snapshot.segment_versions)
+            keys = {
+                quantity: [k for k in keys if is_changed or k not in self.states]
+                for quantity, keys in self.index.items()
+            }  # same values: only new rules have to be evaluated
+            keys = {quantity: k for quantity, k in keys.items() if k}
+
+            fetched = [s for s, version in enumerate(snapshot.segment_versions) if version > 0]
+            values = get_quantities(snapshot.pack, set(keys.keys()), fetched)
+            messages = {}  # chat -> messages of alerts
+            for quantity in sorted(keys.keys(), key=lambda q: q.value):
+                for key in sorted(keys[quantity], key=str):
+                    rule = self.rules[key]
+                    triggered = rule.evaluate(values)
+                    previous = self.states.get(key)
+                    self.states[key] = triggered
+                    if triggered == (previous if previous is not None else frozenset()):
+                        continue  # same alert already sent (or nothing to say)
+
+                    message = rule.get_message(triggered, values)  # built once for all subscribers
+                    for chat in self.subscribers[key]:
+                        messages.setdefault(chat, []).append(message)
+            if messages:
+                self.save_states()
+
+        return {chat: "\n\n".join(m) for chat, m in messages.items()}
+
+    def on_snapshot(self, snapshot):
+        """
+        :param snapshot: BatteryPackSnapshot
+            New values of battery pack
+        :return: void
+            Evaluates rules and sends a message to each chat with alerts whose state changed
+        """
+
+        if snapshot.version <= 0 or snapshot.time <= datetime.fromtimestamp(0):
+            return  # no values yet (failed updates publish snapshots with time of first values)
+
+        messages = self.evaluate(snapshot)
+        if self.send is None:
+            return
+        for chat, message in messages.items():
+            try:
+                self.send(chat, message)
+            except Exception as e:
+                print("Cannot send alert to chat " + str(chat) + ": " + str(e))
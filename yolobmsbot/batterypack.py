@@ -16,7 +16,13 @@
 # limitations under the License.
 
 
+import math
+import threading
+from array import array
 from enum import Enum
+from itertools import count
+
+from yolobmsbot import utils
 
 
 class BatteryCellValue(Enum):
@@ -28,16 +34,109 @@ class BatteryCellValue(Enum):
     voltage = 1
 
 
+class AbnormalReason(Enum):
+    """
+    Why a battery cell is abnormal
+    """
+
+    under_voltage = 0
+    over_voltage = 1
+    over_temperature = 2
+
+
+class CellThresholds(object):
+    """
+    Limits of normal values of a battery cell
+    """
+
+    def __init__(self, min_voltage=3500, max_voltage=4200, max_temperature=60):
+        """
+        :param min_voltage: float
+            Lower voltages are abnormal (mV)
+        :param max_voltage: float
+            Higher voltages are abnormal (mV)
+        :param max_temperature: float
+            Higher temperatures are abnormal (C)
+        """
+
+        object.__init__(self)
+
+        self.min_voltage = float(min_voltage)
+        self.max_voltage = float(max_voltage)
+        self.max_temperature = float(max_temperature)
+
+    def get_key(self):
+        """
+        :return: tuple
+            Limits (equal thresholds have equal keys)
+        """
+
+        return self.min_voltage, self.max_voltage, self.max_temperature
+
+    def get_reasons(self, voltage, temperature):
+        """
+        :param voltage: float
+            Voltage of cell
+        :param temperature: float
+            Temperature of cell
+        :return: [] of AbnormalReason
+            Why values are abnormal (empty iff values are normal)
+        """
+
+        reasons = []
+        if voltage < self.min_voltage:
+            reasons.append(AbnormalReason.under_voltage)
+        elif voltage > self.max_voltage:
+            reasons.append(AbnormalReason.over_voltage)
+        if temperature > self.max_temperature:
+            reasons.append(AbnormalReason.over_temperature)
+        return reasons
+
+
+DEFAULT_THRESHOLDS = CellThresholds()  # limits used when none are given
+
+
+def is_same_value(value, other):
+    """
+    :param value: float
+        Value of cell
+    :param other: float
+        Another value of cell
+    :return: bool
+        True iff values are equal (2 invalid readings are the same)
+    """
+
+    return value == other or (math.isnan(value) and math.isnan(other))
+
+
 class BatteryCell(object):
     """
-    Model for a battery cell with reading of voltage/temperature
+    Model for a battery cell with reading of voltage/temperature: values are stored in the arrays of its segment
     """
 
-    def __init__(self):
+    def __init__(self, temperatures=None, voltages=None, index=0):
+        """
+        :param temperatures: array
+            Temperatures of cells (None to create a standalone cell)
+        :param voltages: array
+            Voltages of cells (None to create a standalone cell)
+        :param index: int
+            Position of cell in arrays
+        """
+
         object.__init__(self)
 
-        self.temperature = 0.0  # initial values
-        self.voltage = 0.0
+        self.temperatures = temperatures if temperatures is not None else array("d", [math.nan])  # not read yet
+        self.voltages = voltages if voltages is not None else array("d", [math.nan])
+        self.index = index
+
+    @property
+    def temperature(self):
+        return self.temperatures[self.index]
+
+    @property
+    def voltage(self):
+        return self.voltages[self.index]
 
     def get(self, key):
         """
@@ -64,34 +163,61 @@ class BatteryCell(object):
             Updates values
         """
 
-        self.temperature = temperature
-        self.voltage = voltage
+        self.temperatures[self.index] = utils.parse_float(temperature)
+        self.voltages[self.index] = utils.parse_float(voltage)
 
-    def is_abnormal(self):
+    def is_abnormal(self, thresholds=DEFAULT_THRESHOLDS):
         """
+        :param thresholds: CellThresholds
+            Limits of normal values
         :return: bool
             True iff cell voltage is abnormal
         """
 
-        has_abnormal_voltage = self.voltage < 3500 or self.voltage > 4200
-        has_abnormal_temperature = self.temperature > 60
-        return has_abnormal_voltage or has_abnormal_temperature
+        return len(thresholds.get_reasons(self.voltage, self.temperature)) > 0
 
 
 class BatterySegment(object):
     """
-    Model for a battery segment with cells
+    Model for a battery segment with cells: values are stored in a slice of the arrays of its pack
     """
 
-    def __init__(self, number_of_cells):
+    def __init__(self, number_of_cells, temperatures=None, voltages=None, offset=0):
         """
         :param number_of_cells: int
             Number of cells in segment
+        :param temperatures: array
+            Temperatures of cells (None to create a standalone segment)
+        :param voltages: array
+            Voltages of cells (None to create a standalone segment)
+        :param offset: int
+            Position of first cell of segment in arrays
         """
 
         object.__init__(self)
 
-        self.cells = [BatteryCell() for _ in range(number_of_cells)]  # create list of cells
+        self.temperatures = temperatures if temperatures is not None else array("d", [math.nan]) * number_of_cells
+        self.voltages = voltages if voltages is not None else array("d", [math.nan]) * number_of_cells
+        self.offset = offset
+        self.cells = [
+            BatteryCell(self.temperatures, self.voltages, offset + c) for c in range(number_of_cells)
+        ]  # create list of cells
+
+    def _get_values(self, key):
+        """
+        :param key: BatteryCellValue
+            Type of value you want to query
+        :return: array
+            Copy of values of cells in segment
+        """
+
+        if key == BatteryCellValue.temperature:
+            values = self.temperatures
+        elif key == BatteryCellValue.voltage:
+            values = self.voltages
+        else:
+            raise ValueError(str(key) + " is not a recognised key for a BatteryCell value")
+        return values[self.offset:self.offset + len(self.cells)]
 
     def get(self, key):
         """
@@ -101,38 +227,51 @@ class BatterySegment(object):
             List of temperature or voltage (depending on key) value of cells
         """
 
-        return [cell.get(key) for cell in self.cells]
+        return self._get_values(key).tolist()
 
     def get_total(self, key):
         """
         :param key: BatteryCellValue
             Type of value you want to query
         :return: float
-            Sum of all cells' values
+            Sum of all cells' values (invalid readings are skipped)
         """
 
-        s = 0
-        for c in self.cells:
-            try:
-                s += float(c.get(key))
-            except:
-                s += 0.0
-        return s  # sum all values
+        return sum(filter(math.isfinite, self._get_values(key)))  # invalid readings are nan
 
     def get_average(self, key):
         """
         :param key: BatteryCellValue
             Type of value you want to query
         :return: float
-            Average of all cells' values
+            Average of all cells' values (invalid readings are skipped, nan if there are no valid ones)
+        """
+
+        values = list(filter(math.isfinite, self._get_values(key)))  # invalid readings are nan
+        return sum(values) / len(values) if values else math.nan  # get sum then divide
+
+    def update_values(self, temperatures, voltages):
+        """
+        :param temperatures: []
+            New temperatures of cells (None to keep current ones)
+        :param voltages: []
+            New voltages of cells (None to keep current ones)
+        :return: void
+            Updates values of all cells in segment at once
         """
 
-        return self.get_total(key) / len(self.cells)  # get sum then divide
+        start, end = self.offset, self.offset + len(self.cells)
+        if temperatures is not None:
+            self.temperatures[start:end] = array("d", [utils.parse_float(v) for v in temperatures[:len(self.cells)]])
+        if voltages is not None:
+            self.voltages[start:end] = array("d", [utils.parse_float(v) for v in voltages[:len(self.cells)]])
 
 
 class BatteryPack(object):
     """
-    Model for battery pack with segments and cells
+    Model for battery pack with segments and cells. Values of all cells are stored in contiguous arrays with a row of
+    max number of cells for each segment: cells not read yet and slots past the last cell of a segment are nan (the
+    latter are also marked invalid in mask)
     """
 
     def __init__(self, number_of_cells_per_segment):
@@ -143,19 +282,55 @@ class BatteryPack(object):
 
         object.__init__(self)
 
-        self.segments = [BatterySegment(num_of_cells) for num_of_cells in
-                         number_of_cells_per_segment]  # list of segments
-        self.number_of_cells_per_segment = number_of_cells_per_segment
+        self.number_of_cells_per_segment = list(number_of_cells_per_segment)
+        self.max_cells = max(self.number_of_cells_per_segment) if self.number_of_cells_per_segment else 0
+        size = len(self.number_of_cells_per_segment) * self.max_cells
+        self.temperatures = array("d", [math.nan]) * size  # segments x max cells
+        self.voltages = array("d", [math.nan]) * size
+        self.mask = array("b", [
+            1 if c < num_of_cells else 0
+            for num_of_cells in self.number_of_cells_per_segment for c in range(self.max_cells)
+        ])  # 1 iff slot is a cell
+        self.segments = [
+            BatterySegment(num_of_cells, self.temperatures, self.voltages, s * self.max_cells)
+            for s, num_of_cells in enumerate(self.number_of_cells_per_segment)
+        ]  # list of segments
+        self.limits = {}  # thresholds keys -> limits of each slot
+
+    def copy(self):
+        """
+        :return: BatteryPack
+            New battery pack with the same values in all cells
+        """
+
+        other = BatteryPack(self.number_of_cells_per_segment)
+        other.temperatures[:] = self.temperatures  # copy in place: segments and cells keep pointing to arrays
+        other.voltages[:] = self.voltages
+        return other
+
+    def _get_values(self, key):
+        """
+        :param key: BatteryCellValue
+            Type of value you want to query
+        :return: array
+            Values of all slots (segments x max cells)
+        """
+
+        if key == BatteryCellValue.temperature:
+            return self.temperatures
+        elif key == BatteryCellValue.voltage:
+            return self.voltages
+        raise ValueError(str(key) + " is not a recognised key for a BatteryCell value")
 
     def get_total(self, key):
         """
         :param key: BatteryCellValue
             Type of value you want to query
         :return: float
-            Sum of all segments' values
+            Sum of all segments' values (invalid readings are skipped)
         """
 
-        return sum([segment.get_total(key) for segment in self.segments])  # sum all values
+        return sum(filter(math.isfinite, self._get_values(key)))  # invalid readings and slots are nan
 
     def get_average(self, key):
         """
@@ -172,44 +347,110 @@ class BatteryPack(object):
         :param key: BatteryCellValue
             Type of value you want to query
         :return: float
-            Averages of all segments' values
+            Averages of all segments' values (invalid readings are skipped, nan if a segment has no valid ones)
         """
 
         return [segment.get_average(key) for segment in self.segments]
 
-    def get_list_of_abnormal_cells(self):
+    def get_thresholds_per_segment(self, thresholds=None):
+        """
+        :param thresholds: CellThresholds or [] of CellThresholds
+            Limits for the whole pack or one for each segment (None to use default ones)
+        :return: [] of CellThresholds
+            Limits of each segment
+        """
+
+        if thresholds is None:
+            thresholds = DEFAULT_THRESHOLDS
+        if isinstance(thresholds, CellThresholds):
+            return [thresholds] * len(self.segments)
+        if len(thresholds) != len(self.segments):
+            raise ValueError(
+                "Expected thresholds for " + str(len(self.segments)) + " segments, got " + str(len(thresholds))
+            )
+        return list(thresholds)
+
+    def _get_limits(self, thresholds_per_segment):
         """
+        :param thresholds_per_segment: [] of CellThresholds
+            Limits of each segment
+        :return: tuple array, array, array
+            Min voltage, max voltage and max temperature of each slot
+        """
+
+        key = tuple(t.get_key() for t in thresholds_per_segment)
+        if key not in self.limits:
+            min_voltages, max_voltages, max_temperatures = array("d"), array("d"), array("d")
+            for t in thresholds_per_segment:
+                min_voltages.extend([t.min_voltage] * self.max_cells)
+                max_voltages.extend([t.max_voltage] * self.max_cells)
+                max_temperatures.extend([t.max_temperature] * self.max_cells)
+            self.limits[key] = min_voltages, max_voltages, max_temperatures
+        return self.limits[key]
+
+    def get_list_of_abnormal_cells(self, thresholds=None):
+        """
+        :param thresholds: CellThresholds or [] of CellThresholds
+            Limits for the whole pack or one for each segment (None to use default ones)
         :return: list of dicts
-            each dict is of type {"cell", "segment", "voltage", "temperature"} and it's in list only if the cells is abnormal
+            each dict is of type {"cell", "segment", "voltage", "temperature", "reasons"} and it's in list only if the
+            cells is abnormal ("reasons" is a list of AbnormalReason)
         """
 
+        thresholds_per_segment = self.get_thresholds_per_segment(thresholds)
+        min_voltages, max_voltages, max_temperatures = self._get_limits(thresholds_per_segment)
+        abnormal_slots = [
+            i for i, valid, v, t, min_v, max_v, max_t in zip(
+                count(), self.mask, self.voltages, self.temperatures, min_voltages, max_voltages, max_temperatures
+            ) if valid and (v < min_v or v > max_v or t > max_t)
+        ]  # one pass through all cells of pack (comparisons with invalid readings, nan, are always false)
+
         list_of_abnormal_cells = []  # output
-        for segment in range(len(self.segments)):  # loop through all segments
-            for cell in range(len(self.segments[segment].cells)):  # loop through all cells
-                if segment <= 5 and self.segments[segment].cells:
-                    cell.is_abnormal()  # TODO segments > 5 are not considered for now
-                    list_of_abnormal_cells.append(
-                        {
-                            "cell": cell,
-                            "segment": segment,
-                            "voltage": self.segments[segment].cells[cell].voltage,
-                            "temperature": self.segments[segment].cells[cell].temperature
-                        }
-                    )  # add new cell
+        for i in abnormal_slots:
+            segment, cell = divmod(i, self.max_cells)
+            voltage, temperature = self.voltages[i], self.temperatures[i]
+            list_of_abnormal_cells.append(
+                {
+                    "cell": cell,
+                    "segment": segment,
+                    "voltage": voltage,
+                    "temperature": temperature,
+                    "reasons": thresholds_per_segment[segment].get_reasons(voltage, temperature)
+                }
+            )  # add new cell
 
         return list_of_abnormal_cells
 
+    def get_changed_cells(self, other, segments=None):
+        """
+        :param other: BatteryPack
+            Battery pack with the same segments and cells
+        :param segments: [] of int
+            Segments to compare (None for all of them)
+        :return: [] of tuple int, int
+            Segment and cell of cells whose values differ in the 2 packs
+        """
+
+        changed_cells = []
+        for s in range(len(self.segments)) if segments is None else segments:
+            start, end = s * self.max_cells, s * self.max_cells + len(self.segments[s].cells)
+            if self.voltages[start:end].tobytes() == other.voltages[start:end].tobytes() and \
+                    self.temperatures[start:end].tobytes() == other.temperatures[start:end].tobytes():
+                continue  # whole segment is the same (compared at C speed, bytes so that nan equals nan)
+
+            for i in range(start, end):
+                if not is_same_value(self.voltages[i], other.voltages[i]) or \
+                        not is_same_value(self.temperatures[i], other.temperatures[i]):
+                    changed_cells.append((s, i - start))
+        return changed_cells
+
     def get_current_voltages(self):
         """
         :return: [] of []
             Matrix of voltages, each row is a segment, each column is the voltage of a cell
         """
 
-        values = []
-        for segment in self.segments:
-            segment_values = segment.get(BatteryCellValue.voltage)
-            values.append(segment_values)
-        return values
+        return [segment.get(BatteryCellValue.voltage) for segment in self.segments]
 
     def is_cell_in_bounds(self, cell, segment):
         """
@@ -221,6 +462,97 @@ class BatteryPack(object):
             True iff cell position is valid
         """
 
-        segment_in_range = segment in range(0, len(self.segments))
-        cell_in_range = cell in range(0, len(self.segments[segment].cells))
-        return segment_in_range and cell_in_range
+        if segment not in range(0, len(self.segments)):  # check segment before indexing it
+            return False
+        return cell in range(0, len(self.segments[segment].cells))
+
+
+class BatteryPackSnapshot(object):
+    """
+    Battery pack values at a given time: once published it is never modified
+    """
+
+    def __init__(self, pack, time, version=0, errors=None, segment_versions=None, changed_cells=None, restored=False):
+        """
+        :param pack: BatteryPack
+            Values of battery pack (not to be modified anymore)
+        :param time: datetime
+            Time of update
+        :param version: int
+            Number of updates before this one
+        :param errors: {}
+            Segment -> exception raised while fetching it (segment keeps previous values)
+        :param segment_versions: [] of int
+            Number of updates that changed each segment (None for all 0)
+        :param changed_cells: [] of tuple int, int
+            Segment and cell of cells changed by this update (None for none)
+        :param restored: bool
+            True iff values have been saved before bot restarted and not fetched again yet
+        """
+
+        object.__init__(self)
+
+        self.pack = pack
+        self.time = time
+        self.version = version
+        self.errors = errors if errors is not None else {}
+        self.segment_versions = list(segment_versions) if segment_versions is not None else [0] * len(pack.segments)
+        self.changed_cells = list(changed_cells) if changed_cells is not None else []
+        self.changed_segments = sorted(set([s for s, _ in self.changed_cells]))
+        self.restored = restored
+        self.cache = {}  # values computed from this snapshot
+        self.cache_lock = threading.RLock()  # values may be computed from other cached values
+
+    def get_cached(self, key, compute):
+        """
+        :param key: tuple
+            Key of value
+        :param compute: callable
+            Function computing value (called at most once per key)
+        :return: object
+            Value computed from this snapshot
+        """
+
+        with self.cache_lock:  # callers asking the same value wait for the first one to compute it
+            if key not in self.cache:
+                self.cache[key] = compute()
+            return self.cache[key]
+
+    def inherit_cache(self, previous):
+        """
+        :param previous: BatteryPackSnapshot
+            Snapshot with the same values
+        :return: void
+            Reuses values computed from previous snapshot
+        """
+
+        with previous.cache_lock:
+            cache = dict(previous.cache)
+        with self.cache_lock:
+            for key, value in cache.items():
+                self.cache.setdefault(key, value)
+
+    def set_cached(self, key, value):
+        """
+        :param key: tuple
+            Key of value
+        :param value: object
+            Value computed from this snapshot
+        :return: void
+            Stores value
+        """
+
+        with self.cache_lock:
+            self.cache[key] = value
+
+    def get_abnormal_cells(self, thresholds=None):
+        """
+        :param thresholds: CellThresholds or [] of CellThresholds
+            Limits for the whole pack or one for each segment (None to use default ones)
+        :return: list of dicts
+            Abnormal cells of pack (see BatteryPack.get_list_of_abnormal_cells), computed once per thresholds
+        """
+
+        thresholds_per_segment = self.pack.get_thresholds_per_segment(thresholds)
+        key = ("abnormal_cells",) + tuple(t.get_key() for t in thresholds_per_segment)
+        return self.get_cached(key, lambda: self.pack.get_list_of_abnormal_cells(thresholds_per_segment))
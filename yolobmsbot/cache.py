@@ -0,0 +1,103 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_SIZE = 512  # max replies kept
+
+
+class ResponseCache(object):
+    """
+    Replies already formatted for the current snapshot, least recently used ones are evicted first. All replies are
+    dropped as soon as one for a newer snapshot is asked
+    """
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE):
+        """
+        :param max_size: int
+            Max replies kept
+        """
+
+        object.__init__(self)
+
+        self.max_size = max_size
+        self.version = None  # version of snapshot of replies kept
+        self.entries = OrderedDict()  # key -> reply (most recently used last)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version, compute):
+        """
+        :param key: tuple
+            Command and its arguments
+        :param version: int or tuple
+            Version of values reply is built from (e.g versions of segments: replies are kept while it does not grow)
+        :param compute: callable
+            Builds reply (no arguments), called only if reply is not cached
+        :return: obj
+            Reply
+        """
+
+        with self.lock:
+            if self.version is None or version > self.version:  # new snapshot: old replies are useless
+                self.entries.clear()
+                self.version = version
+            elif version == self.version and key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+
+        reply = compute()  # outside lock: other replies are not blocked
+        with self.lock:
+            if version == self.version:  # replies of older snapshots are not kept
+                self.entries[key] = reply
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return reply
+
+    def clear(self):
+        """
+        :return: void
+            Drops all replies and resets counters
+        """
+
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        """
+        :return: {}
+            "hits", "misses", "hit_rate" (0 if nothing has been asked), "size" and "max_size" of cache
+        """
+
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / requests if requests > 0 else 0.0,
+                "size": len(self.entries),
+                "max_size": self.max_size
+            }
@@ -0,0 +1,243 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import csv
+import math
+import os
+import threading
+
+from yolobmsbot import utils
+
+TAIL_BLOCK_SIZE = 4096  # bytes read from the end of a file to find its last row
+
+
+class BmsDataSource(object):
+    """
+    Source of segments values: each segment is a table whose rows are time of update and values of cells
+    """
+
+    def get_last_values(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: tuple [], str
+            Last values of cells in segment and time of last update
+        """
+
+        raise NotImplementedError()
+
+    def get_rows_since(self, segment, row):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param row: int
+            Last row already read (0 to read all rows)
+        :return: [] of tuple int, str, []
+            Rows after given one: each has number of row, time of update and values of cells
+        """
+
+        raise NotImplementedError()
+
+    def get_cursor(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: int
+            Last row of segment known by source (0 if unknown)
+        """
+
+        return 0
+
+    def set_cursor(self, segment, row):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param row: int
+            Last row of segment known before bot restarted
+        :return: void
+            Next reads of segment start from row (ignored by sources without cursors)
+        """
+
+        pass
+
+
+class GSheetsDataSource(BmsDataSource):
+    """
+    Segments values stored in Google Sheets (one spreadsheet per segment)
+    """
+
+    def get_last_values(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: tuple [], str
+            Last values of cells in segment and time of last update
+        """
+
+        from yolobmsbot.google import gsheets
+
+        values, time, _ = gsheets.get_last_cells_values(segment)
+        return values, time
+
+    def get_rows_since(self, segment, row):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param row: int
+            Last row already read (0 to read all rows)
+        :return: [] of tuple int, str, []
+            Rows after given one: each has number of row, time of update and values of cells
+        """
+
+        from yolobmsbot.google import gsheets
+
+        return gsheets.get_cells_values_since(segment, row)
+
+    def get_cursor(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: int
+            Last filled row of spreadsheet of segment (0 if unknown)
+        """
+
+        from yolobmsbot.google import gsheets
+
+        row = gsheets.get_last_row_hint(gsheets.SPREADSHEET_SEGMENT_ID[segment], gsheets.SPREADSHEET_COLUMNS[0])
+        return row if row is not None else 0
+
+    def set_cursor(self, segment, row):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param row: int
+            Last filled row of spreadsheet of segment before bot restarted
+        :return: void
+            Next lookup of last row starts from row instead of scanning the whole column
+        """
+
+        from yolobmsbot.google import gsheets
+
+        if row > 0:
+            gsheets.set_last_row_hint(gsheets.SPREADSHEET_SEGMENT_ID[segment], gsheets.SPREADSHEET_COLUMNS[0], row)
+
+
+class CsvDataSource(BmsDataSource):
+    """
+    Segments values stored in local csv files (one file per segment) with the same layout of spreadsheets
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: str or []
+            Folder with csv files (sorted by name, one per segment) or list of paths to csv files
+        """
+
+        object.__init__(self)
+
+        if isinstance(paths, str):
+            self.paths = sorted(
+                [os.path.join(paths, f) for f in os.listdir(paths) if f.endswith(".csv")]
+            )
+        else:
+            self.paths = list(paths)
+        self.offsets = {}  # segment -> (last row read, offset in file after it)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_line(line, row=None):
+        """
+        :param line: bytes
+            Line of csv file
+        :param row: int
+            Number of line in csv file (None if unknown)
+        :return: tuple str, []
+            Time of update and values of cells, blank ones included (None if line is the header or is not a row of
+            values)
+        """
+
+        if row == 1:  # header
+            return None
+        try:
+            data_values = next(csv.reader([line.decode("utf-8").strip()]))
+        except StopIteration:
+            return None
+
+        if len(data_values) < 2 or math.isnan(utils.parse_timestamp(data_values[0])):  # header or not a row
+            return None
+        return data_values[0], data_values[1:]
+
+    def get_last_values(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: tuple [], str
+            Values in last complete row of csv file of segment and time of last update
+        """
+
+        with open(self.paths[segment], "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block_size = TAIL_BLOCK_SIZE
+            while True:
+                start = max(0, end - block_size)
+                f.seek(start)
+                lines = f.read(end - start).split(b"\n")[:-1]  # last line is empty or still being written
+                if start > 0:
+                    lines = lines[1:]  # first line may be incomplete
+                for line in reversed(lines):
+                    parsed = self.parse_line(line)
+                    if parsed is not None:
+                        return parsed[1], parsed[0]
+                if start == 0:
+                    raise ValueError("No values in segment " + str(segment))
+                block_size *= 2
+
+    def get_rows_since(self, segment, row):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param row: int
+            Last row already read (0 to read all rows), row number is line number in csv file
+        :return: [] of tuple int, str, []
+            Rows after given one: each has number of row, time of update and values of cells
+        """
+
+        with self.lock:
+            last_row, offset = self.offsets.get(segment, (0, 0))
+        if last_row > row:  # cannot start from cached offset
+            last_row, offset = 0, 0
+
+        rows = []
+        with open(self.paths[segment], "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):  # row is still being written
+                    break
+                offset += len(line)
+                last_row += 1
+                if last_row <= row:
+                    continue
+
+                parsed = self.parse_line(line, last_row)
+                if parsed is not None:
+                    rows.append((last_row, parsed[0], parsed[1]))
+
+        with self.lock:
+            self.offsets[segment] = (last_row, offset)
+        return rows
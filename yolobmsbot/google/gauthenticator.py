@@ -16,13 +16,11 @@
 # limitations under the License.
 
 
+import json
 import os
+import threading
 
-import httplib2
-from googleapiclient import discovery
-from oauth2client import client
-from oauth2client import tools
-from oauth2client.file import Storage
+from yolobmsbot import tracing
 
 SCRIPT_DIRECTORY = os.path.dirname(__file__)  # path to directory of python script running
 
@@ -31,6 +29,125 @@ APP_NAME = "Bms Remote Monitor"
 APP_WEBSITE = "https://sites.google.com/view/raceupbms/home"
 APP_ORGANIZATION_WEBSITE = "www.raceup.it"
 OAUTH_PATH = os.path.join(os.path.dirname(SCRIPT_DIRECTORY), ".user_credentials")  # credentials folder
+DISCOVERY_FOLDER = os.path.join(SCRIPT_DIRECTORY, "discovery")  # cached discovery documents ("<name>.<version>.json")
+DISCOVERY_URI = "https://www.googleapis.com/discovery/v1/apis/{api}/{apiVersion}/rest"
+DISCOVERY_APIS = [("sheets", "v4"), ("gmail", "v1")]  # APIs used by bot (name, version)
+
+# drivers cache
+DRIVERS = {}  # (scope, name, version) -> (credentials version, driver)
+DRIVERS_LOCK = threading.Lock()  # guards drivers cache and credentials reloads
+THREAD_HTTP = threading.local()  # each thread keeps its own keep-alive connections
+DISCOVERY_DOCUMENTS = {}  # (name, version) -> discovery document (json string)
+DISCOVERY_LOCK = threading.Lock()  # guards discovery documents
+
+
+def get_discovery_path(name, version):
+    """
+    :param name: string
+        Name of API
+    :param version: string
+        Version of API
+    :return: string
+        Path to cached discovery document of API
+    """
+
+    return os.path.join(DISCOVERY_FOLDER, name + "." + version + ".json")
+
+
+def download_discovery_document(name, version):
+    """
+    :param name: string
+        Name of API
+    :param version: string
+        Version of API
+    :return: string
+        Discovery document of API downloaded from Google (network round trip)
+    """
+
+    import httplib2
+
+    response, content = httplib2.Http().request(DISCOVERY_URI.format(api=name, apiVersion=version))
+    if response.status != 200:
+        raise IOError("Cannot download discovery document of " + name + " " + version + ": " + str(response.status))
+    return content.decode("utf-8") if isinstance(content, bytes) else content
+
+
+def get_static_discovery_document(name, version):
+    """
+    :param name: string
+        Name of API
+    :param version: string
+        Version of API
+    :return: string
+        Discovery document bundled with Google API client (None if this version of client has none)
+    """
+
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+    except ImportError:  # client older than 2.0
+        return None
+    return get_static_doc(name, version)
+
+
+def save_discovery_document(name, version, document):
+    """
+    :param name: string
+        Name of API
+    :param version: string
+        Version of API
+    :param document: string
+        Discovery document of API
+    :return: void
+        Caches discovery document on disk (atomically, a partial file is never read)
+    """
+
+    path = get_discovery_path(name, version)
+    if not os.path.exists(DISCOVERY_FOLDER):
+        os.makedirs(DISCOVERY_FOLDER)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as out:
+        out.write(document)
+    os.replace(temp_path, path)
+
+
+def get_discovery_document(name, version):
+    """
+    :param name: string
+        Name of API
+    :param version: string
+        Version of API
+    :return: string
+        Discovery document of API: from memory, else from disk cache, else bundled with client, else downloaded
+        (only the first time, then cached on disk)
+    """
+
+    key = (name, version)
+    with DISCOVERY_LOCK:
+        document = DISCOVERY_DOCUMENTS.get(key)
+        if document is not None:
+            return document
+
+        path = get_discovery_path(name, version)
+        try:
+            with open(path, "r") as inp:
+                document = inp.read()
+            json.loads(document)  # a corrupted file is downloaded again
+        except (OSError, ValueError):
+            document = None
+
+        if document is None:
+            document = get_static_discovery_document(name, version)
+            if document is None:
+                with tracing.span("google.download_discovery", api=name, version=version):
+                    document = download_discovery_document(name, version)
+            try:
+                save_discovery_document(name, version, document)
+            except OSError as e:  # works anyway, it will be loaded again next time
+                print("Cannot cache discovery document of " + name + " " + version)
+                print(str(e))
+
+        DISCOVERY_DOCUMENTS[key] = document
+        return document
 
 
 class GoogleApiOAuth(object):
@@ -49,7 +166,20 @@ class GoogleApiOAuth(object):
         self.scope = str(scope)
         self.app_secrets = str(app_secrets_path)
         self.user_credentials = str(user_credentials_path)
-        self.store = Storage(user_credentials_path)
+        self._store = None  # created when credentials are needed (oauth2client is imported only then)
+
+    @property
+    def store(self):
+        """
+        :return: Storage
+            Storage of user credentials
+        """
+
+        if self._store is None:
+            from oauth2client.file import Storage
+
+            self._store = Storage(self.user_credentials)
+        return self._store
 
     def get_new_user_credentials(self):
         """
@@ -57,6 +187,8 @@ class GoogleApiOAuth(object):
             New user credentials file upon user prompt
         """
 
+        from oauth2client import client, tools
+
         flow = client.flow_from_clientsecrets(self.app_secrets, self.scope)  # perform OAuth2.0 authorization flow.
         flow.user_agent = APP_NAME
         return tools.run_flow(flow, self.store)
@@ -77,6 +209,17 @@ class GoogleApiOAuth(object):
 
         return credentials
 
+    def get_credentials_version(self):
+        """
+        :return: float
+            Last modification time of user credentials file (0 if missing)
+        """
+
+        try:
+            return os.path.getmtime(self.user_credentials)
+        except OSError:
+            return 0.0
+
     @staticmethod
     def authenticate(credentials):
         """
@@ -86,10 +229,36 @@ class GoogleApiOAuth(object):
             Http authenticated credentials
         """
 
+        import httplib2
+
         http = httplib2.Http()
         credentials.authorize(http)
         return http
 
+    @staticmethod
+    def get_thread_http(key, credentials):
+        """
+        :param key: tuple
+            Scope and credentials version the connection is bound to
+        :param credentials: string
+            User authentication code created via OAuth
+        :return: http
+            Http authenticated credentials owned by the calling thread, reused across requests. Connections of
+            older credentials versions of the same scope are dropped
+        """
+
+        connections = getattr(THREAD_HTTP, "connections", None)
+        if connections is None:
+            connections = THREAD_HTTP.connections = {}
+
+        http = connections.get(key)
+        if http is None:
+            for old_key in [k for k in connections if k[0] == key[0]]:  # credentials changed: never used again
+                del connections[old_key]
+            http = GoogleApiOAuth.authenticate(credentials)
+            connections[key] = http
+        return http
+
     def get_driver(self, name, version):
         """
         :param name: string
@@ -97,11 +266,35 @@ class GoogleApiOAuth(object):
         :param version: string
             Version of driver
         :return: api driver
-            Authenticates and creates new API driver to perform scope stuff
+            Cached API driver to perform scope stuff, built again only when user credentials change. Driver is
+            built from cached discovery document, without network round trips
         """
 
-        user_credentials = self.get_user_credentials()  # get credentials
-        return discovery.build(name, version, http=self.authenticate(user_credentials))  # get sheets driver
+        key = (self.scope, name, version)
+        with DRIVERS_LOCK:
+            credentials_version = self.get_credentials_version()
+            cached = DRIVERS.get(key)
+            if cached is not None and cached[0] == credentials_version:
+                return cached[1]
+
+            with tracing.span("google.build_driver", api=name, version=version):
+                from googleapiclient import discovery
+                from googleapiclient.http import HttpRequest
+
+                user_credentials = self.get_user_credentials()  # get credentials
+                credentials_version = self.get_credentials_version()  # may have changed in OAuth flow
+                http_key = (self.scope, credentials_version)
+
+                def build_request(http, *args, **kwargs):
+                    return HttpRequest(self.get_thread_http(http_key, user_credentials), *args, **kwargs)
+
+                driver = discovery.build_from_document(
+                    get_discovery_document(name, version),
+                    http=self.get_thread_http(http_key, user_credentials),
+                    requestBuilder=build_request
+                )  # get driver, every request goes through the http of the calling thread
+                DRIVERS[key] = (credentials_version, driver)
+                return driver
 
 
 class GMailApiOAuth(GoogleApiOAuth):
@@ -156,3 +349,18 @@ def create_gdrive_driver():
     """
 
     return GSheetsApiOAuth().create_driver()
+
+
+def cache_discovery_documents():
+    """
+    :return: void
+        Caches on disk discovery documents of all APIs used by bot, so that drivers are built offline
+    """
+
+    for name, version in DISCOVERY_APIS:
+        get_discovery_document(name, version)
+        print("Cached discovery document of " + name + " " + version + " in " + get_discovery_path(name, version))
+
+
+if __name__ == '__main__':
+    cache_discovery_documents()
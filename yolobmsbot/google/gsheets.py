@@ -16,6 +16,7 @@
 # limitations under the License.
 
 
+from yolobmsbot import metrics, tracing
 from yolobmsbot.google import gauthenticator
 
 
@@ -41,32 +42,136 @@ SPREADSHEETS_MAX_ROW = "5001"  # max row in spreadsheets
 SPREADSHEETS_TOP_LEFT_CORNER = SPREADSHEETS_MIN_COLUMN + SPREADSHEETS_MIN_ROW  # top left corner in spreadsheets0
 SPREADSHEET_COLUMNS = ["B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S"]
 
+LAST_ROW_HINTS = {}  # (spreadsheet, column) -> last known filled row
 
-def get_last_row_of_column(spreadsheet, column, max_rows=9999):
+SHEETS_REQUESTS = metrics.REGISTRY.counter("sheets_requests_total", "Google Sheets requests sent")
+SHEETS_ERRORS = metrics.REGISTRY.counter("sheets_errors_total", "Google Sheets requests failed")
+SHEETS_RETRIES = metrics.REGISTRY.counter(
+    "sheets_retries_total", "Google Sheets reads done again (stale last row hint, empty last row)"
+)
+SHEETS_LATENCY = metrics.REGISTRY.histogram("sheets_request_seconds", "Seconds taken by a Google Sheets request")
+LAST_CELLS_LATENCY = metrics.REGISTRY.histogram(
+    "get_last_cells_values_seconds", "Seconds taken to get last values of a segment"
+)
+LAST_SEGMENTS_LATENCY = metrics.REGISTRY.histogram(
+    "get_last_segments_values_seconds", "Seconds taken to get last values of pack spreadsheet"
+)
+
+
+def execute(request):
+    """
+    :param request: HttpRequest
+        Google Sheets request
+    :return: {}
+        Response of request (requests, errors and latency are measured, request is traced)
+    """
+
+    SHEETS_REQUESTS.inc()
+    try:
+        with SHEETS_LATENCY.time(), tracing.span("sheets.request", uri=getattr(request, "uri", None)):
+            return request.execute()
+    except Exception:
+        SHEETS_ERRORS.inc()
+        raise
+
+
+def get_last_row_of_column(spreadsheet, column, max_rows=None):
     """
     :param spreadsheet: string
         Spreadsheet ID
     :param column: string
         Column to get last row of
     :param max_rows: int
-        Max rows to search
+        Max rows to search (None to search the whole column)
     :return: int
         Number of last row
     """
 
+    hint = LAST_ROW_HINTS.get((spreadsheet, column))  # start from last known row if any
+    with tracing.span("sheets.last_row", spreadsheet=spreadsheet, column=column, hint=hint) as span:
+        if hint is not None and hint >= 1:  # rows start from 1 (e.g "B0:B" is not a valid range)
+            last_row = _find_last_row_from(spreadsheet, column, hint, max_rows)
+            if last_row is not None:
+                LAST_ROW_HINTS[(spreadsheet, column)] = last_row
+                span.set("last_row", last_row)
+                return last_row
+            SHEETS_RETRIES.inc()  # hint is stale
+            span.set("stale_hint", True)
+
+        last_row = _find_last_row_from(spreadsheet, column, 1, max_rows)  # scan whole column
+        if last_row is None:
+            last_row = 0  # column is empty: no hint, next lookup scans whole column again
+            LAST_ROW_HINTS.pop((spreadsheet, column), None)
+        else:
+            LAST_ROW_HINTS[(spreadsheet, column)] = last_row
+        span.set("last_row", last_row)
+        return last_row
+
+
+def _find_last_row_from(spreadsheet, column, start_row, max_rows=None):
+    """
+    :param spreadsheet: string
+        Spreadsheet ID
+    :param column: string
+        Column to get last row of
+    :param start_row: int
+        First row to read (it is expected to be filled)
+    :param max_rows: int
+        Max rows to search (None to search the whole column)
+    :return: int
+        Number of last filled row, None if start row is empty
+    """
+
     service = gauthenticator.create_gdrive_driver()
-    for row in range(1, max_rows, 2):
-        range_name = column + str(row)
-        try:
-            value = service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet, range=range_name
-            ).execute().get("values", [])[0]  # get values
+    range_name = column + str(start_row) + ":" + column
+    if max_rows is not None:
+        range_name += str(max_rows)
 
-            if len(str(value)) < 1:  # if cell is empty
-                return row - 2
-        except:
-            return row - 2
-    return max_rows
+    values = execute(service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet, range=range_name
+    )).get("values", [])  # trailing empty rows are not returned
+
+    if not values or not values[0]:  # start row is empty: hint is no longer valid
+        return None
+    return start_row + len(values) - 1
+
+
+def get_last_row_hint(spreadsheet, column):
+    """
+    :param spreadsheet: string
+        Spreadsheet ID
+    :param column: string
+        Column to get last row of
+    :return: int
+        Last known filled row of column (None if unknown)
+    """
+
+    return LAST_ROW_HINTS.get((spreadsheet, column))
+
+
+def set_last_row_hint(spreadsheet, column, row):
+    """
+    :param spreadsheet: string
+        Spreadsheet ID
+    :param column: string
+        Column of row
+    :param row: int
+        Last known filled row of column (e.g saved before restart; checked before being used)
+    :return: void
+        Next lookup of last row of column starts from row (rows before first one are ignored)
+    """
+
+    if row >= 1:
+        LAST_ROW_HINTS[(spreadsheet, column)] = row
+
+
+def reset_last_row_hints():
+    """
+    :return: void
+        Forgets all last known rows, next lookups will scan whole columns
+    """
+
+    LAST_ROW_HINTS.clear()
 
 
 def get_last_segment_value(segment):
@@ -81,12 +186,12 @@ def get_last_segment_value(segment):
     column = SPREADSHEET_COLUMNS[segment]  # get column of segment
     row = get_last_row_of_column(SPREADSHEET_PACK_ID, column)  # get row of last cell
 
-    data_value = service.spreadsheets().values().get(
+    data_value = execute(service.spreadsheets().values().get(
         spreadsheetId=SPREADSHEET_PACK_ID, range=column + str(row)
-    ).execute().get("values", [])[0][0]  # get cell value
-    data_time = service.spreadsheets().values().get(
+    )).get("values", [])[0][0]  # get cell value
+    data_time = execute(service.spreadsheets().values().get(
         spreadsheetId=SPREADSHEET_PACK_ID, range=SPREADSHEETS_MIN_COLUMN + str(row)
-    ).execute().get("values", [])[0][0]  # get time value
+    )).get("values", [])[0][0]  # get time value
 
     return data_value, data_time
 
@@ -97,17 +202,27 @@ def get_last_segments_values():
         Array of last values of segments and the time of last value update
     """
 
+    with LAST_SEGMENTS_LATENCY.time(), tracing.span("sheets.last_segments"):
+        return _get_last_segments_values()
+
+
+def _get_last_segments_values():
+    """
+    :return: tuple [], str
+        Same as get_last_segments_values
+    """
+
     service = gauthenticator.create_gdrive_driver()  # get new sheets instance
     min_column = SPREADSHEET_COLUMNS[0]
     max_column = SPREADSHEET_PACK_MAX_COLUMN
     row = get_last_row_of_column(SPREADSHEET_PACK_ID, min_column)  # get row of last values
 
-    data_values = service.spreadsheets().values().get(
+    data_values = execute(service.spreadsheets().values().get(
         spreadsheetId=SPREADSHEET_PACK_ID, range=min_column + str(row) + ":" + max_column + str(row)
-    ).execute().get("values", [])[0]  # get cell values # TODO test
-    data_time = service.spreadsheets().values().get(
+    )).get("values", [])[0]  # get cell values # TODO test
+    data_time = execute(service.spreadsheets().values().get(
         spreadsheetId=SPREADSHEET_PACK_ID, range=SPREADSHEETS_MIN_COLUMN + str(row)
-    ).execute().get("values", [])[0][0]  # get time value
+    )).get("values", [])[0][0]  # get time value
 
     return data_values, data_time
 
@@ -126,12 +241,12 @@ def get_last_cell_value(cell, segment):
     column = SPREADSHEET_COLUMNS[cell]  # get column of segment
     row = get_last_row_of_column(SPREADSHEET_SEGMENT_ID[segment], column)  # get row of last cell
 
-    data_value = service.spreadsheets().values().get(
+    data_value = execute(service.spreadsheets().values().get(
         spreadsheetId=SPREADSHEET_SEGMENT_ID[segment], range=column + str(row)
-    ).execute().get("values", [])[0][0]  # get cell value
-    data_time = service.spreadsheets().values().get(
+    )).get("values", [])[0][0]  # get cell value
+    data_time = execute(service.spreadsheets().values().get(
         spreadsheetId=SPREADSHEET_SEGMENT_ID[segment], range=SPREADSHEETS_MIN_COLUMN + str(row)
-    ).execute().get("values", [])[0][0]  # get time value
+    )).get("values", [])[0][0]  # get time value
 
     return data_value, data_time
 
@@ -146,6 +261,20 @@ def get_last_cells_values(segment, row=None):
         Array of last values of cells in given segment and the time of last value update
     """
 
+    with LAST_CELLS_LATENCY.time(), tracing.span("sheets.last_cells", segment=segment, row=row):
+        return _get_last_cells_values(segment, row)
+
+
+def _get_last_cells_values(segment, row=None):
+    """
+    :param segment: int
+        Number of segment of cell (starts from 0)
+    :param row: int
+        Row of last values
+    :return: tuple [], str, int
+        Same as get_last_cells_values
+    """
+
     service = gauthenticator.create_gdrive_driver()  # get new sheets instance
     min_column = SPREADSHEET_COLUMNS[0]
     max_column = SPREADSHEET_COLUMNS[-1]
@@ -156,15 +285,43 @@ def get_last_cells_values(segment, row=None):
     data_values = ["", ""]
     while not has_data and row >= 1:
         try:
-            data_values = service.spreadsheets().values().get(
+            data_values = execute(service.spreadsheets().values().get(
                 spreadsheetId=SPREADSHEET_SEGMENT_ID[segment],
                 range=SPREADSHEETS_MIN_COLUMN + str(row) + ":" + max_column + str(row)
-            ).execute().get("values", [])[0]  # get cell values
+            )).get("values", [])[0]  # get cell values
             has_data = True
         except:
+            SHEETS_RETRIES.inc()
             row -= 1
 
     data_time = data_values[0]  # get time value
     data_values = data_values[1:]
 
     return data_values, data_time, row
+
+
+def get_cells_values_since(segment, row):
+    """
+    :param segment: int
+        Number of segment of cell (starts from 0)
+    :param row: int
+        Last row already read
+    :return: [] of tuple int, str, []
+        Rows after given one: each has number of row, time of update and values of cells in segment. Trailing rows
+        with less values than columns are still being written: they are returned by a later call
+    """
+
+    service = gauthenticator.create_gdrive_driver()  # get new sheets instance
+    first_row = max(int(row) + 1, int(SPREADSHEETS_MIN_ROW))
+    data_rows = execute(service.spreadsheets().values().get(
+        spreadsheetId=SPREADSHEET_SEGMENT_ID[segment],
+        range=SPREADSHEETS_MIN_COLUMN + str(first_row) + ":" + SPREADSHEET_COLUMNS[-1]
+    )).get("values", [])  # all new rows in one request
+
+    while data_rows and len(data_rows[-1]) < 1 + len(SPREADSHEET_COLUMNS):  # time and a value for each column
+        data_rows.pop()  # cursor does not move past it, so it is read again once complete
+
+    return [
+        (first_row + i, data_values[0], data_values[1:])
+        for i, data_values in enumerate(data_rows) if data_values
+    ]
@@ -0,0 +1,209 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import struct
+import zlib
+
+
+CELL_SIZE = 28  # pixels of each cell square
+CELL_GAP = 2  # pixels between cells
+OUTLINE_SIZE = 3  # pixels of outline of abnormal cells
+FONT_SCALE = 2  # pixels of each dot of digits
+MARGIN = 6  # pixels around image
+LEGEND_HEIGHT = 12  # pixels of color bar below cells
+BACKGROUND_COLOR = (255, 255, 255)
+MISSING_COLOR = (220, 220, 220)  # slots of segments with less cells
+INVALID_COLOR = (140, 140, 140)  # cells without a valid reading
+TEXT_COLOR = (60, 60, 60)
+OUTLINE_COLOR = (0, 0, 0)
+COLOR_SCALE = [(49, 54, 149), (69, 117, 180), (116, 173, 209), (171, 217, 233), (254, 224, 144), (253, 174, 97),
+               (244, 109, 67), (215, 48, 39), (165, 0, 38)]  # from min to max voltage
+DIGITS = [
+    "111101101101111", "010110010010111", "111001111100111", "111001111001111", "101101111001001",
+    "111100111001111", "111100111101111", "111001001001001", "111101111101111", "111101111001111"
+]  # 3x5 dots of each digit
+
+
+def get_color(value, min_value, max_value):
+    """
+    :param value: float
+        Value to get color of
+    :param min_value: float
+        Value with first color of scale
+    :param max_value: float
+        Value with last color of scale
+    :return: tuple int, int, int
+        Color of value (interpolated in scale)
+    """
+
+    if max_value <= min_value:
+        return COLOR_SCALE[len(COLOR_SCALE) // 2]
+
+    position = (value - min_value) / (max_value - min_value) * (len(COLOR_SCALE) - 1)
+    position = max(0.0, min(len(COLOR_SCALE) - 1.0, position))
+    i = min(int(position), len(COLOR_SCALE) - 2)
+    weight = position - i
+    return tuple(
+        int(round(a + (b - a) * weight)) for a, b in zip(COLOR_SCALE[i], COLOR_SCALE[i + 1])
+    )
+
+
+class Canvas(object):
+    """
+    RGB image to draw rectangles and digits on
+    """
+
+    def __init__(self, width, height, color=BACKGROUND_COLOR):
+        """
+        :param width: int
+            Pixels of width
+        :param height: int
+            Pixels of height
+        :param color: tuple int, int, int
+            Background color
+        """
+
+        object.__init__(self)
+
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(color) * (width * height))
+
+    def fill(self, x, y, width, height, color):
+        """
+        :param x: int
+            Left of rectangle
+        :param y: int
+            Top of rectangle
+        :param width: int
+            Pixels of width of rectangle
+        :param height: int
+            Pixels of height of rectangle
+        :param color: tuple int, int, int
+            Color of rectangle
+        :return: void
+            Fills rectangle with color
+        """
+
+        line = bytes(color) * width
+        for row in range(y, y + height):
+            start = (row * self.width + x) * 3
+            self.pixels[start:start + len(line)] = line
+
+    def draw_number(self, x, y, number, color=TEXT_COLOR):
+        """
+        :param x: int
+            Left of number
+        :param y: int
+            Top of number
+        :param number: int
+            Number to draw
+        :param color: tuple int, int, int
+            Color of number
+        :return: void
+            Draws digits of number
+        """
+
+        for digit in str(number):
+            dots = DIGITS[int(digit)]
+            for i, dot in enumerate(dots):
+                if dot == "1":
+                    row, column = divmod(i, 3)
+                    self.fill(x + column * FONT_SCALE, y + row * FONT_SCALE, FONT_SCALE, FONT_SCALE, color)
+            x += 4 * FONT_SCALE
+
+    def to_png(self):
+        """
+        :return: bytes
+            Image encoded as PNG
+        """
+
+        stride = self.width * 3
+        raw = b"".join(
+            b"\x00" + bytes(self.pixels[row * stride:(row + 1) * stride]) for row in range(self.height)
+        )  # no filter on each row
+
+        def chunk(tag, data):
+            return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+        return b"\x89PNG\r\n\x1a\n" + \
+            chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)) + \
+            chunk(b"IDAT", zlib.compress(raw, 9)) + \
+            chunk(b"IEND", b"")
+
+
+def render_pack(pack, thresholds=None, abnormal_cells=None):
+    """
+    :param pack: BatteryPack
+        Battery pack to draw
+    :param thresholds: CellThresholds or [] of CellThresholds
+        Limits for the whole pack or one for each segment (None to use default ones): lowest min voltage and highest
+        max voltage are first and last color of scale
+    :param abnormal_cells: list of dicts
+        Cells to outline (see BatteryPack.get_list_of_abnormal_cells), None to compute them with thresholds
+    :return: bytes
+        PNG image with a row of squares for each segment, each square colored by voltage of its cell
+    """
+
+    if abnormal_cells is None:
+        abnormal_cells = pack.get_list_of_abnormal_cells(thresholds)
+    abnormal_slots = set([(c["segment"], c["cell"]) for c in abnormal_cells])
+    thresholds_per_segment = pack.get_thresholds_per_segment(thresholds)
+    min_voltage = min([t.min_voltage for t in thresholds_per_segment])
+    max_voltage = max([t.max_voltage for t in thresholds_per_segment])
+
+    label_width = 4 * FONT_SCALE * len(str(len(pack.segments))) + CELL_GAP
+    label_height = 5 * FONT_SCALE + CELL_GAP
+    step = CELL_SIZE + CELL_GAP
+    left, top = MARGIN + label_width, MARGIN + label_height
+    width = left + step * pack.max_cells + MARGIN
+    height = top + step * len(pack.segments) + LEGEND_HEIGHT + MARGIN
+    canvas = Canvas(width, height)
+
+    for c in range(pack.max_cells):  # cells labels
+        canvas.draw_number(left + c * step + 2, MARGIN, c + 1)
+    for s in range(len(pack.segments)):
+        y = top + s * step
+        canvas.draw_number(MARGIN, y + (CELL_SIZE - 5 * FONT_SCALE) // 2, s + 1)  # segment label
+        for c in range(pack.max_cells):
+            x = left + c * step
+            i = s * pack.max_cells + c
+            if not pack.mask[i]:
+                canvas.fill(x, y, CELL_SIZE, CELL_SIZE, MISSING_COLOR)
+                continue
+
+            if math.isnan(pack.voltages[i]):  # invalid reading: no color in scale
+                canvas.fill(x, y, CELL_SIZE, CELL_SIZE, INVALID_COLOR)
+                continue
+
+            color = get_color(pack.voltages[i], min_voltage, max_voltage)
+            if (s, c) in abnormal_slots:  # outline outliers
+                canvas.fill(x, y, CELL_SIZE, CELL_SIZE, OUTLINE_COLOR)
+                inner_size = CELL_SIZE - 2 * OUTLINE_SIZE
+                canvas.fill(x + OUTLINE_SIZE, y + OUTLINE_SIZE, inner_size, inner_size, color)
+            else:
+                canvas.fill(x, y, CELL_SIZE, CELL_SIZE, color)
+
+    legend_width = step * pack.max_cells - CELL_GAP
+    legend_top = top + step * len(pack.segments)
+    for x in range(legend_width):  # color bar from min to max voltage
+        color = get_color(x, 0, max(1, legend_width - 1))
+        canvas.fill(left + x, legend_top, 1, LEGEND_HEIGHT, color)
+
+    return canvas.to_png()
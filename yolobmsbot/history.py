@@ -0,0 +1,200 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import struct
+import threading
+
+from yolobmsbot import utils
+
+HISTORY_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), "history")  # default store folder
+NUMBER_OF_COLUMNS = 18  # values in each row (without time)
+RECORD_HEADER_FORMAT = "<Id"  # row number, time (seconds since epoch, nan if unknown)
+
+
+class HistoryStore(object):
+    """
+    Append-only binary store of all rows ingested for each segment, one file per segment
+    """
+
+    def __init__(self, folder=HISTORY_FOLDER, number_of_columns=NUMBER_OF_COLUMNS):
+        """
+        :param folder: str
+            Path to folder where to store files
+        :param number_of_columns: int
+            Number of values in each row
+        """
+
+        object.__init__(self)
+
+        self.folder = folder
+        self.number_of_columns = number_of_columns
+        self.record = struct.Struct(RECORD_HEADER_FORMAT + "f" * number_of_columns)
+        self.last_records = {}  # segment -> last record in file
+        self.locks = {}  # segment -> lock of its file
+        self.locks_lock = threading.Lock()
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    def get_path(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: str
+            Path to file of segment
+        """
+
+        return os.path.join(self.folder, "segment-" + str(segment) + ".bin")
+
+    def _get_lock(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: Lock
+            Lock guarding file of segment
+        """
+
+        with self.locks_lock:
+            if segment not in self.locks:
+                self.locks[segment] = threading.Lock()
+            return self.locks[segment]
+
+    def _unpack(self, data):
+        """
+        :param data: bytes
+            Packed record
+        :return: tuple int, float, []
+            Row number, time of row, values
+        """
+
+        unpacked = self.record.unpack(data)
+        return unpacked[0], unpacked[1], list(unpacked[2:])
+
+    def _pack(self, row, time, values):
+        """
+        :param row: int
+            Row number
+        :param time: str
+            Time of row
+        :param values: []
+            Values of row
+        :return: bytes
+            Packed record
+        """
+
+        values = [utils.parse_float(v) for v in values[:self.number_of_columns]]
+        values += [float("nan")] * (self.number_of_columns - len(values))  # missing values
+        return self.record.pack(int(row), utils.parse_timestamp(time), *values)
+
+    def get_last(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: tuple int, float, []
+            Last record (row number, time of row, values) stored for segment, None if there is none
+        """
+
+        with self._get_lock(segment):
+            if segment not in self.last_records:
+                self.last_records[segment] = self._read_last(segment)
+            return self.last_records[segment]
+
+    def _read_last(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: tuple int, float, []
+            Last complete record in file of segment, None if there is none
+        """
+
+        path = self.get_path(segment)
+        if not os.path.exists(path):
+            return None
+
+        size = os.path.getsize(path)
+        complete_size = size - size % self.record.size  # a crash may have left a partial record
+        if complete_size != size:
+            with open(path, "r+b") as f:
+                f.truncate(complete_size)
+        if complete_size == 0:
+            return None
+
+        with open(path, "rb") as f:
+            f.seek(complete_size - self.record.size)
+            return self._unpack(f.read(self.record.size))
+
+    def get_cursor(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: int
+            Number of last row ingested for segment (0 if none)
+        """
+
+        last = self.get_last(segment)
+        return last[0] if last is not None else 0
+
+    def append(self, segment, rows):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param rows: [] of tuple int, str, []
+            New rows (row number, time, values) to store, sorted by row number
+        :return: int
+            Number of rows stored (rows not after cursor are skipped)
+        """
+
+        with self._get_lock(segment):
+            if segment not in self.last_records:
+                self.last_records[segment] = self._read_last(segment)
+            last = self.last_records[segment]
+            cursor = last[0] if last is not None else 0
+
+            rows = [row for row in rows if row[0] > cursor]
+            if not rows:
+                return 0
+
+            data = b"".join([self._pack(*row) for row in rows])
+            with open(self.get_path(segment), "ab") as f:
+                f.write(data)
+            self.last_records[segment] = self._unpack(data[-self.record.size:])
+        return len(rows)
+
+    def read(self, segment, since_row=0):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param since_row: int
+            Only records of rows after this one are returned
+        :return: generator of tuple int, float, []
+            Records (row number, time of row, values) of segment
+        """
+
+        path = self.get_path(segment)
+        if not os.path.exists(path):
+            return
+
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(self.record.size)
+                if len(data) < self.record.size:
+                    break
+                record = self._unpack(data)
+                if record[0] > since_row:
+                    yield record
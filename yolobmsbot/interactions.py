@@ -0,0 +1,219 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import sqlite3
+import threading
+import time
+
+INTERACTIONS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "logs", "interactions.sqlite3")
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS actions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        time REAL NOT NULL,
+        user_id INTEGER NOT NULL,
+        command TEXT NOT NULL,
+        text TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS actions_time ON actions (time)",
+    "CREATE INDEX IF NOT EXISTS actions_user_time ON actions (user_id, time)",
+    "CREATE INDEX IF NOT EXISTS actions_command_time ON actions (command, time)",
+    "CREATE INDEX IF NOT EXISTS users_username ON users (username)"
+]
+UPSERT_USER = """INSERT INTO users (id, first_name, last_name, username, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        first_name = excluded.first_name, last_name = excluded.last_name, username = excluded.username,
+        first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)"""
+INSERT_ACTION = "INSERT INTO actions (time, user_id, command, text) VALUES (?, ?, ?, ?)"
+SELECT_USER_COUNTS = """SELECT a.user_id, u.first_name, u.last_name, u.username, COUNT(*) AS actions
+    FROM actions AS a LEFT JOIN users AS u ON u.id = a.user_id
+    WHERE a.time >= ? AND a.time < ?
+    GROUP BY a.user_id ORDER BY actions DESC, a.user_id LIMIT ?"""
+SELECT_COMMAND_COUNTS = """SELECT command, COUNT(*) AS actions, COUNT(DISTINCT user_id) AS users
+    FROM actions WHERE time >= ? AND time < ?
+    GROUP BY command ORDER BY actions DESC, command"""
+SELECT_USER_COMMAND_COUNTS = """SELECT command, COUNT(*) AS actions
+    FROM actions WHERE user_id = ? AND time >= ? AND time < ?
+    GROUP BY command ORDER BY actions DESC, command"""
+SELECT_WINDOW_STATS = """SELECT COUNT(*), COUNT(DISTINCT user_id), MIN(time), MAX(time)
+    FROM actions WHERE time >= ? AND time < ?"""
+SELECT_NEW_USERS = "SELECT COUNT(*) FROM users WHERE first_seen >= ? AND first_seen < ?"
+
+
+def get_command(text):
+    """
+    :param text: str
+        Text of user message (e.g "/cell@yolobmsbot 3 2")
+    :return: str
+        Command of message (e.g "/cell"), empty if message is not a command
+    """
+
+    words = str(text).split()
+    if not words or not words[0].startswith("/"):
+        return ""
+    return words[0].split("@")[0].lower()
+
+
+class InteractionStore(object):
+    """
+    SQLite database (WAL mode) with users and their actions, indexed by user, command and time
+    """
+
+    def __init__(self, path=INTERACTIONS_FILE):
+        """
+        :param path: str
+            Path to database file (created if needed)
+        """
+
+        object.__init__(self)
+
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.lock = threading.Lock()  # guards writes
+        self.local = threading.local()  # read connection of each thread
+        self.connection = self._connect()
+        self.connection.execute("PRAGMA journal_mode=WAL")  # readers do not wait for writer
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def _connect(self):
+        """
+        :return: sqlite3.Connection
+            New connection to database
+        """
+
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, no fsync at each commit
+        return connection
+
+    def _get_reader(self):
+        """
+        :return: sqlite3.Connection
+            Read connection of calling thread
+        """
+
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self._connect()
+        return connection
+
+    def close(self):
+        """
+        :return: void
+            Closes write connection (and read connection of calling thread)
+        """
+
+        with self.lock:
+            self.connection.close()
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def write(self, users, actions):
+        """
+        :param users: [] of tuple
+            Users seen (id, first name, last name, username, time)
+        :param actions: [] of tuple
+            Actions of users (time, user id, text)
+        :return: void
+            Writes users and actions in a single transaction
+        """
+
+        with self.lock, self.connection:
+            if users:
+                self.connection.executemany(
+                    UPSERT_USER, [(u[0], u[1], u[2], u[3], u[4], u[4]) for u in users]
+                )
+            if actions:
+                self.connection.executemany(
+                    INSERT_ACTION, [(a[0], a[1], get_command(a[2]), a[2]) for a in actions]
+                )
+
+    def get_user_counts(self, since, until=None, limit=10):
+        """
+        :param since: float
+            Seconds since epoch of start of window
+        :param until: float
+            Seconds since epoch of end of window (None for now)
+        :param limit: int
+            Max users returned
+        :return: [] of tuple
+            Users (id, first name, last name, username, number of actions) with most actions in window
+        """
+
+        until = time.time() if until is None else until
+        return self._get_reader().execute(SELECT_USER_COUNTS, (since, until, limit)).fetchall()
+
+    def get_command_counts(self, since, until=None):
+        """
+        :param since: float
+            Seconds since epoch of start of window
+        :param until: float
+            Seconds since epoch of end of window (None for now)
+        :return: [] of tuple
+            Commands (command, number of actions, number of users) used in window, most used first
+        """
+
+        until = time.time() if until is None else until
+        return self._get_reader().execute(SELECT_COMMAND_COUNTS, (since, until)).fetchall()
+
+    def get_user_command_counts(self, user_id, since, until=None):
+        """
+        :param user_id: int
+            Id of user
+        :param since: float
+            Seconds since epoch of start of window
+        :param until: float
+            Seconds since epoch of end of window (None for now)
+        :return: [] of tuple
+            Commands (command, number of actions) used by user in window, most used first
+        """
+
+        until = time.time() if until is None else until
+        return self._get_reader().execute(SELECT_USER_COMMAND_COUNTS, (user_id, since, until)).fetchall()
+
+    def get_window_stats(self, since, until=None):
+        """
+        :param since: float
+            Seconds since epoch of start of window
+        :param until: float
+            Seconds since epoch of end of window (None for now)
+        :return: {}
+            "actions", "users" (active ones), "new_users", "first" and "last" (time of first and last action, None
+            if there are no actions) in window
+        """
+
+        until = time.time() if until is None else until
+        reader = self._get_reader()
+        actions, users, first, last = reader.execute(SELECT_WINDOW_STATS, (since, until)).fetchone()
+        new_users = reader.execute(SELECT_NEW_USERS, (since, until)).fetchone()[0]
+        return {"actions": actions, "users": users, "new_users": new_users, "first": first, "last": last}
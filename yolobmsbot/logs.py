@@ -15,21 +15,198 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
+import atexit
+import threading
 import time
-from datetime import datetime
+from collections import deque
 
-DATETIME_NOW = datetime.now()
-SCRIPT_DIRECTORY = os.path.dirname(__file__)  # path to directory of python script running
-LOG_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), str(int(time.time())) + "-logs")
-if not os.path.exists(LOG_FOLDER):  # create necessary folders
-    os.makedirs(LOG_FOLDER)
-LOG_FILES = [os.path.join(LOG_FOLDER, "users.csv"), os.path.join(LOG_FOLDER, "actions.csv")]
+from yolobmsbot.interactions import INTERACTIONS_FILE, InteractionStore
+
+FLUSH_RECORDS = 100  # records are written when there are at least these ones waiting
+FLUSH_SECONDS = 5.0  # ... or when the oldest one has been waiting for these seconds
+USER_RECORD, ACTION_RECORD = "user", "action"
+
+
+class LogWriter(object):
+    """
+    Queue of log records written in batches by a background thread: logging never waits for disk
+    """
+
+    def __init__(self, path=INTERACTIONS_FILE, flush_records=FLUSH_RECORDS, flush_seconds=FLUSH_SECONDS):
+        """
+        :param path: str
+            Path to interactions database (opened when first batch is written)
+        :param flush_records: int
+            Records are written when there are at least these ones waiting
+        :param flush_seconds: float
+            Records are written when the oldest one has been waiting for these seconds
+        """
+
+        object.__init__(self)
+
+        self.path = path
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.store = None  # InteractionStore
+        self.store_lock = threading.Lock()
+        self.records = deque()  # (kind, values) waiting to be written
+        self.oldest_time = None  # when oldest waiting record has been queued
+        self.written = 0  # records written so far
+        self.condition = threading.Condition()
+        self.flush_asked = False
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """
+        :return: void
+            Starts background writer
+        """
+
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """
+        :return: void
+            Writes all waiting records and stops background writer
+        """
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._write(self._take_all())  # records queued while stopping
+
+    def get_store(self):
+        """
+        :return: InteractionStore
+            Interactions database (opened if needed)
+        """
+
+        with self.store_lock:
+            if self.store is None:
+                self.store = InteractionStore(self.path)
+            return self.store
+
+    def put(self, kind, values):
+        """
+        :param kind: str
+            USER_RECORD or ACTION_RECORD
+        :param values: tuple
+            Values of record
+        :return: void
+            Queues record (written later by background writer)
+        """
+
+        with self.condition:
+            if not self.records:
+                self.oldest_time = time.monotonic()
+            self.records.append((kind, values))
+            if len(self.records) >= self.flush_records:
+                self.condition.notify()
+        if not self.running:
+            self.start()
+
+    def flush(self):
+        """
+        :return: void
+            Writes all waiting records now (waits for them to be written)
+        """
+
+        with self.condition:
+            if not self.running:
+                records = self._take_all_locked()
+            else:
+                self.flush_asked = True
+                self.condition.notify_all()
+                while self.flush_asked and self.running:
+                    self.condition.wait()
+                return
+        self._write(records)
+
+    def _take_all_locked(self):
+        """
+        :return: [] of tuple str, tuple
+            All waiting records (to be called with condition held)
+        """
+
+        records = list(self.records)
+        self.records.clear()
+        self.oldest_time = None
+        return records
+
+    def _take_all(self):
+        """
+        :return: [] of tuple str, tuple
+            All waiting records
+        """
+
+        with self.condition:
+            return self._take_all_locked()
+
+    def _write(self, records):
+        """
+        :param records: [] of tuple str, tuple
+            Records to write
+        :return: void
+            Writes records to database in a single transaction
+        """
+
+        if not records:
+            return
+
+        users = [values for kind, values in records if kind == USER_RECORD]
+        actions = [values for kind, values in records if kind == ACTION_RECORD]
+        try:
+            self.get_store().write(users, actions)
+            self.written += len(records)
+        except Exception as e:
+            print("Cannot write " + str(len(records)) + " log records: " + str(e))
+
+    def _run(self):
+        """
+        :return: void
+            Writes batches of records until stopped
+        """
+
+        while True:
+            with self.condition:
+                while self.running and not self.flush_asked and len(self.records) < self.flush_records:
+                    if self.records:
+                        wait = self.oldest_time + self.flush_seconds - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self.condition.wait(wait)
+                    else:
+                        self.condition.wait()
+                records = self._take_all_locked()
+                flush_asked = self.flush_asked
+                running = self.running
+
+            self._write(records)  # disk I/O without holding condition
+
+            if flush_asked:
+                with self.condition:
+                    self.flush_asked = False
+                    self.condition.notify_all()
+            if not running:
+                return
+
+
+WRITER = LogWriter()  # writer of interactions database
+atexit.register(WRITER.close)  # records still waiting are written on shutdown
 
 
 def log_users(user_id, user_first_name, user_last_name, user_username):
     """
-    :param user_id: str
+    :param user_id: int
         User id to log
     :param user_first_name: str
         User first name to log
@@ -38,69 +215,48 @@ def log_users(user_id, user_first_name, user_last_name, user_username):
     :param user_username: str
         User name to log
     :return: void
-        Log user name to log file
+        Log user (names are updated if user is already known)
     """
 
-    log_values_to_file(
-        LOG_FILES[0],
-        [
-            str(datetime.now()), str(user_id), str(user_first_name), str(user_last_name), str(user_username)
-        ]
-    )
+    WRITER.put(USER_RECORD, (int(user_id), user_first_name, user_last_name, user_username, time.time()))
 
 
-def log_user_action(user, action):
+def log_user_action(user_id, action):
     """
-    :param user: str
-        User name to log
+    :param user_id: int
+        Id of user
     :param action: str
-        What user did
+        What user did (text of message)
     :return: void
-        Log user name and action to log file
+        Log action of user
     """
 
-    time_now = datetime.now()
-    log_values_to_file(LOG_FILES[1], [str(time_now), str(user), str(action)])
+    WRITER.put(ACTION_RECORD, (time.time(), int(user_id), str(action)))
 
 
-def log_values_to_file(log_file, values):
+def get_store():
     """
-    :param log_file: str
-        Path to file to log
-    :param values: []
-        Array to log
-    :return: void
-        Append values to log file
+    :return: InteractionStore
+        Interactions database, to query usage stats (records still waiting are not there yet)
     """
 
-    with open(log_file, "a") as logger:
-        str_val = ["\"" + str(v) + "\"" for v in values]
-        new_row = ",".join(str_val)
-        logger.write(new_row)
-        logger.write("\n")
+    return WRITER.get_store()
 
 
 def setup_log_files():
     """
     :return: void
-        Append headers to log files
+        Opens interactions database and starts background writer
+    """
+
+    WRITER.get_store()
+    WRITER.start()
+
+
+def close_log_files():
+    """
+    :return: void
+        Writes all waiting records and stops background writer
     """
 
-    log_values_to_file(
-        LOG_FILES[0],
-        [
-            "time %Y-%m-%d %H:%M:%S",
-            "user id",
-            "first name",
-            "last name"
-        ]
-    )
-
-    log_values_to_file(
-        LOG_FILES[1],
-        [
-            "time %Y-%m-%d %H:%M:%S",
-            "user id",
-            "action"
-        ]
-    )
+    WRITER.close()
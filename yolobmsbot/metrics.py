@@ -0,0 +1,488 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)  # upper bounds (seconds) of histograms buckets
+METRICS_PATH = "/metrics"
+
+
+class CounterValue(object):
+    """
+    Value that only goes up
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        """
+        :param amount: float
+            How much to add
+        :return: void
+            Adds amount to counter
+        """
+
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        """
+        :return: float
+            Value of counter
+        """
+
+        return self.value
+
+
+class HistogramValue(object):
+    """
+    Number of observations in each bucket, with their count and sum
+    """
+
+    def __init__(self, buckets):
+        """
+        :param buckets: tuple
+            Upper bounds of buckets (sorted)
+        """
+
+        object.__init__(self)
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        :param value: float
+            Observed value
+        :return: void
+            Adds value to its bucket
+        """
+
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        """
+        :return: Timer
+            Context manager observing seconds spent in it
+        """
+
+        return Timer(self)
+
+    def get(self):
+        """
+        :return: tuple [], int, float
+            Cumulative counts of buckets (last is +Inf), count and sum of observations
+        """
+
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, running, total
+
+    def get_quantile(self, q):
+        """
+        :param q: float
+            Quantile (0 to 1)
+        :return: float
+            Upper bound of bucket of quantile (nan if there are no observations)
+        """
+
+        cumulative, count, _ = self.get()
+        if count == 0:
+            return math.nan
+        rank = q * count
+        for bound, c in zip(self.buckets + (math.inf,), cumulative):
+            if c >= rank:
+                return bound
+        return math.inf
+
+
+class Timer(object):
+    """
+    Context manager observing seconds spent in it
+    """
+
+    def __init__(self, histogram):
+        """
+        :param histogram: HistogramValue
+            Where to observe seconds
+        """
+
+        object.__init__(self)
+
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Metric(object):
+    """
+    Family of values with the same name, one for each combination of labels
+    """
+
+    def __init__(self, name, description, kind, label_names=(), buckets=LATENCY_BUCKETS):
+        """
+        :param name: str
+            Name of metric
+        :param description: str
+            What metric measures
+        :param kind: str
+            "counter" or "histogram"
+        :param label_names: tuple
+            Names of labels
+        :param buckets: tuple
+            Upper bounds of buckets (histograms only)
+        """
+
+        object.__init__(self)
+
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.children = {}  # label values -> value
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        :param values: str
+            Value of each label
+        :return: CounterValue or HistogramValue
+            Value of metric for labels (created if needed)
+        """
+
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = CounterValue() if self.kind == "counter" else HistogramValue(self.buckets)
+                    self.children[values] = child
+        return child
+
+    def inc(self, amount=1.0):
+        """
+        :param amount: float
+            How much to add
+        :return: void
+            Adds amount to counter without labels
+        """
+
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        """
+        :param value: float
+            Observed value
+        :return: void
+            Observes value in histogram without labels
+        """
+
+        self.labels().observe(value)
+
+    def time(self):
+        """
+        :return: Timer
+            Context manager observing seconds spent in it (histogram without labels)
+        """
+
+        return self.labels().time()
+
+    def get_children(self):
+        """
+        :return: [] of tuple {}, obj
+            Labels and value of each child (sorted by labels)
+        """
+
+        with self.lock:
+            items = sorted(self.children.items())
+        return [(dict(zip(self.label_names, values)), child) for values, child in items]
+
+
+class Gauge(object):
+    """
+    Value computed only when metrics are read
+    """
+
+    def __init__(self, name, description, function):
+        """
+        :param name: str
+            Name of metric
+        :param description: str
+            What metric measures
+        :param function: callable
+            Returns value of gauge (no arguments), None if not available
+        """
+
+        object.__init__(self)
+
+        self.name = name
+        self.description = description
+        self.kind = "gauge"
+        self.function = function
+
+    def get(self):
+        """
+        :return: float
+            Value of gauge (nan if not available)
+        """
+
+        try:
+            value = self.function()
+        except Exception:
+            return math.nan
+        return math.nan if value is None else float(value)
+
+
+def format_labels(labels, extra=None):
+    """
+    :param labels: {}
+        Labels of value
+    :param extra: tuple str, str
+        Additional label (name, value)
+    :return: str
+        Labels in Prometheus text format (e.g {command="/cell"})
+    """
+
+    items = list(labels.items()) + ([extra] if extra is not None else [])
+    if not items:
+        return ""
+    return "{" + ",".join(
+        [name + "=\"" + str(value).replace("\\", "\\\\").replace("\"", "\\\"") + "\"" for name, value in items]
+    ) + "}"
+
+
+def format_number(value):
+    """
+    :param value: float
+        Value
+    :return: str
+        Value in Prometheus text format
+    """
+
+    if math.isnan(value):
+        return "NaN"
+    elif math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class MetricsRegistry(object):
+    """
+    All metrics of bot: counters and histograms are updated by instrumented code, gauges are computed when read
+    """
+
+    def __init__(self):
+        object.__init__(self)
+
+        self.metrics = {}  # name -> metric
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        """
+        :param metric: Metric or Gauge
+            Metric to register
+        :return: Metric or Gauge
+            Registered metric with the same name (the given one if it is new)
+        """
+
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description, label_names=()):
+        """
+        :param name: str
+            Name of counter
+        :param description: str
+            What counter measures
+        :param label_names: tuple
+            Names of labels
+        :return: Metric
+            Counter
+        """
+
+        return self._register(Metric(name, description, "counter", label_names))
+
+    def histogram(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        """
+        :param name: str
+            Name of histogram
+        :param description: str
+            What histogram measures
+        :param label_names: tuple
+            Names of labels
+        :param buckets: tuple
+            Upper bounds of buckets
+        :return: Metric
+            Histogram
+        """
+
+        return self._register(Metric(name, description, "histogram", label_names, buckets))
+
+    def gauge(self, name, description, function):
+        """
+        :param name: str
+            Name of gauge
+        :param description: str
+            What gauge measures
+        :param function: callable
+            Returns value of gauge (no arguments)
+        :return: Gauge
+            Gauge (replaces the one with the same name, if any)
+        """
+
+        gauge = Gauge(name, description, function)
+        with self.lock:
+            self.metrics[name] = gauge
+        return gauge
+
+    def get_metrics(self):
+        """
+        :return: [] of Metric or Gauge
+            All metrics sorted by name
+        """
+
+        with self.lock:
+            return [self.metrics[name] for name in sorted(self.metrics.keys())]
+
+    def render(self):
+        """
+        :return: str
+            All metrics in Prometheus text format
+        """
+
+        lines = []
+        for metric in self.get_metrics():
+            lines.append("# HELP " + metric.name + " " + metric.description)
+            lines.append("# TYPE " + metric.name + " " + metric.kind)
+            if metric.kind == "gauge":
+                lines.append(metric.name + " " + format_number(metric.get()))
+                continue
+
+            for labels, child in metric.get_children():
+                if metric.kind == "counter":
+                    lines.append(metric.name + format_labels(labels) + " " + format_number(child.get()))
+                    continue
+
+                cumulative, count, total = child.get()
+                for bound, c in zip(metric.buckets + (math.inf,), cumulative):
+                    lines.append(
+                        metric.name + "_bucket" + format_labels(labels, ("le", format_number(bound))) + " " + str(c)
+                    )
+                lines.append(metric.name + "_count" + format_labels(labels) + " " + str(count))
+                lines.append(metric.name + "_sum" + format_labels(labels) + " " + format_number(total))
+        return "\n".join(lines) + "\n"
+
+    def get_summary(self):
+        """
+        :return: [] of str
+            A line for each value: counters and gauges values, histograms count, mean, p50 and p95
+        """
+
+        lines = []
+        for metric in self.get_metrics():
+            if metric.kind == "gauge":
+                lines.append(metric.name + ": " + "{0:.3g}".format(metric.get()))
+                continue
+
+            for labels, child in metric.get_children():
+                name = metric.name + format_labels(labels)
+                if metric.kind == "counter":
+                    lines.append(name + ": " + "{0:.0f}".format(child.get()))
+                    continue
+
+                _, count, total = child.get()
+                if count == 0:
+                    continue
+                lines.append(
+                    name + ": " + str(count) + " calls, mean " + "{0:.3f}".format(total / count) + " s, p50 <= " +
+                    "{0:g}".format(child.get_quantile(0.5)) + " s, p95 <= " + "{0:g}".format(child.get_quantile(0.95)) +
+                    " s"
+                )
+        return lines
+
+
+REGISTRY = MetricsRegistry()  # metrics of the whole bot
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Replies to GET /metrics with metrics of registry of server
+    """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != METRICS_PATH:
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # no line printed for each scrape
+
+
+def start_http_server(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    :param port: int
+        Port to listen on (0 for any free one)
+    :param host: str
+        Address to listen on (local only by default)
+    :param registry: MetricsRegistry
+        Metrics to expose
+    :return: ThreadingHTTPServer
+        Server running in a background thread (call shutdown() to stop it)
+    """
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
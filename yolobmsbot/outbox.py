@@ -0,0 +1,316 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import heapq
+import threading
+import time
+from collections import deque
+
+CHAT_INTERVAL_SECONDS = 1.0  # min seconds between 2 messages to the same chat
+GLOBAL_RATE = 30.0  # max messages per second to all chats
+GLOBAL_BURST = 30  # messages that can be sent at once after an idle period
+MAX_SEND_ATTEMPTS = 5  # a message is dropped after these failed attempts
+BACKOFF_SECONDS = 1.0  # wait after first failed attempt (doubled at each next one)
+MAX_BACKOFF_SECONDS = 60.0
+SENDER_THREADS = 4  # messages being sent at the same time (at most one per chat)
+
+
+class TokenBucket(object):
+    """
+    Allows at most rate events per second, with bursts of capacity events
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        :param rate: float
+            Tokens added per second
+        :param capacity: int
+            Max tokens in bucket
+        """
+
+        object.__init__(self)
+
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_time = time.monotonic()
+
+    def take(self, now):
+        """
+        :param now: float
+            Monotonic time
+        :return: float
+            0 if a token has been taken, else seconds to wait for the next one
+        """
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class OutboundMessage(object):
+    """
+    Message waiting to be sent to a chat
+    """
+
+    def __init__(self, send, on_sent=None):
+        """
+        :param send: callable
+            Sends message (no arguments), may be called again if it fails
+        :param on_sent: callable
+            Called with result of send once message has been sent (None to ignore it)
+        """
+
+        object.__init__(self)
+
+        self.send = send
+        self.on_sent = on_sent
+        self.attempts = 0
+
+
+class MessageOutbox(object):
+    """
+    Queue of outbound messages: handlers enqueue and return straight away, sender threads deliver messages of each
+    chat in order, at most one per CHAT_INTERVAL_SECONDS per chat and GLOBAL_RATE per second overall. Messages are
+    sent again after the retry_after asked by Telegram, or with exponential backoff on other errors
+    """
+
+    def __init__(self, chat_interval=CHAT_INTERVAL_SECONDS, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST,
+                 max_attempts=MAX_SEND_ATTEMPTS, threads=SENDER_THREADS):
+        """
+        :param chat_interval: float
+            Min seconds between 2 messages to the same chat
+        :param global_rate: float
+            Max messages per second to all chats
+        :param global_burst: int
+            Messages that can be sent at once after an idle period
+        :param max_attempts: int
+            A message is dropped after these failed attempts
+        :param threads: int
+            Number of sender threads
+        """
+
+        object.__init__(self)
+
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.threads_count = threads
+        self.bucket = TokenBucket(global_rate, global_burst)
+        self.queues = {}  # chat -> deque of messages to send
+        self.ready = []  # heap of (time when chat can be sent next message, order, chat)
+        self.not_before = {}  # chat -> time when it can be sent next message
+        self.counter = 0  # order of chats with same time in heap
+        self.pending = 0  # messages enqueued and not yet sent or dropped
+        self.sent = 0
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = False
+
+    def start(self):
+        """
+        :return: void
+            Starts sender threads
+        """
+
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.threads = [
+            threading.Thread(target=self._run, name="outbox-" + str(i), daemon=True) for i in range(self.threads_count)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """
+        :param timeout: float
+            Max seconds to wait for pending messages (None to wait for all of them)
+        :return: void
+            Waits for pending messages then stops sender threads
+        """
+
+        self.flush(timeout)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def flush(self, timeout=None):
+        """
+        :param timeout: float
+            Max seconds to wait (None for no limit)
+        :return: bool
+            True iff all enqueued messages have been sent (or dropped)
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def put(self, chat, send, on_sent=None):
+        """
+        :param chat: int
+            Id of chat
+        :param send: callable
+            Sends message (no arguments), may be called again if it fails
+        :param on_sent: callable
+            Called with result of send once message has been sent (None to ignore it)
+        :return: void
+            Enqueues message, it will be sent after the ones already enqueued for the same chat
+        """
+
+        with self.condition:
+            queue = self.queues.get(chat)
+            if queue is None:
+                queue = self.queues[chat] = deque()
+            queue.append(OutboundMessage(send, on_sent))
+            self.pending += 1
+            if len(queue) == 1:  # chat is neither waiting nor being sent to
+                now = time.monotonic()
+                self._schedule(chat, max(now, self.not_before.get(chat, now)))
+            self.condition.notify()
+
+    def _schedule(self, chat, when):
+        """
+        :param chat: int
+            Id of chat
+        :param when: float
+            Monotonic time when chat can be sent its next message
+        :return: void
+            Puts chat in heap of chats with messages to send (to be called with condition held)
+        """
+
+        self.not_before[chat] = when
+        self.counter += 1
+        heapq.heappush(self.ready, (when, self.counter, chat))
+
+    def _next(self):
+        """
+        :return: tuple int, OutboundMessage
+            Chat and its next message to send (None when stopped), waits until rate limits allow to send it
+        """
+
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                if not self.ready:
+                    self.condition.wait()
+                    continue
+
+                when = self.ready[0][0]
+                if when > now:  # first chat cannot be sent messages yet
+                    self.condition.wait(when - now)
+                    continue
+
+                wait = self.bucket.take(now)
+                if wait > 0:  # global limit reached
+                    self.condition.wait(wait)
+                    continue
+
+                _, _, chat = heapq.heappop(self.ready)
+                return chat, self.queues[chat][0]  # chat is out of heap: no other thread sends to it
+            return None, None
+
+    def _run(self):
+        """
+        :return: void
+            Sends messages until stopped
+        """
+
+        while True:
+            chat, message = self._next()
+            if message is None:
+                return
+
+            retry_after = None
+            try:
+                result = message.send()
+                if message.on_sent is not None:
+                    try:
+                        message.on_sent(result)
+                    except Exception as e:
+                        print("Cannot handle message sent to chat " + str(chat) + ": " + str(e))
+            except Exception as e:
+                message.attempts += 1
+                retry_after = getattr(e, "retry_after", None)  # Telegram asks to wait (flood control)
+                if retry_after is None:
+                    retry_after = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (message.attempts - 1))
+                if message.attempts >= self.max_attempts:
+                    print("Dropping message to chat " + str(chat) + " after " + str(message.attempts) +
+                          " attempts: " + str(e))
+                    retry_after = None
+                    self._done(chat, False)
+                    continue
+                print("Cannot send message to chat " + str(chat) + " (" + str(e) + "), retrying in " +
+                      str(retry_after) + " seconds")
+
+            if retry_after is None:
+                self._done(chat, True)
+            else:
+                with self.condition:
+                    self._schedule(chat, time.monotonic() + float(retry_after))
+                    self.condition.notify()
+
+    def _done(self, chat, sent):
+        """
+        :param chat: int
+            Id of chat
+        :param sent: bool
+            True iff first message of chat has been sent, False if it has been dropped
+        :return: void
+            Removes first message of chat and schedules the next one
+        """
+
+        with self.condition:
+            queue = self.queues[chat]
+            queue.popleft()
+            self.pending -= 1
+            if sent:
+                self.sent += 1
+            else:
+                self.dropped += 1
+
+            if queue:
+                self._schedule(chat, time.monotonic() + self.chat_interval)
+            else:
+                del self.queues[chat]
+                self.not_before[chat] = time.monotonic() + self.chat_interval  # keep interval for next messages
+                self._forget_chats()
+            self.condition.notify_all()
+
+    def _forget_chats(self):
+        """
+        :return: void
+            Forgets chats with no messages whose interval is over (to be called with condition held)
+        """
+
+        now = time.monotonic()
+        for chat in [c for c, t in self.not_before.items() if t <= now and c not in self.queues]:
+            del self.not_before[chat]
@@ -0,0 +1,130 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+from html import escape
+
+from yolobmsbot.batterypack import BatteryCellValue
+
+MAX_MESSAGE_LENGTH = 4096  # max characters in a Telegram message
+PARSE_MODE = "HTML"  # tables are sent as <pre> blocks
+TABLE_START, TABLE_END = "<pre>", "</pre>"
+CELLS_PER_LINE = 3  # cells in each line of a segment table
+TIME_LENGTH = 64  # characters kept in first message for time of values (added to title after table is built)
+CELLS_TITLE = "Voltages of cells (mV)"
+SEGMENTS_TITLE = "Voltages of segments (mV)"
+
+
+def split_blocks(blocks, title="", max_length=MAX_MESSAGE_LENGTH, reserved=0):
+    """
+    :param blocks: [] of []
+        Blocks of lines of a table (a block is split only if it does not fit in a message)
+    :param title: str
+        Text before table in first message
+    :param max_length: int
+        Max characters in a message
+    :param reserved: int
+        Characters kept free in first message for text added later to title
+    :return: [] of str
+        Messages with as many blocks as possible in each one
+    """
+
+    chunks = []  # lines of each message
+    current, length = [], 0
+    budget = max_length - len(TABLE_START) - len(TABLE_END)
+    first_budget = (budget - len(title) - 1 if title else budget) - reserved
+
+    for block in blocks:
+        block_length = sum([len(line) + 1 for line in block])
+        if current and length + block_length > (first_budget if not chunks else budget):
+            chunks.append(current)
+            current, length = [], 0
+        for line in block:
+            limit = first_budget if not chunks else budget
+            if current and length + len(line) + 1 > limit:  # block does not fit in a message
+                chunks.append(current)
+                current, length = [], 0
+            current.append(line[:budget - 1])
+            length += len(line) + 1
+    if current or not chunks:
+        chunks.append(current)
+
+    messages = [TABLE_START + "\n".join(lines) + TABLE_END for lines in chunks]
+    if title:
+        messages[0] = title + "\n" + messages[0]
+    return messages
+
+
+def add_time(messages, title, time):
+    """
+    :param messages: [] of str
+        Messages of a table with title
+    :param title: str
+        Title of table
+    :param time: str
+        When values have been read (e.g " as of 2017-04-29 at 10:30:00 (5 minutes ago)")
+    :return: [] of str
+        Messages with time of values after title (messages of cached tables are not modified)
+    """
+
+    return [title + escape(time) + messages[0][len(title):]] + messages[1:]
+
+
+def get_cells_table(snapshot):
+    """
+    :param snapshot: BatteryPackSnapshot
+        Values to reply with
+    :return: [] of str
+        Messages with a table of voltages of all cells, a block for each segment (titled CELLS_TITLE, with room
+        for time of values)
+    """
+
+    blocks = []
+    averages = snapshot.pack.get_averages(BatteryCellValue.voltage)
+    for s, segment in enumerate(snapshot.pack.segments):
+        voltages = segment.get(BatteryCellValue.voltage)
+        lines = ["Segment {0} (avg {1:.2f})".format(s + 1, averages[s])]
+        for start in range(0, len(voltages), CELLS_PER_LINE):
+            lines.append("  ".join([
+                "{0:>2} {1:>7.1f}".format(c + 1, voltages[c])
+                for c in range(start, min(start + CELLS_PER_LINE, len(voltages)))
+            ]))
+        lines.append("")
+        blocks.append(lines)
+
+    return split_blocks(blocks, CELLS_TITLE, reserved=TIME_LENGTH)
+
+
+def get_segments_table(snapshot):
+    """
+    :param snapshot: BatteryPackSnapshot
+        Values to reply with
+    :return: [] of str
+        Messages with a table of average, min and max voltage of all segments (titled SEGMENTS_TITLE, with room
+        for time of values)
+    """
+
+    lines = ["Seg      avg      min      max"]
+    averages = snapshot.pack.get_averages(BatteryCellValue.voltage)
+    for s, segment in enumerate(snapshot.pack.segments):
+        voltages = [v for v in segment.get(BatteryCellValue.voltage) if not math.isnan(v)]  # skip invalid readings
+        lines.append("{0:>3} {1:>8.2f} {2:>8.1f} {3:>8.1f}".format(
+            s + 1, averages[s], min(voltages) if voltages else math.nan, max(voltages) if voltages else math.nan
+        ))
+
+    return split_blocks([[line] for line in lines], SEGMENTS_TITLE, reserved=TIME_LENGTH)
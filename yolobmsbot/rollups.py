@@ -0,0 +1,341 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import threading
+from array import array
+from time import perf_counter
+
+from yolobmsbot import utils
+
+RESOLUTIONS = [
+    (60, 1440),  # 1 minute buckets for a day
+    (15 * 60, 672),  # 15 minutes buckets for a week
+    (3600, 30 * 24),  # 1 hour buckets for 30 days
+    (86400, 366)  # 1 day buckets for a year
+]  # (seconds in bucket, number of buckets kept)
+MAX_BUCKETS_PER_QUERY = 300  # finest resolution used by a query is the one with at most these buckets in window
+
+
+class RollupRing(object):
+    """
+    Buckets of one resolution for all cells of a segment (plus the average of segment): count, sum, min, max and last
+    value of each. Bucket of a time is found by its position, old buckets are overwritten by new ones
+    """
+
+    def __init__(self, resolution, capacity, number_of_series):
+        """
+        :param resolution: int
+            Seconds in bucket
+        :param capacity: int
+            Number of buckets kept
+        :param number_of_series: int
+            Number of values in each sample
+        """
+
+        object.__init__(self)
+
+        self.resolution = resolution
+        self.capacity = capacity
+        self.width = number_of_series
+        self.starts = array("d", [-1.0] * capacity)  # start time of bucket in each slot (-1 if empty)
+        self.last_times = array("d", [-1.0] * capacity)
+        size = capacity * number_of_series
+        self.counts = array("d", bytes(8 * size))
+        self.sums = array("d", bytes(8 * size))
+        self.mins = array("d", [math.inf] * size)
+        self.maxs = array("d", [-math.inf] * size)
+        self.lasts = array("d", [math.nan] * size)
+
+    def get_slot(self, start):
+        """
+        :param start: float
+            Start time of bucket
+        :return: int
+            Slot of bucket
+        """
+
+        return int(start // self.resolution) % self.capacity
+
+    def add(self, time, values):
+        """
+        :param time: float
+            Seconds since epoch of sample
+        :param values: []
+            Value of each series (nan if missing)
+        :return: void
+            Adds sample to its bucket
+        """
+
+        start = (time // self.resolution) * self.resolution
+        slot = self.get_slot(start)
+        if self.starts[slot] > start:  # bucket of sample has already been overwritten
+            return
+
+        offset = slot * self.width
+        if self.starts[slot] != start:  # reset slot for new bucket
+            self.starts[slot] = start
+            self.last_times[slot] = -1.0
+            self.counts[offset:offset + self.width] = array("d", bytes(8 * self.width))
+            self.sums[offset:offset + self.width] = array("d", bytes(8 * self.width))
+            self.mins[offset:offset + self.width] = array("d", [math.inf] * self.width)
+            self.maxs[offset:offset + self.width] = array("d", [-math.inf] * self.width)
+            self.lasts[offset:offset + self.width] = array("d", [math.nan] * self.width)
+
+        is_last = time >= self.last_times[slot]
+        if is_last:
+            self.last_times[slot] = time
+        for i, value in enumerate(values[:self.width]):
+            if math.isnan(value):
+                continue
+            j = offset + i
+            self.counts[j] += 1
+            self.sums[j] += value
+            if value < self.mins[j]:
+                self.mins[j] = value
+            if value > self.maxs[j]:
+                self.maxs[j] = value
+            if is_last:
+                self.lasts[j] = value
+
+    def get_buckets(self, series, start_time, end_time):
+        """
+        :param series: int
+            Index of series
+        :param start_time: float
+            Seconds since epoch of start of window
+        :param end_time: float
+            Seconds since epoch of end of window
+        :return: [] of tuple float, float, float, float, float, float, float
+            Start time, count, min, max, mean, last value and time of last sample of buckets in window (oldest first)
+        """
+
+        start_time = max(start_time, end_time - self.resolution * self.capacity)  # older buckets are overwritten
+        buckets = []
+        start = (start_time // self.resolution) * self.resolution
+        while start <= end_time:
+            slot = self.get_slot(start)
+            j = slot * self.width + series
+            if self.starts[slot] == start and self.counts[j] > 0:
+                buckets.append((
+                    start, self.counts[j], self.mins[j], self.maxs[j], self.sums[j] / self.counts[j], self.lasts[j],
+                    self.last_times[slot]
+                ))
+            start += self.resolution
+        return buckets
+
+
+class RollupEngine(object):
+    """
+    Min, max, mean and last value of every cell and segment at several resolutions, updated with each new sample
+    """
+
+    def __init__(self, number_of_cells_per_segment, resolutions=RESOLUTIONS):
+        """
+        :param number_of_cells_per_segment: list
+            Each elements in the list is the number of the cells for each segment in battery pack
+        :param resolutions: [] of tuple int, int
+            Seconds in bucket and number of buckets kept of each resolution
+        """
+
+        object.__init__(self)
+
+        self.number_of_cells_per_segment = list(number_of_cells_per_segment)
+        self.resolutions = sorted(resolutions)
+        self.rings = [
+            [RollupRing(resolution, capacity, num_of_cells + 1) for resolution, capacity in self.resolutions]
+            for num_of_cells in self.number_of_cells_per_segment
+        ]  # segment -> resolution -> ring (last series is the average of segment)
+        self.last_times = [-math.inf] * len(self.number_of_cells_per_segment)  # time of last sample of segments
+        self.loading = False  # True while history is being added
+        self.pending = []  # samples (segment, time, values) added while history is being loaded
+        self.thread = None  # background loader of history
+        self.lock = threading.Lock()
+
+    def add(self, segment, time, values):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param time: float
+            Seconds since epoch of sample
+        :param values: []
+            Values of cells
+        :return: void
+            Adds sample to buckets of all resolutions (samples not newer than last one are skipped). While history
+            is being loaded, sample is added after it
+        """
+
+        with self.lock:
+            if self.loading:
+                self.pending.append((segment, time, values))
+                return
+        self._add(segment, time, values)
+
+    def _add(self, segment, time, values):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param time: float
+            Seconds since epoch of sample
+        :param values: []
+            Values of cells
+        :return: void
+            Adds sample to buckets of all resolutions (samples not newer than last one are skipped)
+        """
+
+        if math.isnan(time) or time <= self.last_times[segment]:
+            return
+
+        num_of_cells = self.number_of_cells_per_segment[segment]
+        values = [utils.parse_float(v) for v in values[:num_of_cells]]
+        values += [math.nan] * (num_of_cells - len(values))
+        valid_values = [v for v in values if not math.isnan(v)]
+        values.append(sum(valid_values) / len(valid_values) if valid_values else math.nan)  # segment average
+
+        with self.lock:
+            self.last_times[segment] = time
+            for ring in self.rings[segment]:
+                ring.add(time, values)
+
+    def add_rows(self, segment, rows):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param rows: [] of tuple int, str, []
+            Rows (row number, time, values) to add
+        :return: void
+            Adds all rows to buckets
+        """
+
+        for _, time, values in rows:
+            self.add(segment, utils.parse_timestamp(time), values)
+
+    def load_history(self, history):
+        """
+        :param history: HistoryStore
+            Store with rows of segments
+        :return: void
+            Adds all rows stored in history (to be called at startup), then samples added meanwhile
+        """
+
+        with self.lock:
+            self.loading = True
+        try:
+            for segment in range(len(self.number_of_cells_per_segment)):
+                for _, time, values in history.read(segment):
+                    self._add(segment, time, values)
+        finally:
+            while True:  # samples added meanwhile are newer than history
+                with self.lock:
+                    pending, self.pending = self.pending, []
+                    if not pending:
+                        self.loading = False
+                        break
+                for segment, time, values in pending:
+                    self._add(segment, time, values)
+
+    def start_loading(self, history):
+        """
+        :param history: HistoryStore
+            Store with rows of segments
+        :return: void
+            Adds all rows stored in history in a background thread (bot replies meanwhile)
+        """
+
+        with self.lock:
+            self.loading = True  # samples added from now on wait for history
+
+        def load():
+            start = perf_counter()
+            self.load_history(history)
+            print("Loaded history in rollups in " + "{0:.1f}".format(perf_counter() - start) + " s")
+
+        self.thread = threading.Thread(target=load, name="RollupsLoader", daemon=True)
+        self.thread.start()
+
+    def is_loading(self):
+        """
+        :return: bool
+            True iff history is still being loaded (buckets are not complete yet)
+        """
+
+        with self.lock:
+            return self.loading
+
+    def get_resolution(self, window):
+        """
+        :param window: float
+            Seconds in window
+        :return: int
+            Index of finest resolution with at most MAX_BUCKETS_PER_QUERY buckets in window that keeps the whole window
+            (coarsest resolution if none)
+        """
+
+        for i, (resolution, capacity) in enumerate(self.resolutions):
+            if window / resolution <= MAX_BUCKETS_PER_QUERY and resolution * capacity >= window:
+                return i
+        return len(self.resolutions) - 1
+
+    def get_buckets(self, cell, segment, start_time, end_time):
+        """
+        :param cell: int
+            Number of cell (starts from 0), None for the average of segment
+        :param segment: int
+            Number of segment (starts from 0)
+        :param start_time: float
+            Seconds since epoch of start of window
+        :param end_time: float
+            Seconds since epoch of end of window
+        :return: tuple int, []
+            Seconds in bucket and buckets (start time, count, min, max, mean, last, last time) in window
+        """
+
+        series = self.number_of_cells_per_segment[segment] if cell is None else cell
+        ring = self.rings[segment][self.get_resolution(end_time - start_time)]
+        with self.lock:
+            return ring.resolution, ring.get_buckets(series, start_time, end_time)
+
+    def get_summary(self, cell, segment, start_time, end_time):
+        """
+        :param cell: int
+            Number of cell (starts from 0), None for the average of segment
+        :param segment: int
+            Number of segment (starts from 0)
+        :param start_time: float
+            Seconds since epoch of start of window
+        :param end_time: float
+            Seconds since epoch of end of window
+        :return: {}
+            "resolution", "count", "min", "max", "mean", "last" and "last_time" of values in window, None if there are
+            no values
+        """
+
+        resolution, buckets = self.get_buckets(cell, segment, start_time, end_time)
+        if not buckets:
+            return None
+
+        count = sum([b[1] for b in buckets])
+        return {
+            "resolution": resolution,
+            "count": int(count),
+            "min": min([b[2] for b in buckets]),
+            "max": max([b[3] for b in buckets]),
+            "mean": sum([b[1] * b[4] for b in buckets]) / count,
+            "last": buckets[-1][5],
+            "last_time": buckets[-1][6]
+        }
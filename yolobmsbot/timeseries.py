@@ -0,0 +1,305 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import math
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+
+from yolobmsbot import utils
+from yolobmsbot.history import HISTORY_FOLDER
+
+TIMESERIES_FILE = os.path.join(HISTORY_FOLDER, "cells.ring")  # default ring buffer file
+TIMESERIES_CAPACITY = 10080  # samples kept for each segment (a week at a sample per minute)
+MAGIC = b"BMSRING1"
+HEADER = struct.Struct("<8sIII")  # magic, segments, max cells, capacity
+COUNTER = struct.Struct("<Q")  # samples ever written in a segment
+VOLTAGE_SCALE = 100  # voltages are stored as int32 hundredths of mV
+MAX_VOLTAGE = (2 ** 31 - 1) / VOLTAGE_SCALE
+TEMPERATURE_SCALE = 100  # temperatures are stored as int16 hundredths of C
+MAX_TEMPERATURE = (2 ** 15 - 1) / TEMPERATURE_SCALE
+INVALID_VOLTAGE = -2 ** 31  # stored instead of voltages that are not valid readings
+INVALID_TEMPERATURE = -2 ** 15  # stored instead of temperatures that are not valid readings
+
+
+class RingView(object):
+    """
+    Sequence of the samples of a ring in time order (oldest first)
+    """
+
+    def __init__(self, values, first, count):
+        """
+        :param values: memoryview
+            Physical ring
+        :param first: int
+            Physical position of oldest sample
+        :param count: int
+            Number of samples in ring
+        """
+
+        object.__init__(self)
+
+        self.values = values
+        self.first = first
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.values[(self.first + i) % len(self.values)]
+
+    def get_slice(self, start, end):
+        """
+        :param start: int
+            Logical position of first sample
+        :param end: int
+            Logical position after last sample
+        :return: []
+            Samples in range (one or two physical slices)
+        """
+
+        capacity = len(self.values)
+        start, end = self.first + start, self.first + end
+        if end <= capacity:
+            return self.values[start:end].tolist()
+        elif start >= capacity:
+            return self.values[start - capacity:end - capacity].tolist()
+        return self.values[start:].tolist() + self.values[:end - capacity].tolist()
+
+
+class CellTimeSeries(object):
+    """
+    Memory-mapped ring buffer with the last samples of every cell: for each segment a ring of times and, for each
+    cell, a ring of fixed-point voltages and temperatures. File size is fixed, oldest samples are overwritten
+    """
+
+    def __init__(self, number_of_segments, max_cells, path=TIMESERIES_FILE, capacity=TIMESERIES_CAPACITY):
+        """
+        :param number_of_segments: int
+            Number of segments in battery pack
+        :param max_cells: int
+            Max number of cells in a segment
+        :param path: str
+            Path to ring buffer file (created if needed)
+        :param capacity: int
+            Samples kept for each segment
+        """
+
+        object.__init__(self)
+
+        self.number_of_segments = number_of_segments
+        self.max_cells = max_cells
+        self.capacity = capacity
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.counters_offset = HEADER.size
+        self.segments_offset = self.counters_offset + COUNTER.size * number_of_segments
+        self.segment_size = capacity * (8 + max_cells * (4 + 2))  # times, voltages, temperatures
+        size = self.segments_offset + self.segment_size * number_of_segments
+
+        self.file = self._open(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.times, self.voltages, self.temperatures = [], [], []
+        self.view = view = memoryview(self.mm)
+        for s in range(number_of_segments):
+            offset = self.segments_offset + s * self.segment_size
+            self.times.append(view[offset:offset + 8 * capacity].cast("d"))
+            offset += 8 * capacity
+            self.voltages.append([
+                view[offset + c * 4 * capacity:offset + (c + 1) * 4 * capacity].cast("i") for c in range(max_cells)
+            ])
+            offset += 4 * capacity * max_cells
+            self.temperatures.append([
+                view[offset + c * 2 * capacity:offset + (c + 1) * 2 * capacity].cast("h") for c in range(max_cells)
+            ])
+
+    def _open(self, size):
+        """
+        :param size: int
+            Size of file
+        :return: file
+            Ring buffer file, created again if missing or with another shape
+        """
+
+        header = HEADER.pack(MAGIC, self.number_of_segments, self.max_cells, self.capacity)
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        if os.path.exists(self.path) and os.path.getsize(self.path) == size:
+            f = open(self.path, "r+b")
+            if f.read(HEADER.size) == header:
+                return f  # samples of previous runs
+            f.close()
+            print("Ring buffer " + self.path + " has another shape: creating it again")
+
+        f = open(self.path, "w+b")
+        f.truncate(size)
+        f.write(header)
+        f.flush()
+        return f
+
+    def close(self):
+        """
+        :return: void
+            Writes samples to disk and closes file
+        """
+
+        with self.lock:
+            for ring in self.times:
+                ring.release()
+            for rings in self.voltages + self.temperatures:
+                for ring in rings:
+                    ring.release()
+            self.view.release()  # mmap cannot be closed while views point to it
+            self.mm.flush()
+            self.mm.close()
+            self.file.close()
+
+    def _get_written(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: int
+            Samples ever written in segment
+        """
+
+        return COUNTER.unpack_from(self.mm, self.counters_offset + COUNTER.size * segment)[0]
+
+    def _get_times(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: RingView
+            Times of samples of segment in time order
+        """
+
+        written = self._get_written(segment)
+        count = min(written, self.capacity)
+        return RingView(self.times[segment], (written - count) % self.capacity, count)
+
+    def get_number_of_samples(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: int
+            Samples stored for segment
+        """
+
+        with self.lock:
+            return min(self._get_written(segment), self.capacity)
+
+    def get_first_time(self, segment):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :return: float
+            Seconds since epoch of oldest sample stored for segment (None if there are none)
+        """
+
+        with self.lock:
+            times = self._get_times(segment)
+            return times[0] if len(times) > 0 else None
+
+    def append(self, segment, time, voltages, temperatures=None):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param time: float
+            Seconds since epoch of sample
+        :param voltages: []
+            Voltages of cells (mV)
+        :param temperatures: []
+            Temperatures of cells (C), None if not known
+        :return: bool
+            True iff sample has been stored (samples not newer than last one are skipped)
+        """
+
+        time = float(time)
+        if math.isnan(time):
+            return False
+
+        with self.lock:
+            times = self._get_times(segment)
+            if len(times) > 0 and time <= times[len(times) - 1]:
+                return False
+
+            written = self._get_written(segment)
+            i = written % self.capacity
+            for c in range(self.max_cells):
+                voltage = utils.parse_float(voltages[c]) if c < len(voltages) else float("nan")
+                temperature = utils.parse_float(temperatures[c]) \
+                    if temperatures is not None and c < len(temperatures) else float("nan")
+                self.voltages[segment][c][i] = int(round(
+                    max(-MAX_VOLTAGE, min(MAX_VOLTAGE, voltage)) * VOLTAGE_SCALE
+                )) if math.isfinite(voltage) else INVALID_VOLTAGE
+                self.temperatures[segment][c][i] = int(round(
+                    max(-MAX_TEMPERATURE, min(MAX_TEMPERATURE, temperature)) * TEMPERATURE_SCALE
+                )) if math.isfinite(temperature) else INVALID_TEMPERATURE
+            self.times[segment][i] = time
+            COUNTER.pack_into(self.mm, self.counters_offset + COUNTER.size * segment, written + 1)  # publish sample
+            return True
+
+    def append_rows(self, segment, rows):
+        """
+        :param segment: int
+            Number of segment (starts from 0)
+        :param rows: [] of tuple int, str, []
+            Rows (row number, time, values) to store
+        :return: int
+            Number of samples stored
+        """
+
+        return sum([
+            1 for _, time, values in rows if self.append(segment, utils.parse_timestamp(time), values)
+        ])
+
+    def get_range(self, cell, segment, start_time, end_time=None):
+        """
+        :param cell: int
+            Number of cell (starts from 0)
+        :param segment: int
+            Number of segment (starts from 0)
+        :param start_time: float
+            Seconds since epoch of first sample
+        :param end_time: float
+            Seconds since epoch of last sample (None for no limit)
+        :return: tuple [], [], []
+            Times, voltages (mV) and temperatures (C, nan if not known) of samples of cell in time range (nan for
+            invalid readings)
+        """
+
+        with self.lock:
+            times = self._get_times(segment)
+            start = bisect_left(times, start_time, 0, len(times))
+            end = len(times) if end_time is None else bisect_right(times, end_time, start, len(times))
+
+            voltages = RingView(self.voltages[segment][cell], times.first, times.count)
+            temperatures = RingView(self.temperatures[segment][cell], times.first, times.count)
+            return (
+                times.get_slice(start, end),
+                [v / VOLTAGE_SCALE if v != INVALID_VOLTAGE else math.nan for v in voltages.get_slice(start, end)],
+                [
+                    t / TEMPERATURE_SCALE if t != INVALID_TEMPERATURE else math.nan
+                    for t in temperatures.get_slice(start, end)
+                ]
+            )
@@ -0,0 +1,295 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import contextvars
+import functools
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+FLUSH_SPANS = 256  # finished spans are written to file when there are at least these ones waiting
+MAX_PENDING_SPANS = 10000  # finished spans kept while waiting to be written (oldest ones are dropped)
+
+CURRENT_SPAN = contextvars.ContextVar("current_span", default=None)  # span running in this thread or task
+
+
+class Span(object):
+    """
+    Timed operation with attributes: child of the span running when it starts, root of a new trace otherwise
+    """
+
+    def __init__(self, tracer, name, parent, attributes):
+        """
+        :param tracer: Tracer
+            Tracer recording span
+        :param name: str
+            What span measures (e.g "sheets.request")
+        :param parent: Span
+            Span this one is part of (None to start a new trace)
+        :param attributes: {}
+            Details of span (e.g segment, chat)
+        """
+
+        object.__init__(self)
+
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        if parent is None:  # sampling is decided once for the whole trace
+            self.trace_id = tracer.new_id()
+            self.sampled = tracer.sample_rate > 0 and random.random() < tracer.sample_rate
+        else:
+            self.trace_id = parent.trace_id
+            self.sampled = parent.sampled
+        self.span_id = tracer.new_id() if self.sampled else 0
+        self.start_time = None  # microseconds since epoch
+        self.start = None
+        self.duration = None  # microseconds
+        self.thread_id = None
+        self.token = None
+
+    def set(self, name, value):
+        """
+        :param name: str
+            Name of attribute
+        :param value: obj
+            Value of attribute
+        :return: void
+            Sets attribute of span
+        """
+
+        self.attributes[name] = value
+
+    def __enter__(self):
+        self.token = CURRENT_SPAN.set(self)
+        if self.sampled:
+            self.thread_id = threading.get_ident()
+            self.start_time = time.time() * 1e6
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        CURRENT_SPAN.reset(self.token)
+        if self.sampled:
+            self.duration = (time.perf_counter() - self.start) * 1e6
+            if exc_type is not None:
+                self.attributes["error"] = exc_type.__name__ + ": " + str(exc_value)
+            self.tracer.record(self)
+        return False
+
+    def to_event(self, pid):
+        """
+        :param pid: int
+            Id of process
+        :return: {}
+            Span as a complete event ("ph": "X") of Chrome trace-event format
+        """
+
+        args = {name: value if isinstance(value, (int, float, str, bool)) or value is None else str(value)
+                for name, value in self.attributes.items()}
+        args["trace_id"] = self.trace_id
+        args["span_id"] = self.span_id
+        if self.parent is not None:
+            args["parent_id"] = self.parent.span_id
+        return {
+            "name": self.name,
+            "cat": self.name.split(".")[0],
+            "ph": "X",
+            "ts": round(self.start_time, 1),
+            "dur": round(self.duration, 1),
+            "pid": pid,
+            "tid": self.thread_id,
+            "args": args
+        }
+
+
+class Tracer(object):
+    """
+    Records sampled traces and writes them to a file in Chrome trace-event JSON format (open it with
+    chrome://tracing or Perfetto). File is a JSON array written incrementally, as the format allows
+    """
+
+    def __init__(self, path=None, sample_rate=0.0, flush_spans=FLUSH_SPANS):
+        """
+        :param path: str
+            Path to trace file (None to not write spans)
+        :param sample_rate: float
+            Share of traces recorded (0 to record none, 1 to record all)
+        :param flush_spans: int
+            Spans are written when there are at least these ones waiting (or when a trace ends)
+        """
+
+        object.__init__(self)
+
+        self.path = path
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.flush_spans = max(1, int(flush_spans))
+        self.ids = itertools.count(1)
+        self.pending = []  # finished spans waiting to be written
+        self.dropped = 0  # finished spans dropped because file could not keep up
+        self.written = 0  # spans written so far
+        self.file = None
+        self.lock = threading.Lock()  # guards pending spans
+        self.file_lock = threading.Lock()  # guards file
+
+    def new_id(self):
+        """
+        :return: int
+            Id of new trace or span (unique in process)
+        """
+
+        return next(self.ids)
+
+    def span(self, name, **attributes):
+        """
+        :param name: str
+            What span measures
+        :param attributes: {}
+            Details of span
+        :return: Span
+            Context manager timing span (child of the running one, if any)
+        """
+
+        return Span(self, name, CURRENT_SPAN.get(), attributes)
+
+    def record(self, span):
+        """
+        :param span: Span
+            Finished sampled span
+        :return: void
+            Queues span, writes waiting spans when its trace ends or when there are enough of them
+        """
+
+        with self.lock:
+            self.pending.append(span)
+            if len(self.pending) > MAX_PENDING_SPANS:
+                del self.pending[0]
+                self.dropped += 1
+            is_flush_needed = span.parent is None or len(self.pending) >= self.flush_spans
+        if is_flush_needed:
+            self.flush()
+
+    def flush(self):
+        """
+        :return: void
+            Writes all waiting spans to file
+        """
+
+        with self.lock:
+            spans, self.pending = self.pending, []
+        if not spans or self.path is None:
+            return
+
+        pid = os.getpid()
+        lines = "".join([json.dumps(span.to_event(pid)) + ",\n" for span in spans])
+        with self.file_lock:
+            try:
+                if self.file is None:
+                    folder = os.path.dirname(self.path)
+                    if folder and not os.path.exists(folder):
+                        os.makedirs(folder)
+                    is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                    self.file = open(self.path, "a")
+                    if is_new:
+                        self.file.write("[\n")  # closing bracket is optional in trace-event format
+                self.file.write(lines)
+                self.file.flush()
+                self.written += len(spans)
+            except OSError as e:  # tracing never breaks bot
+                self.dropped += len(spans)
+                print("Cannot write traces")
+                print(str(e))
+
+    def close(self):
+        """
+        :return: void
+            Writes waiting spans and closes file
+        """
+
+        self.flush()
+        with self.file_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+TRACER = Tracer()  # tracer of the whole bot (records nothing until configured)
+
+
+def configure(path, sample_rate):
+    """
+    :param path: str
+        Path to trace file
+    :param sample_rate: float
+        Share of traces recorded (0 to record none, 1 to record all)
+    :return: void
+        Starts recording traces of bot
+    """
+
+    TRACER.close()
+    TRACER.path = path
+    TRACER.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+
+
+def span(name, **attributes):
+    """
+    :param name: str
+        What span measures (e.g "sheets.request")
+    :param attributes: {}
+        Details of span
+    :return: Span
+        Context manager timing span with bot tracer
+    """
+
+    return TRACER.span(name, **attributes)
+
+
+def get_current_span():
+    """
+    :return: Span
+        Span running in this thread or task (None if there is none)
+    """
+
+    return CURRENT_SPAN.get()
+
+
+def wrap(function):
+    """
+    :param function: callable
+        Function to run later, possibly on another thread
+    :return: callable
+        Function whose spans are children of the span running now (threads do not inherit it otherwise)
+    """
+
+    parent = CURRENT_SPAN.get()
+    if parent is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapped(*args, **kwargs):
+        token = CURRENT_SPAN.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            CURRENT_SPAN.reset(token)
+
+    return wrapped
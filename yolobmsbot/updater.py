@@ -0,0 +1,499 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from yolobmsbot import metrics, tracing
+from yolobmsbot.batterypack import BatteryPackSnapshot
+from yolobmsbot.datasource import GSheetsDataSource
+
+MAX_CONCURRENT_FETCHES = 4  # max segments spreadsheets fetched at the same time
+UPDATE_JITTER_SECONDS = 60  # random delay (+/-) added to each background update
+NO_VALUES_RETRY_SECONDS = 60  # seconds between background updates while no segment has ever been fetched
+
+UPDATE_LATENCY = metrics.REGISTRY.histogram("update_values_seconds", "Seconds taken to fetch and publish new values")
+
+
+class BatteryPackUpdater(object):
+    """ Fetches new values of battery pack and updates """
+
+    def __init__(self, b_pack, update_interval, max_workers=MAX_CONCURRENT_FETCHES,
+                 jitter=UPDATE_JITTER_SECONDS, max_staleness=None, history=None, source=None,
+                 timeseries=None, rollups=None, warm_start=None):
+        """
+        :param b_pack: BatteryPack
+            Battery to update
+        :param update_interval: int
+            Number of minutes between two consecutive values updates
+        :param max_workers: int
+            Max number of segments fetched concurrently
+        :param jitter: float
+            Max seconds randomly added to or removed from each background update interval
+        :param max_staleness: float
+            Minutes after which values are considered stale (None for twice the update interval)
+        :param history: HistoryStore
+            Store where to append new rows (None to only fetch last values)
+        :param source: BmsDataSource
+            Where to fetch values from (None to use Google Sheets)
+        :param timeseries: CellTimeSeries
+            Ring buffer where to store samples of cells (None to not store them)
+        :param rollups: RollupEngine
+            Rollups to update with samples of cells (None to not compute them)
+        :param warm_start: WarmStartStore
+            Where to save each new snapshot, to reply with it right after a restart (None to not save them)
+        """
+
+        object.__init__(self)
+
+        self.snapshot = BatteryPackSnapshot(b_pack, datetime.fromtimestamp(0))  # first january 1970
+        self.update_interval = update_interval
+        self.max_workers = max(1, int(max_workers))
+        self.jitter = abs(jitter)
+        self.max_staleness = max_staleness if max_staleness is not None else 2 * update_interval
+        self.history = history
+        self.source = source if source is not None else GSheetsDataSource()
+        self.timeseries = timeseries
+        self.rollups = rollups
+        self.warm_start = warm_start
+        self.listeners = []  # called with each new snapshot
+        self.lock = threading.Lock()  # guards snapshot publishing and update in flight
+        self.update_in_flight = None  # future done when running update is done
+        self.executor = None  # fetches segments, kept across updates (created when first needed)
+        self.executor_lock = threading.Lock()
+
+        self.thread = None  # background updater
+        self.wake_event = threading.Event()  # set to update before timer timeout
+        self.stop_event = threading.Event()
+
+    @property
+    def battery_pack(self):
+        """
+        :return: BatteryPack
+            Latest values of battery (never modified, a new one is created by each update)
+        """
+
+        return self.snapshot.pack
+
+    @property
+    def last_update(self):
+        """
+        :return: datetime
+            Time of last completed update
+        """
+
+        return self.snapshot.time
+
+    @property
+    def last_errors(self):
+        """
+        :return: {}
+            Segment -> exception raised in last update
+        """
+
+        return self.snapshot.errors
+
+    def get_snapshot(self):
+        """
+        :return: BatteryPackSnapshot
+            Latest values of battery: read them all from here to get a consistent view
+        """
+
+        return self.snapshot
+
+    def _is_update_needed(self):
+        """
+        :return: bool
+            True if need to update cells values because timer timeout
+        """
+
+        time_now = datetime.now()
+        minutes_since_last_update = time_now - self.last_update
+        minutes_since_last_update = minutes_since_last_update.total_seconds() / 60.0
+        return minutes_since_last_update >= self.update_interval
+
+    def _fetch_segment(self, segment):
+        """
+        :param segment: int
+            Segment to fetch (starts from 0)
+        :return: []
+            Last voltages of cells in segment
+        """
+
+        with tracing.span("source.fetch_segment", segment=segment):
+            return self._fetch_segment_values(segment)
+
+    def _fetch_segment_values(self, segment):
+        """
+        :param segment: int
+            Segment to fetch (starts from 0)
+        :return: []
+            Last voltages of cells in segment
+        """
+
+        if self.history is not None:  # fetch only rows not yet in history
+            new_rows = self.source.get_rows_since(segment, self.history.get_cursor(segment))
+            self.history.append(segment, new_rows)
+            if self.timeseries is not None:
+                self.timeseries.append_rows(segment, new_rows)
+            if self.rollups is not None:
+                self.rollups.add_rows(segment, new_rows)
+            last = self.history.get_last(segment)
+            if last is None:
+                raise ValueError("No values in segment " + str(segment))
+            values = last[2]
+        else:
+            values, update_time = self.source.get_last_values(segment)  # get last values
+            if self.timeseries is not None:
+                self.timeseries.append_rows(segment, [(None, update_time, values)])
+            if self.rollups is not None:
+                self.rollups.add_rows(segment, [(None, update_time, values)])
+
+        number_of_cells = len(self.battery_pack.segments[segment].cells)
+        if len(values) < number_of_cells:
+            raise ValueError(
+                "Expected " + str(number_of_cells) + " values in segment " + str(segment) + ", got " + str(len(values))
+            )
+        return values
+
+    def _get_executor(self):
+        """
+        :return: ThreadPoolExecutor
+            Executor fetching segments (its threads are reused by all updates until stop)
+        """
+
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="SegmentFetcher")
+            return self.executor
+
+    def _fetch_segments(self):
+        """
+        :return: tuple {}, {}
+            Values of segments fetched successfully and errors of the failed ones (both keyed by segment)
+        """
+
+        new_values, errors = {}, {}
+        executor = self._get_executor()
+        futures = {
+            executor.submit(tracing.wrap(self._fetch_segment), s): s
+            for s in range(len(self.battery_pack.segments))
+        }
+        for future in as_completed(futures):
+            s = futures[future]
+            try:
+                new_values[s] = future.result()
+            except Exception as e:  # other segments go on
+                errors[s] = e
+                print("Cannot update segment " + str(s))
+                print(str(e))
+        return new_values, errors
+
+    def get_cursors(self):
+        """
+        :return: [] of int
+            Last row read of each segment (0 if unknown)
+        """
+
+        segments = range(len(self.battery_pack.segments))
+        if self.history is not None:
+            return [self.history.get_cursor(s) for s in segments]
+        return [self.source.get_cursor(s) for s in segments]
+
+    def restore(self):
+        """
+        :return: bool
+            Replies with snapshot saved before restart (until new values are fetched) and resumes reading rows
+            from where it stopped. True iff a snapshot has been restored
+        """
+
+        if self.warm_start is None:
+            return False
+
+        start = time.perf_counter()
+        saved = self.warm_start.load(self.battery_pack.number_of_cells_per_segment)
+        if saved is None:
+            return False
+
+        snapshot, cursors = saved
+        if self.history is None:  # history keeps its own cursors
+            for s, row in enumerate(cursors):
+                self.source.set_cursor(s, row)
+        with self.lock:
+            self.snapshot = snapshot
+        print(
+            "Restored values as of " + snapshot.time.strftime("%Y-%m-%d %H:%M:%S") + " in " +
+            "{0:.1f}".format((time.perf_counter() - start) * 1000.0) + " ms"
+        )
+        return True
+
+    def has_values(self):
+        """
+        :return: bool
+            True iff at least an update has been completed
+        """
+
+        return self.last_update > datetime.fromtimestamp(0)
+
+    def get_age_minutes(self):
+        """
+        :return: float
+            Minutes since last completed update
+        """
+
+        return (datetime.now() - self.last_update).total_seconds() / 60.0
+
+    def is_stale(self):
+        """
+        :return: bool
+            True iff values are older than max staleness
+        """
+
+        return self.get_age_minutes() > self.max_staleness
+
+    def get_seconds_to_next_update(self):
+        """
+        :return: float
+            Seconds to wait before next background update (jitter included), shorter while there are no values
+        """
+
+        seconds = self.update_interval * 60.0 + random.uniform(-self.jitter, self.jitter)
+        if not self.has_values():
+            seconds = min(seconds, NO_VALUES_RETRY_SECONDS)  # source was down at startup: try again soon
+        return max(0.0, seconds)
+
+    def start(self):
+        """
+        :return: void
+            Starts updating values in background
+        """
+
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="BatteryPackUpdater", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        :return: void
+            Stops background updates and threads fetching segments (fetches running now are completed)
+        """
+
+        self.stop_event.set()
+        self.wake_event.set()  # do not wait timer timeout
+        with self.executor_lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def force_update(self):
+        """
+        :return: void
+            Asks background updater to update values now
+        """
+
+        self.wake_event.set()
+
+    def _run(self):
+        """
+        :return: void
+            Updates values on schedule until stopped
+        """
+
+        while not self.stop_event.is_set():
+            if self.snapshot.version == 0:
+                self.wake_event.set()  # no update tried yet: update right now
+
+            self.wake_event.wait(self.get_seconds_to_next_update())
+            self.wake_event.clear()
+            if self.stop_event.is_set():
+                break
+
+            try:
+                self.update_values(force=True)
+            except Exception as e:
+                print("Cannot update values")
+                print(str(e))
+
+    def add_listener(self, listener):
+        """
+        :param listener: callable
+            Function called with each new snapshot (on updater thread)
+        :return: void
+            Adds listener of values updates
+        """
+
+        self.listeners.append(listener)
+
+    def _begin_update(self, force):
+        """
+        :param force: bool
+            True to update even if timer has not timed out
+        :return: tuple concurrent.futures.Future, bool
+            Future done when running update is done and True iff caller has to run update (None if no update is
+            needed)
+        """
+
+        with self.lock:
+            in_flight = self.update_in_flight
+            if in_flight is not None:
+                return in_flight, False
+            if not (force or self._is_update_needed()):  # check timer timeout
+                return None
+            self.update_in_flight = Future()
+            return self.update_in_flight, True
+
+    def _end_update(self, in_flight):
+        """
+        :param in_flight: concurrent.futures.Future
+            Future of update done
+        :return: void
+            Wakes up callers waiting for update
+        """
+
+        with self.lock:
+            self.update_in_flight = None
+        in_flight.set_result(None)
+
+    def _publish(self, new_values, errors):
+        """
+        :param new_values: {}
+            Values of segments fetched successfully
+        :param errors: {}
+            Errors of segments that failed
+        :return: BatteryPackSnapshot
+            New snapshot with fetched values (segments that failed keep previous values). Time of values moves
+            on only if at least a segment has been fetched, so that values are reported stale while source is down
+        """
+
+        previous = self.snapshot
+        new_pack = previous.pack.copy()
+        for s in sorted(new_values.keys()):
+            new_pack.segments[s].update_values(None, new_values[s])  # update all cells of segment at once
+        changed_cells = new_pack.get_changed_cells(previous.pack, sorted(new_values.keys()))
+        segment_versions = list(previous.segment_versions)
+        for s in set([s for s, _ in changed_cells]):
+            segment_versions[s] += 1
+        if not changed_cells:
+            new_pack = previous.pack  # same values: share pack (and what has been computed from it)
+
+        snapshot = BatteryPackSnapshot(
+            new_pack, datetime.now() if new_values else previous.time, previous.version + 1, errors, segment_versions,
+            changed_cells,
+            previous.restored and not new_values  # still values saved before restart if nothing has been fetched
+        )
+        if not changed_cells:
+            snapshot.inherit_cache(previous)
+        with self.lock:  # publish all fetched segments in one step
+            self.snapshot = snapshot
+        print(
+            "Done updating values (" + str(len(snapshot.changed_segments)) + " segments changed, " +
+            str(len(changed_cells)) + " cells changed, " + str(len(errors)) + " segments failed)"
+        )
+
+        if self.warm_start is not None and new_values:
+            try:
+                self.warm_start.save(snapshot, self.get_cursors())
+            except Exception as e:  # values are published anyway
+                print("Cannot save values")
+                print(str(e))
+
+        for listener in list(self.listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:  # other listeners go on
+                print("Cannot notify new values")
+                print(str(e))
+        return snapshot
+
+    def update_values(self, force=False):
+        """
+        :param force: bool
+            True to update even if timer has not timed out
+        :return: BatteryPackSnapshot
+            Updates all values in battery pack. If an update is already running, waits for it and
+            returns its result instead of starting a new one
+        """
+
+        state = self._begin_update(force)
+        if state is None:
+            return self.snapshot
+
+        in_flight, is_leader = state
+        if not is_leader:
+            in_flight.result()  # share result of running update
+            return self.snapshot
+
+        try:
+            print("Updating values")
+            with UPDATE_LATENCY.time(), tracing.span("refresh", force=force) as span:
+                new_values, errors = self._fetch_segments()
+                snapshot = self._publish(new_values, errors)
+                span.set("changed_segments", len(snapshot.changed_segments))
+                span.set("failed_segments", len(errors))
+                return snapshot
+        finally:
+            self._end_update(in_flight)
+
+    async def update_values_async(self, runner, force=False):
+        """
+        :param runner: AsyncRunner
+            Runner whose executor fetches segments
+        :param force: bool
+            True to update even if timer has not timed out
+        :return: BatteryPackSnapshot
+            Same as update_values, without blocking event loop of runner
+        """
+
+        state = self._begin_update(force)
+        if state is None:
+            return self.snapshot
+
+        in_flight, is_leader = state
+        if not is_leader:
+            await asyncio.wrap_future(in_flight)  # share result of running update, no executor thread is held
+            return self.snapshot
+
+        try:
+            print("Updating values")
+            start = time.perf_counter()
+            with tracing.span("refresh", force=force) as span:
+                new_values, errors = {}, {}
+                results = await runner.map_blocking(
+                    self._fetch_segment, range(len(self.battery_pack.segments)), self.max_workers
+                )
+                for s, (values, error) in enumerate(results):
+                    if error is None:
+                        new_values[s] = values
+                    else:  # other segments go on
+                        errors[s] = error
+                        print("Cannot update segment " + str(s))
+                        print(str(error))
+                snapshot = self._publish(new_values, errors)
+                span.set("changed_segments", len(snapshot.changed_segments))
+                span.set("failed_segments", len(errors))
+            UPDATE_LATENCY.observe(time.perf_counter() - start)
+            return snapshot
+        finally:
+            self._end_update(in_flight)
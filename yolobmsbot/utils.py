@@ -16,8 +16,18 @@
 # limitations under the License.
 
 
+import math
 from datetime import datetime
 
+TIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H.%M.%S"
+]  # formats of time in spreadsheets
+WINDOW_UNITS = [("d", 86400), ("h", 3600), ("m", 60), ("s", 1)]  # units of time windows (e.g "2h")
+
 
 def get_time_now():
     """
@@ -29,3 +39,75 @@ def get_time_now():
     out = str(time_now.year) + "-" + str(time_now.month) + "-" + str(time_now.day)  # add date
     out += " " + str(time_now.hour) + ":" + str(time_now.minute) + ":" + str(time_now.second)  # add hour
     return out
+
+
+def parse_float(value):
+    """
+    :param value: str
+        Value to parse
+    :return: float
+        Value as float (nan if it is blank, cannot be parsed or is not finite: such readings are invalid and skipped
+        by totals, averages, checks and rollups)
+    """
+
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value if math.isfinite(value) else math.nan
+
+
+def parse_timestamp(value):
+    """
+    :param value: str
+        Time to parse (seconds since epoch or date like "yyyy-mm-dd hh:mm:ss")
+    :return: float
+        Seconds since epoch (nan if it cannot be parsed)
+    """
+
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).timestamp()
+        except ValueError:
+            pass
+    return float("nan")
+
+
+def parse_window(value):
+    """
+    :param value: str
+        Time window (e.g "90s", "30m", "1h", "2d", plain numbers are minutes)
+    :return: float
+        Seconds in window (ValueError if it is not a positive finite number)
+    """
+
+    value = str(value).strip().lower()
+    for unit, seconds in WINDOW_UNITS:
+        if value.endswith(unit):
+            window = float(value[:-len(unit)]) * seconds
+            break
+    else:
+        window = float(value) * 60
+    if not math.isfinite(window) or window <= 0:
+        raise ValueError("Window must be a positive number: " + value)
+    return window
+
+
+def format_window(seconds):
+    """
+    :param seconds: float
+        Seconds in time window
+    :return: str
+        Time window in largest unit that fits (e.g "2h")
+    """
+
+    for unit, unit_seconds in WINDOW_UNITS:
+        if seconds >= unit_seconds and seconds % unit_seconds == 0:
+            return str(int(seconds // unit_seconds)) + unit
+    return str(int(seconds)) + "s"
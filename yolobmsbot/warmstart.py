@@ -0,0 +1,156 @@
+# !/usr/bin/python
+# coding: utf_8
+
+# Copyright 2016-2017 RaceUP ED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import struct
+import sys
+import threading
+from array import array
+from datetime import datetime
+
+from yolobmsbot.batterypack import BatteryPack, BatteryPackSnapshot
+from yolobmsbot.history import HISTORY_FOLDER
+
+WARM_START_FILE = os.path.join(HISTORY_FOLDER, "snapshot.bin")  # default snapshot file
+MAGIC = b"BMSSNAP1"
+HEADER = struct.Struct("<8sdQII")  # magic, time (seconds since epoch), version, segments, max cells
+
+
+class WarmStartStore(object):
+    """
+    Latest snapshot of battery pack saved in a compact binary file (header, cells per segment, segments versions,
+    rows cursors, then voltages and temperatures as little endian doubles), loaded at startup so that bot replies
+    before first values update completes
+    """
+
+    def __init__(self, path=WARM_START_FILE):
+        """
+        :param path: str
+            Path to snapshot file (created when first snapshot is saved)
+        """
+
+        object.__init__(self)
+
+        self.path = path
+        self.lock = threading.Lock()  # guards file
+
+    @staticmethod
+    def _to_bytes(values):
+        """
+        :param values: array
+            Values
+        :return: bytes
+            Values in little endian order
+        """
+
+        if sys.byteorder != "little":
+            values = array(values.typecode, values)
+            values.byteswap()
+        return values.tobytes()
+
+    @staticmethod
+    def _from_bytes(typecode, data):
+        """
+        :param typecode: str
+            Type of values
+        :param data: bytes
+            Values in little endian order
+        :return: array
+            Values
+        """
+
+        values = array(typecode)
+        values.frombytes(data)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def save(self, snapshot, cursors):
+        """
+        :param snapshot: BatteryPackSnapshot
+            Values to save
+        :param cursors: [] of int
+            Last row read of each segment (0 if unknown)
+        :return: void
+            Replaces saved snapshot (atomically, a partial file is never loaded)
+        """
+
+        pack = snapshot.pack
+        segments = len(pack.number_of_cells_per_segment)
+        data = b"".join([
+            HEADER.pack(MAGIC, snapshot.time.timestamp(), snapshot.version, segments, pack.max_cells),
+            struct.pack("<" + str(segments) + "I", *pack.number_of_cells_per_segment),
+            struct.pack("<" + str(segments) + "Q", *snapshot.segment_versions),
+            struct.pack("<" + str(segments) + "Q", *[max(0, int(c)) for c in cursors]),
+            self._to_bytes(pack.voltages),
+            self._to_bytes(pack.temperatures)
+        ])
+
+        with self.lock:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as out:
+                out.write(data)
+            os.replace(temp_path, self.path)
+
+    def load(self, number_of_cells_per_segment):
+        """
+        :param number_of_cells_per_segment: [] of int
+            Number of cells of each segment of battery pack
+        :return: tuple BatteryPackSnapshot, [] of int
+            Saved snapshot (marked as restored) and last row read of each segment, None if there is no snapshot or
+            it has been saved for another battery pack
+        """
+
+        with self.lock:
+            try:
+                with open(self.path, "rb") as inp:
+                    data = inp.read()
+            except OSError:
+                return None
+
+        if len(data) < HEADER.size:
+            return None
+        magic, time, version, segments, max_cells = HEADER.unpack_from(data, 0)
+        offset = HEADER.size
+        if magic != MAGIC or len(data) < offset + 4 * segments:
+            return None
+
+        cells = list(struct.unpack_from("<" + str(segments) + "I", data, offset))
+        offset += 4 * segments
+        pack = BatteryPack(number_of_cells_per_segment)
+        size = 8 * segments * max_cells
+        if cells != pack.number_of_cells_per_segment or max_cells != pack.max_cells or \
+                len(data) != offset + 16 * segments + 2 * size:
+            print("Saved snapshot " + self.path + " is of another battery pack: ignoring it")
+            return None
+
+        segment_versions = list(struct.unpack_from("<" + str(segments) + "Q", data, offset))
+        offset += 8 * segments
+        cursors = list(struct.unpack_from("<" + str(segments) + "Q", data, offset))
+        offset += 8 * segments
+        pack.voltages[:] = self._from_bytes("d", data[offset:offset + size])  # in place: segments are views
+        offset += size
+        pack.temperatures[:] = self._from_bytes("d", data[offset:offset + size])
+
+        snapshot = BatteryPackSnapshot(
+            pack, datetime.fromtimestamp(time), version, segment_versions=segment_versions, restored=True
+        )
+        return snapshot, cursors